@@ -5,6 +5,13 @@ __all__ = ["barrele",
            "barrele_agent",
            "barrele_collectd",
            "barrele_constant",
+           "barrele_dashboard",
+           "barrele_definition",
+           "barrele_estimate",
+           "barrele_grafana",
            "barrele_influxdb",
            "barrele_instance",
-           "barrele_server"]
+           "barrele_measurement",
+           "barrele_relay",
+           "barrele_server",
+           "barrele_top"]
@@ -6,32 +6,19 @@ from pycoral import parallel
 from pycoral import cmd_general
 from pycoral import version
 from pycoral import clog
+from pycoral import host_range
 from pycoral import constant
 from pycoral import lustre_version
-from pybarrele import barrele_instance
 from pybarrele import barrele_constant
 from pybarrele import barrele_collectd
-
-
-def init_env(config_fpath, logdir, log_to_file, iso):
-    """
-    Init log and instance for commands that needs it
-    """
-    log_dir_is_default = (logdir == barrele_constant.BARRELE_LOG_DIR)
-    log, workspace, barrele_config = cmd_general.init_env(config_fpath,
-                                                          logdir,
-                                                          log_to_file,
-                                                          log_dir_is_default)
-    barreleye_instance = barrele_instance.barrele_init_instance(log, workspace,
-                                                                barrele_config,
-                                                                config_fpath,
-                                                                log_to_file,
-                                                                log_dir_is_default,
-                                                                iso)
-    if barreleye_instance is None:
-        log.cl_error("failed to init Barreleye instance")
-        cmd_general.cmd_exit(log, 1)
-    return log, barreleye_instance
+from pybarrele import barrele_cmd_common
+from pybarrele import barrele_cmd_relay
+from pybarrele import barrele_cmd_log
+from pybarrele import barrele_cmd_measurement
+from pybarrele import barrele_cmd_top
+# barrele_instance and barrele_dashboard import requests, slugify and the
+# other heavy modules. They are imported by the commands that need them so
+# that the simple commands, e.g. "barrele version", start fast.
 
 
 class BarreleClusterCommand():
@@ -58,10 +45,11 @@ class BarreleClusterCommand():
         will remove all existing data in "barreleye_database" in Influxdb,
         but will not touch other databases if any.
         """
-        log, barreleye_instance = init_env(self._bcc_config_fpath,
-                                           self._bcc_logdir,
-                                           self._bcc_log_to_file,
-                                           self._bcc_iso)
+        log, barreleye_instance = barrele_cmd_common.init_env(
+            self._bcc_config_fpath,
+            self._bcc_logdir,
+            self._bcc_log_to_file,
+            self._bcc_iso)
         cmd_general.check_argument_bool(log, "erase_influxdb", erase_influxdb)
         cmd_general.check_argument_bool(log, "drop_database", drop_database)
         rc = barreleye_instance.bei_cluster_install(log,
@@ -227,7 +215,8 @@ class BarreleAgentStatusCache():
         """
         # pylint: disable=no-self-use
         for field in field_names:
-            if field == barrele_constant.BARRELE_FIELD_HOST:
+            if field in [barrele_constant.BARRELE_FIELD_HOST,
+                         barrele_constant.BARRELE_FIELD_SERVER]:
                 continue
             if field == barrele_constant.BARRELE_FIELD_UP:
                 self.basc_is_up(log)
@@ -250,6 +239,8 @@ class BarreleAgentStatusCache():
         ret = 0
         if field_name == barrele_constant.BARRELE_FIELD_HOST:
             result = hostname
+        elif field_name == barrele_constant.BARRELE_FIELD_SERVER:
+            result = agent.bea_barreleye_server.bes_server_host.sh_hostname
         elif field_name == barrele_constant.BARRELE_FIELD_UP:
             if self._basc_is_up is None:
                 log.cl_error("up status of host [%s] is not inited",
@@ -300,6 +291,8 @@ class BarreleAgentStatusCache():
         # pylint: disable=no-self-use
         fields = field_names[:]
         fields.remove(barrele_constant.BARRELE_FIELD_HOST)
+        if barrele_constant.BARRELE_FIELD_SERVER in fields:
+            fields.remove(barrele_constant.BARRELE_FIELD_SERVER)
         if len(fields) == 0:
             return True
         return False
@@ -332,7 +325,8 @@ def print_agents(log, barreleye_instance, agents, status=False,
                      "agents")
         return -1
 
-    quick_fields = [barrele_constant.BARRELE_FIELD_HOST]
+    quick_fields = [barrele_constant.BARRELE_FIELD_HOST,
+                    barrele_constant.BARRELE_FIELD_SERVER]
     slow_fields = [barrele_constant.BARRELE_FIELD_UP,
                    barrele_constant.BARRELE_FIELD_COLLECTD,
                    barrele_constant.BARRELE_FIELD_COLLECTD_VERSION]
@@ -680,6 +674,138 @@ def print_servers(log, barreleye_instance, servers, status=False,
     return rc
 
 
+def lint_issue_field(log, lint_issue, field_name):
+    """
+    Return (0, result) for a field of (DashboardQueryLint, issue, detail)
+    """
+    lint, issue, detail = lint_issue
+    ret = 0
+    if field_name == barrele_constant.BARRELE_FIELD_DASHBOARD:
+        result = lint.dql_dashboard_name
+    elif field_name == barrele_constant.BARRELE_FIELD_PANEL:
+        result = lint.dql_panel_title
+    elif field_name == barrele_constant.BARRELE_FIELD_ISSUE:
+        result = issue
+    elif field_name == barrele_constant.BARRELE_FIELD_DETAIL:
+        result = detail
+    else:
+        log.cl_error("unknown field [%s] of lint issue", field_name)
+        result = clog.ERROR_MSG
+        ret = -1
+    return ret, result
+
+
+def lint_cost_field(log, rank_lint, field_name):
+    """
+    Return (0, result) for a field of (rank, DashboardQueryLint)
+    """
+    rank, lint = rank_lint
+    ret = 0
+    if field_name == barrele_constant.BARRELE_FIELD_RANK:
+        result = rank
+    elif field_name == barrele_constant.BARRELE_FIELD_COST:
+        result = "%.6fs" % lint.dql_cost
+    elif field_name == barrele_constant.BARRELE_FIELD_DASHBOARD:
+        result = lint.dql_dashboard_name
+    elif field_name == barrele_constant.BARRELE_FIELD_PANEL:
+        result = lint.dql_panel_title
+    elif field_name == barrele_constant.BARRELE_FIELD_ISSUE:
+        result = ",".join([issue for issue, _ in lint.dql_issues])
+    else:
+        log.cl_error("unknown field [%s] of lint cost", field_name)
+        result = clog.ERROR_MSG
+        ret = -1
+    return ret, result
+
+
+def print_dashboard_lints(log, lints, explain=False):
+    """
+    Print the issues of the dashboard queries. If explain, print the
+    queries ranked by cost too.
+    """
+    lint_issues = []
+    for lint in lints:
+        for issue, detail in lint.dql_issues:
+            lint_issues.append((lint, issue, detail))
+    if len(lint_issues) > 0:
+        quick_fields = [barrele_constant.BARRELE_FIELD_DASHBOARD,
+                        barrele_constant.BARRELE_FIELD_PANEL,
+                        barrele_constant.BARRELE_FIELD_ISSUE,
+                        barrele_constant.BARRELE_FIELD_DETAIL]
+        rc = cmd_general.print_list(log, lint_issues, quick_fields, [], [],
+                                    lint_issue_field)
+        if rc:
+            return rc
+    log.cl_info("found [%d] issues in [%d] queries of Grafana dashboards",
+                len(lint_issues), len(lints))
+    if not explain:
+        return 0
+
+    explained = [lint for lint in lints if lint.dql_cost is not None]
+    explained.sort(key=lambda lint: lint.dql_cost, reverse=True)
+    rank_lints = []
+    for index, lint in enumerate(explained):
+        rank_lints.append((index + 1, lint))
+    if len(rank_lints) == 0:
+        return 0
+    quick_fields = [barrele_constant.BARRELE_FIELD_RANK,
+                    barrele_constant.BARRELE_FIELD_COST,
+                    barrele_constant.BARRELE_FIELD_DASHBOARD,
+                    barrele_constant.BARRELE_FIELD_PANEL,
+                    barrele_constant.BARRELE_FIELD_ISSUE]
+    return cmd_general.print_list(log, rank_lints, quick_fields, [], [],
+                                  lint_cost_field)
+
+
+class BarreleDashboardsCommand():
+    """
+    Commands to check the Grafana dashboards of Barreleye.
+    """
+    # pylint: disable=too-few-public-methods
+    def _init(self, config, logdir, log_to_file, iso):
+        # pylint: disable=attribute-defined-outside-init
+        self._bdc_config_fpath = config
+        self._bdc_logdir = logdir
+        self._bdc_log_to_file = log_to_file
+        self._bdc_iso = iso
+
+    def lint(self, explain=False, time_range="1h"):
+        """
+        Check the queries of Grafana dashboards for costly patterns.
+
+        The issues include unbounded GROUP BY on high cardinality tags,
+        missing time filter, reading raw measurement when continuous query
+        measurement exists and wildcard in SELECT.
+        :param explain: Whether to run the queries with EXPLAIN ANALYZE on
+        the Barreleye server and rank the panels by the actual cost,
+        default: False.
+        :param time_range: The time range of the queries to explain,
+        default: 1h.
+        """
+        # pylint: disable=import-outside-toplevel
+        from pybarrele import barrele_dashboard
+        log, barreleye_instance = barrele_cmd_common.init_env(
+            self._bdc_config_fpath,
+            self._bdc_logdir,
+            self._bdc_log_to_file,
+            self._bdc_iso)
+        cmd_general.check_argument_bool(log, "explain", explain)
+        time_range = cmd_general.check_argument_str(log, "time_range",
+                                                    time_range)
+        if barrele_dashboard.duration_seconds(time_range) is None:
+            log.cl_error("invalid time range [%s], e.g. 1h", time_range)
+            cmd_general.cmd_exit(log, -1)
+        server = barreleye_instance.bei_barreleye_server
+        lints = server.bes_grafana_lint_dashboards(log, barreleye_instance,
+                                                   explain=explain,
+                                                   time_range=time_range)
+        if lints is None:
+            log.cl_error("failed to lint Grafana dashboards")
+            cmd_general.cmd_exit(log, -1)
+        ret = print_dashboard_lints(log, lints, explain=explain)
+        cmd_general.cmd_exit(log, ret)
+
+
 class BarreleServerCommand():
     """
     Commands to manage a Barreleye server.
@@ -694,28 +820,29 @@ class BarreleServerCommand():
 
     def status(self):
         """
-        Print the status of the Barreleye server.
+        Print the status of the Barreleye server(s).
         """
-        log, barreleye_instance = init_env(self._bsc_config_fpath,
-                                           self._bsc_logdir,
-                                           self._bsc_log_to_file,
-                                           self._bsc_iso)
-        server = barreleye_instance.bei_barreleye_server
-        servers = [server]
+        log, barreleye_instance = barrele_cmd_common.init_env(
+            self._bsc_config_fpath,
+            self._bsc_logdir,
+            self._bsc_log_to_file,
+            self._bsc_iso)
+        servers = barreleye_instance.bei_barreleye_servers
         ret = print_servers(log, barreleye_instance, servers, status=True,
-                            print_table=False)
+                            print_table=(len(servers) > 1))
         cmd_general.cmd_exit(log, ret)
 
     def host(self):
         """
-        Print the hostname of the Barreleye server.
+        Print the hostname of the Barreleye server(s).
         """
-        log, barreleye_instance = init_env(self._bsc_config_fpath,
-                                           self._bsc_logdir,
-                                           self._bsc_log_to_file,
-                                           self._bsc_iso)
-        server = barreleye_instance.bei_barreleye_server
-        log.cl_stdout(server.bes_server_host.sh_hostname)
+        log, barreleye_instance = barrele_cmd_common.init_env(
+            self._bsc_config_fpath,
+            self._bsc_logdir,
+            self._bsc_log_to_file,
+            self._bsc_iso)
+        for server in barreleye_instance.bei_barreleye_servers:
+            log.cl_stdout(server.bes_server_host.sh_hostname)
         cmd_general.cmd_exit(log, 0)
 
 
@@ -736,10 +863,11 @@ class BarreleAgentCommand():
         List all Barreleye agents.
         :param status: print the status of agents, default: False.
         """
-        log, barreleye_instance = init_env(self._bac_config_fpath,
-                                           self._bac_logdir,
-                                           self._bac_log_to_file,
-                                           self._bac_iso)
+        log, barreleye_instance = barrele_cmd_common.init_env(
+            self._bac_config_fpath,
+            self._bac_logdir,
+            self._bac_log_to_file,
+            self._bac_iso)
         cmd_general.check_argument_bool(log, "status", status)
         agents = list(barreleye_instance.bei_agent_dict.values())
         ret = print_agents(log, barreleye_instance, agents, status=status)
@@ -750,10 +878,11 @@ class BarreleAgentCommand():
         Print the status of a agent host.
         :param host: the name of the agent host.
         """
-        log, barreleye_instance = init_env(self._bac_config_fpath,
-                                           self._bac_logdir,
-                                           self._bac_log_to_file,
-                                           self._bac_iso)
+        log, barreleye_instance = barrele_cmd_common.init_env(
+            self._bac_config_fpath,
+            self._bac_logdir,
+            self._bac_log_to_file,
+            self._bac_iso)
         host = cmd_general.check_argument_str(log, "host", host)
         if host not in barreleye_instance.bei_agent_dict:
             log.cl_error("host [%s] is not configured as Barreleye agent",
@@ -768,15 +897,17 @@ class BarreleAgentCommand():
     def start(self, host):
         """
         Start Collectd service on the agent host.
-        :param host: the name of the agent host. Could be a list.
-        """
-        log, barreleye_instance = init_env(self._bac_config_fpath,
-                                           self._bac_logdir,
-                                           self._bac_log_to_file,
-                                           self._bac_iso)
+        :param host: the name of the agent host. Could be a host list,
+        e.g. "oss[000-999],r[1-4]n[01-32,40]".
+        """
+        log, barreleye_instance = barrele_cmd_common.init_env(
+            self._bac_config_fpath,
+            self._bac_logdir,
+            self._bac_log_to_file,
+            self._bac_iso)
         host = cmd_general.check_argument_str(log, "host", host)
 
-        hostnames = cmd_general.parse_list_string(log, host)
+        hostnames = host_range.parse_host_range_set(log, host)
         if hostnames is None:
             log.cl_error("host list [%s] is invalid",
                          host)
@@ -787,15 +918,17 @@ class BarreleAgentCommand():
     def stop(self, host):
         """
         Stop Collectd service on the agent host.
-        :param host: the name of the agent host. Could be a list.
-        """
-        log, barreleye_instance = init_env(self._bac_config_fpath,
-                                           self._bac_logdir,
-                                           self._bac_log_to_file,
-                                           self._bac_iso)
+        :param host: the name of the agent host. Could be a host list,
+        e.g. "oss[000-999],r[1-4]n[01-32,40]".
+        """
+        log, barreleye_instance = barrele_cmd_common.init_env(
+            self._bac_config_fpath,
+            self._bac_logdir,
+            self._bac_log_to_file,
+            self._bac_iso)
         host = cmd_general.check_argument_str(log, "host", host)
 
-        hostnames = cmd_general.parse_list_string(log, host)
+        hostnames = host_range.parse_host_range_set(log, host)
         if hostnames is None:
             log.cl_error("host list [%s] is invalid",
                          host)
@@ -818,7 +951,13 @@ class BarreleCommand():
     version = barrele_version
     agent = BarreleAgentCommand()
     server = BarreleServerCommand()
+    dashboards = BarreleDashboardsCommand()
+    relay = barrele_cmd_relay.BarreleRelayCommand()
+    log = barrele_cmd_log.BarreleLogCommand()
     lustre_versions = barrele_lustre_versions
+    measurements = barrele_cmd_measurement.barrele_measurements
+    estimate = barrele_cmd_measurement.barrele_estimate
+    top = barrele_cmd_top.barrele_top
 
     def __init__(self, config=barrele_constant.BARRELE_CONFIG,
                  log=barrele_constant.BARRELE_LOG_DIR,
@@ -834,6 +973,9 @@ class BarreleCommand():
         self.cluster._init(config, log, debug, iso)
         self.agent._init(config, log, debug, iso)
         self.server._init(config, log, debug, iso)
+        self.dashboards._init(config, log, debug, iso)
+        self.relay._init(config, log, debug, iso)
+        self.log._init(config, log, debug, iso)
 
 
 def main():
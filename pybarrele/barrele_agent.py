@@ -18,9 +18,12 @@ class BarreleAgent():
     def __init__(self, host, barreleye_server,
                  enable_disk=False, enable_lustre_oss=True,
                  enable_lustre_mds=True, enable_lustre_client=False,
-                 enable_infiniband=False):
+                 enable_infiniband=False, relay=None):
         # Barreleye server with thye of BarreleServer
         self.bea_barreleye_server = barreleye_server
+        # The relay to send data points through, None if sending to the
+        # server directly. Type: BarreleRelay
+        self.bea_relay = relay
         # Host to run commands.
         self.bea_host = host
         # Whether to collect disk metrics from this agent.
@@ -49,8 +52,11 @@ class BarreleAgent():
     def _bea_check_connection_with_server(self, log):
         # The client might has problem to access Barreyele server, find the
         # problem as early as possible.
-        barreleye_server = self.bea_barreleye_server
-        command = ("ping -c 1 %s" % barreleye_server.bes_server_host.sh_hostname)
+        if self.bea_relay is not None:
+            hostname = self.bea_relay.bre_host.sh_hostname
+        else:
+            hostname = self.bea_barreleye_server.bes_server_host.sh_hostname
+        command = ("ping -c 1 %s" % hostname)
         retval = self.bea_host.sh_run(log, command)
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s], "
@@ -120,26 +126,20 @@ class BarreleAgent():
 
         # Old Lustre kernel RPM might not be uninstalled ye, so ignore
         # kernel RPMs.
-        command = ("rpm -qa | grep lustre | grep -v kernel")
-        retval = self.bea_host.sh_run(log, command)
-        if (retval.cr_exit_status == 1 and retval.cr_stdout == "" and
-                retval.cr_stderr == ""):
+        rpm_names = self.bea_host.sh_rpm_grep(log, "lustre")
+        if rpm_names is None:
+            log.cl_error("failed to get the installed RPMs on host [%s]",
+                         self.bea_host.sh_hostname)
+            return -1
+        rpm_names = [rpm_name for rpm_name in rpm_names
+                     if "kernel" not in rpm_name]
+        if len(rpm_names) == 0:
             log.cl_info("Lustre RPM is not installed on host [%s], "
                         "using default [%s]",
                         self.bea_host.sh_hostname,
                         lustre_fallback_version.lv_name)
             self.bea_lustre_version = lustre_fallback_version
             return 0
-        if retval.cr_exit_status:
-            log.cl_error("failed to run command [%s] on host [%s], "
-                         "ret = [%d], stdout = [%s], stderr = [%s]",
-                         command,
-                         self.bea_host.sh_hostname,
-                         retval.cr_exit_status,
-                         retval.cr_stdout,
-                         retval.cr_stderr)
-            return -1
-        rpm_names = retval.cr_stdout.split()
         rpm_fnames = []
         for rpm_name in rpm_names:
             rpm_fnames.append(rpm_name + ".rpm")
@@ -166,13 +166,28 @@ class BarreleAgent():
         """
         Generate Collectd config
         """
+        # The test config collects everything at the test interval so that
+        # the checks do not need to wait for the slow plugins.
         if collectd_test:
             interval = barrele_collectd.COLLECTD_INTERVAL_TEST
+            plugin_intervals = None
+            item_intervals = None
         else:
             interval = barreleye_instance.bei_collect_interval
+            plugin_intervals = barreleye_instance.bei_plugin_intervals
+            item_intervals = barreleye_instance.bei_item_intervals
+        multiplier = barreleye_instance.bei_slow_interval_multiplier
         collectd_config = \
             barrele_collectd.CollectdConfig(self, interval,
-                                            barreleye_instance.bei_jobstat_pattern)
+                                            barreleye_instance.bei_jobstat_pattern,
+                                            plugin_intervals=plugin_intervals,
+                                            item_intervals=item_intervals,
+                                            slow_interval_multiplier=multiplier)
+        exp_client_regex = None
+        if barreleye_instance.bei_lustre_exp_sample_shards > 1:
+            exp_client_regex = \
+                barrele_collectd.exp_sample_client_regex(barreleye_instance.bei_lustre_exp_sample_shards,
+                                                         barreleye_instance.bei_lustre_exp_sample_shard)
         if (self.bea_enable_lustre_oss or self.bea_enable_lustre_mds or
                 self.bea_enable_lustre_client):
             ret = collectd_config.cdc_plugin_lustre(log,
@@ -181,7 +196,8 @@ class BarreleAgent():
                                                     enable_lustre_mds=self.bea_enable_lustre_mds,
                                                     enable_lustre_client=self.bea_enable_lustre_client,
                                                     enable_lustre_exp_ost=barreleye_instance.bei_enable_lustre_exp_ost,
-                                                    enable_lustre_exp_mdt=barreleye_instance.bei_enable_lustre_exp_mdt)
+                                                    enable_lustre_exp_mdt=barreleye_instance.bei_enable_lustre_exp_mdt,
+                                                    exp_client_regex=exp_client_regex)
             if ret:
                 log.cl_error("failed to config Lustre plugin of Collectd")
                 return None
@@ -190,6 +206,21 @@ class BarreleAgent():
             collectd_config.cdc_plugin_infiniband()
         return collectd_config
 
+    def bea_estimate_collectd_config(self, log, barreleye_instance):
+        """
+        Return the Collectd config for production without changing the
+        host, None on error. This is used to estimate the data points
+        before installing the agent.
+        """
+        ret = self._bea_check_lustre_version(log,
+                                             barreleye_instance.bei_lustre_fallback_version)
+        if ret:
+            log.cl_error("failed to check the Lustre version on Barreleye "
+                         "agent [%s]",
+                         self.bea_host.sh_hostname)
+            return None
+        return self._bea_generate_collectd_config(log, barreleye_instance)
+
     def bea_generate_configs(self, log, barreleye_instance):
         """
         Steps before configuring Barreleye agent
@@ -0,0 +1,31 @@
+"""
+Common library of Barreleye commands
+"""
+from pycoral import cmd_general
+from pybarrele import barrele_constant
+# barrele_instance imports requests, slugify and the other heavy modules.
+# It is imported by the commands that need it so that the simple commands,
+# e.g. "barrele version", start fast.
+
+
+def init_env(config_fpath, logdir, log_to_file, iso):
+    """
+    Init log and instance for commands that needs it
+    """
+    # pylint: disable=import-outside-toplevel
+    from pybarrele import barrele_instance
+    log_dir_is_default = (logdir == barrele_constant.BARRELE_LOG_DIR)
+    log, workspace, barrele_config = cmd_general.init_env(config_fpath,
+                                                          logdir,
+                                                          log_to_file,
+                                                          log_dir_is_default)
+    barreleye_instance = barrele_instance.barrele_init_instance(log, workspace,
+                                                                barrele_config,
+                                                                config_fpath,
+                                                                log_to_file,
+                                                                log_dir_is_default,
+                                                                iso)
+    if barreleye_instance is None:
+        log.cl_error("failed to init Barreleye instance")
+        cmd_general.cmd_exit(log, 1)
+    return log, barreleye_instance
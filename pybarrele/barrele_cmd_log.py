@@ -0,0 +1,198 @@
+"""
+Commands to query the event logs of Barreleye
+"""
+from pycoral import cmd_general
+from pycoral import clog
+from pycoral import event_log
+from pycoral import stage_timeline
+from pybarrele import barrele_constant
+
+
+def event_failed(event):
+    """
+    Return True if the command or stage of the event failed
+    """
+    if event.get("type") == event_log.EVENT_TYPE_COMMAND:
+        return event.get("exit_status") != 0
+    return event.get("status") == stage_timeline.STAGE_STATUS_FAILED
+
+
+def event_field(log, event, field_name):
+    """
+    Return (0, result) for a field of event
+    """
+    # pylint: disable=too-many-branches
+    ret = 0
+    if field_name == barrele_constant.BARRELE_FIELD_RANK:
+        result = event["rank"]
+    elif field_name == barrele_constant.BARRELE_FIELD_TIME:
+        result = event["offset"]
+    elif field_name == barrele_constant.BARRELE_FIELD_TYPE:
+        result = event.get("type")
+    elif field_name == barrele_constant.BARRELE_FIELD_HOST:
+        result = event.get("host")
+    elif field_name == barrele_constant.BARRELE_FIELD_STAGE:
+        result = event.get("stage")
+    elif field_name == barrele_constant.BARRELE_FIELD_DURATION:
+        result = round(event.get("duration", 0), 3)
+    elif field_name == barrele_constant.BARRELE_FIELD_STATUS:
+        if event.get("type") == event_log.EVENT_TYPE_COMMAND:
+            result = event.get("exit_status")
+        else:
+            result = event.get("status")
+        if event_failed(event):
+            result = clog.colorful_message(clog.COLOR_RED, result)
+    elif field_name == barrele_constant.BARRELE_FIELD_COMMAND:
+        result = event.get("command", "")
+    else:
+        log.cl_error("unknown field [%s] of event", field_name)
+        result = clog.ERROR_MSG
+        ret = -1
+    if result is None:
+        result = ""
+    return ret, result
+
+
+def host_summary_field(log, summary, field_name):
+    """
+    Return (0, result) for a field of the summary dict of a host
+    """
+    ret = 0
+    if field_name == barrele_constant.BARRELE_FIELD_HOST:
+        result = summary["host"]
+    elif field_name == barrele_constant.BARRELE_FIELD_COMMANDS:
+        result = summary["commands"]
+    elif field_name == barrele_constant.BARRELE_FIELD_FAILURES:
+        result = summary["failures"]
+    elif field_name == barrele_constant.BARRELE_FIELD_DURATION:
+        result = round(summary["duration"], 3)
+    elif field_name == barrele_constant.BARRELE_FIELD_BYTES:
+        result = summary["bytes"]
+    else:
+        log.cl_error("unknown field [%s] of host summary", field_name)
+        result = clog.ERROR_MSG
+        ret = -1
+    return ret, result
+
+
+class BarreleLogCommand():
+    """
+    Commands to query the event log of a run. The event log is saved
+    when a command runs with --debug.
+    """
+    def _init(self, config, logdir, log_to_file, iso):
+        # pylint: disable=attribute-defined-outside-init,unused-argument
+        self._blc_logdir = logdir
+
+    def _blc_load_events(self, run):
+        """
+        Init the log and return (log, events) of the run
+        """
+        logdir = self._blc_logdir
+        logdir_is_default = (logdir == barrele_constant.BARRELE_LOG_DIR)
+        # Do not create a new run dir which would hide the run to query
+        log, _ = cmd_general.init_env_noconfig(logdir, False,
+                                               logdir_is_default)
+        if run is not None:
+            run = cmd_general.check_argument_str(log, "run", run)
+        fpath = event_log.find_event_log(log, logdir, logdir_is_default,
+                                         run=run)
+        if fpath is None:
+            cmd_general.cmd_exit(log, -1)
+        events = event_log.load_events(log, fpath)
+        if events is None:
+            cmd_general.cmd_exit(log, -1)
+        log.cl_info("loaded [%d] events from file [%s]", len(events),
+                    fpath)
+        if len(events) > 0:
+            base_time = min(event.get("time", 0) for event in events)
+            for event in events:
+                event["offset"] = round(event.get("time", 0) - base_time, 3)
+        return log, events
+
+    def show(self, run=None, host=None, stage=None, failed=False,
+             slowest=None):
+        """
+        Print the events of a run.
+        :param run: The name of the run dir under the default log dir,
+        default: the newest run.
+        :param host: Only print the events of this host.
+        :param stage: Only print the events of this stage.
+        :param failed: Only print the failed commands and stages,
+        default: False.
+        :param slowest: Only print this number of the slowest events.
+        """
+        # pylint: disable=too-many-arguments
+        log, events = self._blc_load_events(run)
+        cmd_general.check_argument_bool(log, "failed", failed)
+        if host is not None:
+            host = cmd_general.check_argument_str(log, "host", host)
+            events = [event for event in events
+                      if event.get("host") == host]
+        if stage is not None:
+            stage = cmd_general.check_argument_str(log, "stage", stage)
+            events = [event for event in events
+                      if event.get("stage") == stage]
+        if failed:
+            events = [event for event in events if event_failed(event)]
+        if len(events) == 0:
+            log.cl_info("no event matches")
+            cmd_general.cmd_exit(log, 0)
+
+        quick_fields = [barrele_constant.BARRELE_FIELD_TIME,
+                        barrele_constant.BARRELE_FIELD_TYPE,
+                        barrele_constant.BARRELE_FIELD_HOST,
+                        barrele_constant.BARRELE_FIELD_STAGE,
+                        barrele_constant.BARRELE_FIELD_DURATION,
+                        barrele_constant.BARRELE_FIELD_STATUS,
+                        barrele_constant.BARRELE_FIELD_COMMAND]
+        if slowest is not None:
+            cmd_general.check_argument_type(log, "slowest", slowest, int)
+            events.sort(key=lambda event: event.get("duration", 0),
+                        reverse=True)
+            events = events[:slowest]
+            for index, event in enumerate(events):
+                event["rank"] = index + 1
+            quick_fields.insert(0, barrele_constant.BARRELE_FIELD_RANK)
+        ret = cmd_general.print_list(log, events, quick_fields, [], [],
+                                     event_field)
+        cmd_general.cmd_exit(log, ret)
+
+    def summary(self, run=None):
+        """
+        Print the number, failures, time and output bytes of the commands
+        on each host of a run.
+        :param run: The name of the run dir under the default log dir,
+        default: the newest run.
+        """
+        log, events = self._blc_load_events(run)
+        summary_dict = {}
+        for event in events:
+            if event.get("type") != event_log.EVENT_TYPE_COMMAND:
+                continue
+            hostname = event.get("host")
+            if hostname not in summary_dict:
+                summary_dict[hostname] = {"host": hostname,
+                                          "commands": 0,
+                                          "failures": 0,
+                                          "duration": 0,
+                                          "bytes": 0}
+            summary = summary_dict[hostname]
+            summary["commands"] += 1
+            if event_failed(event):
+                summary["failures"] += 1
+            summary["duration"] += event.get("duration", 0)
+            summary["bytes"] += (event.get("stdout_bytes", 0) +
+                                 event.get("stderr_bytes", 0))
+        if len(summary_dict) == 0:
+            log.cl_info("no command in the event log")
+            cmd_general.cmd_exit(log, 0)
+        quick_fields = [barrele_constant.BARRELE_FIELD_HOST,
+                        barrele_constant.BARRELE_FIELD_COMMANDS,
+                        barrele_constant.BARRELE_FIELD_FAILURES,
+                        barrele_constant.BARRELE_FIELD_DURATION,
+                        barrele_constant.BARRELE_FIELD_BYTES]
+        ret = cmd_general.print_list(log, list(summary_dict.values()),
+                                     quick_fields, [], [],
+                                     host_summary_field)
+        cmd_general.cmd_exit(log, ret)
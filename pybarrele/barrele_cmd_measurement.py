@@ -0,0 +1,176 @@
+"""
+Commands of the measurements that Barreleye agents send to Influxdb
+"""
+from pycoral import cmd_general
+from pycoral import clog
+from pycoral import lustre_version
+from pycoral import utils
+from pybarrele import barrele_constant
+from pybarrele import barrele_cmd_common
+
+
+def measurement_field(log, measurement, field_name):
+    """
+    Return (0, result) for a field of BarreleMeasurement
+    """
+    ret = 0
+    if field_name == barrele_constant.BARRELE_FIELD_MEASUREMENT:
+        result = measurement.bm_name
+    elif field_name == barrele_constant.BARRELE_FIELD_TAGS:
+        result = ",".join(sorted(measurement.bm_tags))
+    elif field_name == barrele_constant.BARRELE_FIELD_TYPE:
+        result = ",".join(sorted(measurement.bm_types))
+    elif field_name == barrele_constant.BARRELE_FIELD_ITEMS:
+        result = ",".join(sorted(measurement.bm_items))
+    elif field_name == barrele_constant.BARRELE_FIELD_ROLES:
+        result = ",".join([role for role in barrele_constant.BARRELE_ROLES
+                           if role in measurement.bm_roles])
+    elif field_name == barrele_constant.BARRELE_FIELD_VERSIONS:
+        result = ",".join(sorted(measurement.bm_versions))
+    else:
+        log.cl_error("unknown field [%s] of measurement", field_name)
+        result = clog.ERROR_MSG
+        ret = -1
+    return ret, result
+
+
+def barrele_measurements(barrele_command, role=None,
+                         lustre_version_name=None,
+                         jobstat_pattern=barrele_constant.BARRELE_JOBSTAT_PATTERN_UNKNOWN):
+    """
+    Print the measurements that Barreleye agents send to Influxdb.
+
+    The catalog is generated from the definition files of Collectd and the
+    items enabled for each agent role.
+    :param role: Only print the measurements of this agent role, e.g. oss,
+    mds, client, exp_ost, exp_mdt, lustre (all Lustre hosts) or infiniband.
+    :param lustre_version_name: Only print the measurements of this Lustre
+    version, e.g. 2.12.
+    :param jobstat_pattern: The jobstat pattern configured in Lustre, which
+    adds tags to the jobstats measurements, default: unknown.
+    """
+    # pylint: disable=unused-argument,protected-access
+    # pylint: disable=import-outside-toplevel
+    from pybarrele import barrele_measurement
+    logdir = barrele_command._bec_logdir
+    log_to_file = barrele_command._bec_log_to_file
+    logdir_is_default = (logdir == barrele_constant.BARRELE_LOG_DIR)
+    log, _ = cmd_general.init_env_noconfig(logdir, log_to_file,
+                                           logdir_is_default)
+    if role is not None:
+        role = cmd_general.check_argument_str(log, "role", role)
+        if role not in barrele_constant.BARRELE_ROLES:
+            log.cl_error("invalid role [%s], expected one of %s",
+                         role, barrele_constant.BARRELE_ROLES)
+            cmd_general.cmd_exit(log, -1)
+    if lustre_version_name is not None:
+        # Fire parses version like 2.12 as a float
+        lustre_version_name = str(lustre_version_name)
+        if lustre_version_name not in lustre_version.LUSTRE_VERSION_DICT:
+            log.cl_error("invalid Lustre version [%s]", lustre_version_name)
+            cmd_general.cmd_exit(log, -1)
+    jobstat_pattern = cmd_general.check_argument_str(log, "jobstat_pattern",
+                                                     jobstat_pattern)
+    if jobstat_pattern not in barrele_constant.BARRELE_JOBSTAT_PATTERNS:
+        log.cl_error("invalid jobstat pattern [%s], expected one of %s",
+                     jobstat_pattern, barrele_constant.BARRELE_JOBSTAT_PATTERNS)
+        cmd_general.cmd_exit(log, -1)
+
+    catalog = barrele_measurement.measurement_catalog(log, jobstat_pattern)
+    if catalog is None:
+        log.cl_error("failed to get the measurement catalog")
+        cmd_general.cmd_exit(log, -1)
+    measurements = []
+    for name in sorted(catalog):
+        measurement = catalog[name]
+        if role is not None and role not in measurement.bm_roles:
+            continue
+        # The measurements not from Lustre have no version
+        if (lustre_version_name is not None and
+                len(measurement.bm_versions) > 0 and
+                lustre_version_name not in measurement.bm_versions):
+            continue
+        measurements.append(measurement)
+    quick_fields = [barrele_constant.BARRELE_FIELD_MEASUREMENT,
+                    barrele_constant.BARRELE_FIELD_TAGS,
+                    barrele_constant.BARRELE_FIELD_TYPE,
+                    barrele_constant.BARRELE_FIELD_ITEMS,
+                    barrele_constant.BARRELE_FIELD_ROLES,
+                    barrele_constant.BARRELE_FIELD_VERSIONS]
+    ret = cmd_general.print_list(log, measurements, quick_fields, [], [],
+                                 measurement_field)
+    cmd_general.cmd_exit(log, ret)
+
+
+def estimate_field(log, estimate, field_name):
+    """
+    Return (0, result) for a field of MeasurementEstimate or
+    ServerEstimate
+    """
+    ret = 0
+    if field_name in (barrele_constant.BARRELE_FIELD_MEASUREMENT,
+                      barrele_constant.BARRELE_FIELD_SERVER):
+        result = estimate.mee_name
+    elif field_name == barrele_constant.BARRELE_FIELD_AGENTS:
+        result = str(estimate.see_agents)
+    elif field_name == barrele_constant.BARRELE_FIELD_SERIES:
+        result = str(estimate.mee_series)
+    elif field_name == barrele_constant.BARRELE_FIELD_POINTS_RATE:
+        result = "%.1f" % estimate.mee_points_per_second
+    elif field_name == barrele_constant.BARRELE_FIELD_DAILY_GROWTH:
+        result = utils.bytes2human(estimate.mee_daily_bytes())
+    else:
+        log.cl_error("unknown field [%s] of estimate", field_name)
+        result = clog.ERROR_MSG
+        ret = -1
+    return ret, result
+
+
+def barrele_estimate(barrele_command):
+    """
+    Estimate the load that the Barreleye agents will put on the servers.
+
+    The series and data points of each measurement are estimated from the
+    configuration, the measurement catalog and the numbers of Lustre
+    targets, exports, jobs, clients and disks found on the agent hosts.
+    Warnings are printed if a server is not sized for the load.
+    """
+    # pylint: disable=unused-argument,protected-access
+    # pylint: disable=import-outside-toplevel
+    from pybarrele import barrele_estimate as estimate_lib
+    log, barreleye_instance = barrele_cmd_common.init_env(
+        barrele_command._bec_config_fpath,
+        barrele_command._bec_logdir,
+        barrele_command._bec_log_to_file,
+        barrele_command._bec_iso)
+    estimates, server_estimates = \
+        estimate_lib.estimate_load(log, barreleye_instance)
+    if estimates is None:
+        log.cl_error("failed to estimate the load of Barreleye agents")
+        cmd_general.cmd_exit(log, -1)
+    quick_fields = [barrele_constant.BARRELE_FIELD_MEASUREMENT,
+                    barrele_constant.BARRELE_FIELD_SERIES,
+                    barrele_constant.BARRELE_FIELD_POINTS_RATE,
+                    barrele_constant.BARRELE_FIELD_DAILY_GROWTH]
+    ret = cmd_general.print_list(log, estimates, quick_fields, [], [],
+                                 estimate_field)
+    if ret:
+        cmd_general.cmd_exit(log, ret)
+    log.cl_stdout("")
+    quick_fields = [barrele_constant.BARRELE_FIELD_SERVER,
+                    barrele_constant.BARRELE_FIELD_AGENTS,
+                    barrele_constant.BARRELE_FIELD_SERIES,
+                    barrele_constant.BARRELE_FIELD_POINTS_RATE,
+                    barrele_constant.BARRELE_FIELD_DAILY_GROWTH]
+    ret = cmd_general.print_list(log, server_estimates, quick_fields, [], [],
+                                 estimate_field)
+    if ret:
+        cmd_general.cmd_exit(log, ret)
+    warnings = 0
+    for server_estimate in server_estimates:
+        warnings += server_estimate.see_check_sizing(log)
+    if warnings:
+        log.cl_warning("Barreleye server(s) might not be able to absorb "
+                       "the load, please consider more hardware, longer "
+                       "collect interval or fewer enabled items")
+    cmd_general.cmd_exit(log, 0)
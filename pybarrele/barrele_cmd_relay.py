@@ -0,0 +1,38 @@
+"""
+Commands of Barreleye relay
+"""
+import socket
+from pycoral import cmd_general
+from pybarrele import barrele_cmd_common
+
+
+class BarreleRelayCommand():
+    """
+    Commands to run a Barreleye relay.
+    """
+    # pylint: disable=too-few-public-methods
+    def _init(self, config, logdir, log_to_file, iso):
+        # pylint: disable=attribute-defined-outside-init
+        self._brc_config_fpath = config
+        self._brc_logdir = logdir
+        self._brc_log_to_file = log_to_file
+        self._brc_iso = iso
+
+    def run(self, host=None):
+        """
+        Run the relay which batches the data points from the agents and
+        forwards them to the Barreleye server. This is usually started by
+        the barrele_relay service.
+        :param host: The hostname of the relay in the config file, default:
+        the hostname of the local host.
+        """
+        log, barreleye_instance = barrele_cmd_common.init_env(
+            self._brc_config_fpath,
+            self._brc_logdir,
+            self._brc_log_to_file,
+            self._brc_iso)
+        if host is None:
+            host = socket.gethostname()
+        host = cmd_general.check_argument_str(log, "host", host)
+        ret = barreleye_instance.bei_relay_run(log, host)
+        cmd_general.cmd_exit(log, ret)
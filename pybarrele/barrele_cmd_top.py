@@ -0,0 +1,137 @@
+"""
+Commands to rank the jobs, users and groups by their I/O on Lustre
+"""
+import time
+from pycoral import cmd_general
+from pycoral import clog
+from pycoral import utils
+from pybarrele import barrele_constant
+from pybarrele import barrele_cmd_common
+
+
+def top_entry_field(log, ranking_entry, field_name):
+    """
+    Return (0, result) for a field of (TopRanking, TopEntry)
+    """
+    # pylint: disable=import-outside-toplevel
+    from pybarrele import barrele_top as top_lib
+    ranking, entry = ranking_entry
+    ret = 0
+    is_bytes = ranking.tr_metric != top_lib.TOP_METRIC_MD
+    total = ranking.tr_entry_total(entry)
+    if field_name == barrele_constant.BARRELE_FIELD_RANK:
+        result = entry.te_rank
+    elif field_name == barrele_constant.BARRELE_FIELD_FILESYSTEM:
+        result = entry.te_fs_name
+    elif field_name == top_lib.TOP_KEY_FIELDS[ranking.tr_key]:
+        result = entry.te_key_value
+    elif field_name == barrele_constant.BARRELE_FIELD_TOTAL:
+        if is_bytes:
+            result = utils.bytes2human(total)
+        else:
+            result = "%d" % total
+    elif field_name == barrele_constant.BARRELE_FIELD_RATE:
+        if is_bytes:
+            result = utils.bytes2human(total / ranking.tr_window) + "/s"
+        else:
+            result = "%.1f/s" % (total / ranking.tr_window)
+    else:
+        log.cl_error("unknown field [%s] of top entry", field_name)
+        result = clog.ERROR_MSG
+        ret = -1
+    return ret, result
+
+
+def barrele_top(barrele_command, by="job_id", metric="io", window="1h",
+                limit=10, fs_name=None, watch=False, refresh=None):
+    """
+    Print the jobs, users or groups that have the most I/O on Lustre.
+
+    The ranking is calculated from the points written by the continuous
+    queries of jobstats on the Barreleye servers.
+    :param by: The jobstats tag to rank, one of job_id, uid and gid,
+    default: job_id. The uid and gid are available only if the
+    jobstat_pattern in the config has them.
+    :param metric: The metric to rank by, one of io (bytes read and
+    written), read, write and md (metadata operations), default: io.
+    :param window: The time window to rank in, e.g. 10m, default: 1h.
+    :param limit: The number of the jobs, users or groups to print,
+    default: 10.
+    :param fs_name: Only rank the jobs, users or groups of this file
+    system.
+    :param watch: Whether to refresh the ranking until interrupted. Only
+    the points of the new intervals are read on each refresh,
+    default: False.
+    :param refresh: The seconds between refreshes when watching,
+    default: the interval of the continuous queries.
+    """
+    # pylint: disable=too-many-arguments,too-many-locals,protected-access
+    # pylint: disable=import-outside-toplevel
+    from pybarrele import barrele_dashboard
+    from pybarrele import barrele_top as top_lib
+    log, barreleye_instance = barrele_cmd_common.init_env(
+        barrele_command._bec_config_fpath,
+        barrele_command._bec_logdir,
+        barrele_command._bec_log_to_file,
+        barrele_command._bec_iso)
+    by = cmd_general.check_argument_str(log, "by", by)
+    if by not in top_lib.TOP_KEYS:
+        log.cl_error("invalid tag [%s] to rank, expected one of %s",
+                     by, top_lib.TOP_KEYS)
+        cmd_general.cmd_exit(log, -1)
+    metric = cmd_general.check_argument_str(log, "metric", metric)
+    if metric not in top_lib.TOP_METRICS:
+        log.cl_error("invalid metric [%s], expected one of %s",
+                     metric, top_lib.TOP_METRICS)
+        cmd_general.cmd_exit(log, -1)
+    window = cmd_general.check_argument_str(log, "window", window)
+    window_seconds = barrele_dashboard.duration_seconds(window)
+    if window_seconds is None or window_seconds == 0:
+        log.cl_error("invalid time window [%s], e.g. 1h", window)
+        cmd_general.cmd_exit(log, -1)
+    cmd_general.check_argument_type(log, "limit", limit, int)
+    if fs_name is not None:
+        fs_name = cmd_general.check_argument_str(log, "fs_name", fs_name)
+    cmd_general.check_argument_bool(log, "watch", watch)
+    cq_interval = (int(barreleye_instance.bei_collect_interval) *
+                   int(barreleye_instance.bei_continuous_query_periods))
+    if refresh is None:
+        refresh = cq_interval
+    else:
+        cmd_general.check_argument_type(log, "refresh", refresh, int)
+
+    continuous_query, where = \
+        top_lib.top_continuous_query(log, metric, by,
+                                     barreleye_instance.bei_jobstat_pattern)
+    if continuous_query is None:
+        cmd_general.cmd_exit(log, -1)
+    ranking = top_lib.TopRanking(barreleye_instance.bei_barreleye_servers,
+                                 metric, by, continuous_query, where,
+                                 window_seconds, cq_interval,
+                                 fs_name=fs_name)
+    quick_fields = [barrele_constant.BARRELE_FIELD_RANK,
+                    barrele_constant.BARRELE_FIELD_FILESYSTEM,
+                    top_lib.TOP_KEY_FIELDS[by],
+                    barrele_constant.BARRELE_FIELD_TOTAL,
+                    barrele_constant.BARRELE_FIELD_RATE]
+    while True:
+        start_time = time.time()
+        ret = ranking.tr_refresh(log)
+        if ret:
+            log.cl_error("failed to rank [%s] by [%s]", by, metric)
+            cmd_general.cmd_exit(log, -1)
+        entries = ranking.tr_top(limit)
+        log.cl_info("ranked [%d] out of [%d] [%s] by [%s] in the last [%s] "
+                    "within [%.3f] seconds", len(entries),
+                    len(ranking.tr_entries), by, metric, window,
+                    time.time() - start_time)
+        ret = cmd_general.print_list(log,
+                                     [(ranking, entry) for entry in entries],
+                                     quick_fields, [], [], top_entry_field)
+        if ret or not watch:
+            cmd_general.cmd_exit(log, ret)
+        try:
+            time.sleep(refresh)
+        except KeyboardInterrupt:
+            cmd_general.cmd_exit(log, 0)
+        log.cl_stdout("")
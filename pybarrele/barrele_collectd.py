@@ -6,6 +6,7 @@ import re
 import collections
 from pycoral import lustre_version
 from pybarrele import barrele_constant
+from pybarrele import barrele_relay
 
 LIBCOLLECTDCLIENT_TYPE_NAME = "libcollectdclient"
 COLLECTD_TYPE_NAME = "collectd"
@@ -14,6 +15,31 @@ COLLECTD_CONFIG_TEST_FNAME = "collectd.conf.test"
 COLLECTD_CONFIG_FINAL_FNAME = "collectd.conf.final"
 # The collection interval of testing Collectd
 COLLECTD_INTERVAL_TEST = 1
+# By default, the slow-moving metrics are collected less often than the
+# global interval by this times.
+COLLECTD_SLOW_INTERVAL_MULTIPLIER = 10
+# The plugins of slow-moving metrics
+COLLECTD_SLOW_PLUGINS = ["df", "uptime", "users"]
+# The filedata items of slow-moving metrics, i.e. kbytesinfo, filesinfo,
+# recovery status and thread counts. The disk usage of the users changes
+# slowly too, but is not included, since the continuous queries of its
+# measurements sum the points of many series in each global interval.
+COLLECTD_SLOW_ITEM_PATTERN = re.compile(r".+_(kbytes|files)(total|free|avail)|"
+                                        r".+_recovery_status_.+|"
+                                        r".+_threads_.+")
+# The pattern of an item in the filedata config
+FILEDATA_ITEM_PATTERN = re.compile(r"\n *<Item>\n.*?\n *</Item>", re.DOTALL)
+# The pattern of the type of an item in the filedata config
+FILEDATA_ITEM_TYPE_PATTERN = re.compile(r'^ *Type "(\S+)"', re.MULTILINE)
+# The pattern of the common section in the filedata config
+FILEDATA_COMMON_PATTERN = re.compile(r" *<Common>\n.*?</Common>\n", re.DOTALL)
+# The supported numbers of the shards when sampling the exp_* stats of
+# clients. The shard of a client is determined by the last two digits of
+# its NID, so the number needs to be a divisor of 100.
+EXP_SAMPLE_SHARD_NUMBERS = [1, 2, 4, 5, 10, 20, 25, 50, 100]
+# Key is the prefix of the exp_* items, value is the field of client NID
+EXP_CLIENT_FIELDS = {"exp_ost_stats_": "ost_exp_client",
+                     "exp_md_stats_": "mdt_exp_client"}
 # ES2 of version ddn18 added support for used inode/space in the future
 ES2_HAS_USED_INODE_SPACE_SUPPORT = False
 # ES4 will add support for used inode/space in the future
@@ -29,6 +55,7 @@ XML_FNAME_ES6_0 = "lustre-b_es6_0.xml"
 XML_FNAME_2_13 = "lustre-2.13.xml"
 XML_FNAME_IME_1_1 = "ime-1.1.xml"
 XML_FNAME_IME_1_2 = "ime-1.2.xml"
+XML_FNAME_INFINIBAND = "infiniband-0.1.xml"
 # The Lustre XML files that supports ZFS.
 SUPPORTED_ZFS_XML_FNAMES = [XML_FNAME_ES3, XML_FNAME_ES4,
                             XML_FNAME_2_12, XML_FNAME_ES5_1,
@@ -56,6 +83,22 @@ def lustre_version_xml_fname(log, version, quiet=False):
     return xml_fname
 
 
+def exp_sample_client_regex(shards, shard):
+    """
+    Return the regular expression that matches the client NIDs in the shard,
+    i.e. the last number in the NID modulo the number of shards equals to the
+    shard index. E.g. "10.0.0.15" and "15" are in shard 5 of 10 shards.
+    """
+    one_digits = [str(number) for number in range(10)
+                  if number % shards == shard]
+    two_digits = ["%02d" % number for number in range(100)
+                  if number % shards == shard]
+    regex = "(%s)$" % "|".join(two_digits)
+    if len(one_digits) > 0:
+        regex += "|(^|[^0-9])(%s)$" % "|".join(one_digits)
+    return regex
+
+
 def support_zfs(xml_fname):
     """
     Whether this XML file supports zfs
@@ -88,7 +131,10 @@ class CollectdConfig():
     Each collectd config has an object of this type
     """
     # pylint: disable=too-many-public-methods,too-many-instance-attributes
-    def __init__(self, barreleye_agent, collect_internal, jobstat_pattern):
+    def __init__(self, barreleye_agent, collect_internal, jobstat_pattern,
+                 plugin_intervals=None, item_intervals=None,
+                 slow_interval_multiplier=COLLECTD_SLOW_INTERVAL_MULTIPLIER):
+        # pylint: disable=too-many-arguments
         self.cdc_configs = collections.OrderedDict()
         self.cdc_plugins = collections.OrderedDict()
         self.cdc_filedatas = collections.OrderedDict()
@@ -97,6 +143,19 @@ class CollectdConfig():
         self.cdc_sfas = collections.OrderedDict()
         self.cdc_checks = []
         self.cdc_jobstat_pattern = jobstat_pattern
+        # The global collection interval
+        self.cdc_interval = collect_internal
+        # The intervals of plugins that override the global interval. Key
+        # is plugin name, value is interval. None means using the global
+        # interval for all plugins, e.g. when testing.
+        self.cdc_plugin_intervals = plugin_intervals
+        # The intervals of filedata items that override the global
+        # interval. Key is item type, value is interval. None means using
+        # the global interval for all items.
+        self.cdc_item_intervals = item_intervals
+        # The times that the slow-moving metrics are collected less often
+        # than the global interval
+        self.cdc_slow_interval_multiplier = slow_interval_multiplier
         # On some hosts, Collectd might get an hostname that differs from the
         # output of command "hostname". Thus, fix the hostname in Collectd
         # by configuring it.
@@ -116,6 +175,106 @@ class CollectdConfig():
         self.cdc_plugin_uptime()
         self.cdc_plugin_users()
 
+    def _cdc_plugin_interval(self, plugin_name):
+        """
+        Return the interval of the plugin, None if using the global one
+        """
+        if self.cdc_plugin_intervals is None:
+            return None
+        if plugin_name in self.cdc_plugin_intervals:
+            interval = self.cdc_plugin_intervals[plugin_name]
+        elif plugin_name in COLLECTD_SLOW_PLUGINS:
+            interval = self.cdc_interval * self.cdc_slow_interval_multiplier
+        else:
+            return None
+        if interval == self.cdc_interval:
+            return None
+        return interval
+
+    def _cdc_item_interval(self, item_type):
+        """
+        Return the interval of the filedata item, None if using the
+        interval of the plugin
+        """
+        if self.cdc_item_intervals is None:
+            return None
+        if item_type in self.cdc_item_intervals:
+            interval = self.cdc_item_intervals[item_type]
+        elif COLLECTD_SLOW_ITEM_PATTERN.fullmatch(item_type):
+            interval = self.cdc_interval * self.cdc_slow_interval_multiplier
+        else:
+            return None
+        plugin_interval = self._cdc_plugin_interval("filedata")
+        if plugin_interval is None:
+            plugin_interval = self.cdc_interval
+        if interval == plugin_interval:
+            return None
+        return interval
+
+    def cdc_effective_plugin_interval(self, plugin_name):
+        """
+        Return the interval that the plugin actually collects with
+        """
+        interval = self._cdc_plugin_interval(plugin_name)
+        if interval is None:
+            interval = self.cdc_interval
+        return interval
+
+    def cdc_effective_item_interval(self, item_type):
+        """
+        Return the interval that the filedata item actually collects with
+        """
+        interval = self._cdc_item_interval(item_type)
+        if interval is None:
+            interval = self.cdc_effective_plugin_interval("filedata")
+        return interval
+
+    def _cdc_load_plugin(self, plugin_name):
+        """
+        Return the config to load the plugin
+        """
+        interval = self._cdc_plugin_interval(plugin_name)
+        if interval is None:
+            return 'LoadPlugin %s\n' % plugin_name
+        return ('<LoadPlugin %s>\n'
+                '    Interval %s\n'
+                '</LoadPlugin>\n' % (plugin_name, interval))
+
+    def _cdc_filedata_blocks(self, config):
+        """
+        Move the items with their own intervals out of the filedata config
+        into new blocks with the same definition file. Return the list of
+        blocks.
+        """
+        # Key is interval, value is a list of item configs
+        interval_items = collections.OrderedDict()
+
+        def move_item(match):
+            item = match.group(0)
+            type_match = FILEDATA_ITEM_TYPE_PATTERN.search(item)
+            if type_match is None:
+                return item
+            interval = self._cdc_item_interval(type_match.group(1))
+            if interval is None:
+                return item
+            if interval not in interval_items:
+                interval_items[interval] = []
+            interval_items[interval].append(item)
+            return ""
+
+        common_match = FILEDATA_COMMON_PATTERN.search(config)
+        if common_match is None:
+            return [config]
+        blocks = [FILEDATA_ITEM_PATTERN.sub(move_item, config)]
+        common = common_match.group(0)
+        for interval, items in interval_items.items():
+            block_common = common.replace("</Common>",
+                                          "    Interval %s\n    </Common>" %
+                                          interval)
+            blocks.append('<Plugin "filedata">\n' + block_common +
+                          "".join(items) + "\n</Plugin>\n\n")
+        return blocks
+
     def cdc_dump(self, fpath):
         """
         Dump the config to file
@@ -130,8 +289,8 @@ class CollectdConfig():
             fout.write("\n")
 
             if any(self.cdc_aggregations):
-                config = """LoadPlugin aggregation
-<Plugin "aggregation">
+                config = self._cdc_load_plugin("aggregation")
+                config += """<Plugin "aggregation">
 """
                 fout.write(config)
                 for config in self.cdc_aggregations.values():
@@ -159,7 +318,7 @@ PostCacheChain "PostCache"
                 fout.write(config)
 
             if any(self.cdc_sfas):
-                config = 'LoadPlugin ssh\n'
+                config = self._cdc_load_plugin("ssh")
                 fout.write(config)
                 template_prefix = """<Plugin "ssh">
     <Common>
@@ -247,14 +406,14 @@ PostCacheChain "PostCache"
                     fout.write(config)
 
             if any(self.cdc_filedatas):
-                config = """LoadPlugin filedata
-"""
+                config = self._cdc_load_plugin("filedata")
                 fout.write(config)
                 for config in self.cdc_filedatas.values():
-                    fout.write(config)
+                    for block in self._cdc_filedata_blocks(config):
+                        fout.write(block)
 
             for plugin_name, plugin_config in self.cdc_plugins.items():
-                text = 'LoadPlugin %s\n' % plugin_name
+                text = self._cdc_load_plugin(plugin_name)
                 text += plugin_config + '\n'
                 fout.write(text)
 
@@ -300,15 +459,25 @@ PostCacheChain "PostCache"
         """
         Config the write TSDB plugin
         """
-        barreleye_server = self.cdc_barreleye_agent.bea_barreleye_server
-        host = barreleye_server.bes_server_host.sh_hostname
+        barreleye_agent = self.cdc_barreleye_agent
+        relay = barreleye_agent.bea_relay
+        if relay is not None:
+            if relay.bre_local:
+                host = "localhost"
+            else:
+                host = relay.bre_host.sh_hostname
+            port = relay.bre_port
+        else:
+            barreleye_server = barreleye_agent.bea_barreleye_server
+            host = barreleye_server.bes_server_host.sh_hostname
+            port = barrele_relay.INFLUXDB_OPENTSDB_PORT
         config = ('<Plugin "write_tsdb">\n'
                   '    <Node>\n'
                   '        Host "%s"\n'
-                  '        Port "4242"\n'
+                  '        Port "%s"\n'
                   '        DeriveRate true\n'
                   '    </Node>\n'
-                  '</Plugin>\n' % host)
+                  '</Plugin>\n' % (host, port))
         self.cdc_plugins["write_tsdb"] = config
         return 0
 
@@ -348,16 +517,48 @@ PostCacheChain "PostCache"
             self.cdc_checks.append(self.cdc_plugin_cpu_check)
         return 0
 
-    def cdc_plugin_lustre(self, log, version, enable_lustre_oss=False,
-                          enable_lustre_mds=False, enable_lustre_client=False,
-                          enable_lustre_exp_ost=False, enable_lustre_exp_mdt=False):
+    def _cdc_exp_sample_rules(self, config, exp_client_regex):
+        """
+        Add the rule to the exp_* items so that only the sampled clients
+        are collected.
+        """
+        def add_rule(match):
+            item = match.group(0)
+            type_match = FILEDATA_ITEM_TYPE_PATTERN.search(item)
+            if type_match is None:
+                return item
+            item_type = type_match.group(1)
+            for prefix, field in EXP_CLIENT_FIELDS.items():
+                if not item_type.startswith(prefix):
+                    continue
+                end = item.rindex("\n")
+                return (item[:end] +
+                        '\n        <Rule>\n'
+                        '            Field "%s"\n'
+                        '            Match "%s"\n'
+                        '        </Rule>' % (field, exp_client_regex) +
+                        item[end:])
+            return item
+
+        return FILEDATA_ITEM_PATTERN.sub(add_rule, config)
+
+    @staticmethod
+    def cdc_lustre_filedata_config(log, version, jobstat_pattern,
+                                   enable_lustre_oss=False,
+                                   enable_lustre_mds=False,
+                                   enable_lustre_client=False,
+                                   enable_lustre_exp_ost=False,
+                                   enable_lustre_exp_mdt=False):
         # pylint: disable=too-many-branches,too-many-statements
+        # pylint: disable=too-many-arguments
         """
-        Config the Lustre plugin
+        Return the config of the filedata plugin for Lustre, None on error.
+        This does not depend on the agent, so that the items enabled for
+        each agent role can be found without an agent.
         """
         xml_fname = lustre_version_xml_fname(log, version)
         if xml_fname is None:
-            return -1
+            return None
         xml_fpath = barrele_constant.BARRELE_XML_DIR + "/" + xml_fname
 
         enable_zfs = support_zfs(xml_fname)
@@ -615,7 +816,7 @@ PostCacheChain "PostCache"
         Type "ost_recovery_status_evicted_clients"
     </Item>
 """
-            if (self.cdc_jobstat_pattern ==
+            if (jobstat_pattern ==
                     barrele_constant.BARRELE_JOBSTAT_PATTERN_PROCNAME_UID):
                 config += """
     <ItemType>
@@ -637,7 +838,7 @@ PostCacheChain "PostCache"
         TsdbTags "procname=${extendfield:procname} uid=${extendfield:uid}"
     </ItemType>
 """
-            elif (self.cdc_jobstat_pattern ==
+            elif (jobstat_pattern ==
                   barrele_constant.BARRELE_JOBSTAT_PATTERN_UID_GID):
                 config += """
     <ItemType>
@@ -659,12 +860,12 @@ PostCacheChain "PostCache"
         TsdbTags "uid=${extendfield:uid} gid=${extendfield:gid}"
     </ItemType>
 """
-            elif (self.cdc_jobstat_pattern !=
+            elif (jobstat_pattern !=
                   barrele_constant.BARRELE_JOBSTAT_PATTERN_UNKNOWN):
                 log.cl_error("unknown jobstat pattern [%s] when configuring "
                              "job ID parser for OST",
-                             self.cdc_jobstat_pattern)
-                return -1
+                             jobstat_pattern)
+                return None
         if enable_lustre_exp_ost:
             config += """
     <Item>
@@ -886,7 +1087,7 @@ PostCacheChain "PostCache"
         Type "mdt_filesfree"
     </Item>"""
 
-            if (self.cdc_jobstat_pattern ==
+            if (jobstat_pattern ==
                     barrele_constant.BARRELE_JOBSTAT_PATTERN_PROCNAME_UID):
                 config += """
     <ItemType>
@@ -908,7 +1109,7 @@ PostCacheChain "PostCache"
         TsdbTags "procname=${extendfield:procname} uid=${extendfield:uid}"
     </ItemType>
 """
-            elif (self.cdc_jobstat_pattern ==
+            elif (jobstat_pattern ==
                   barrele_constant.BARRELE_JOBSTAT_PATTERN_UID_GID):
                 config += """
     <ItemType>
@@ -930,12 +1131,12 @@ PostCacheChain "PostCache"
         TsdbTags "uid=${extendfield:uid} gid=${extendfield:gid}"
     </ItemType>
 """
-            elif (self.cdc_jobstat_pattern !=
+            elif (jobstat_pattern !=
                   barrele_constant.BARRELE_JOBSTAT_PATTERN_UNKNOWN):
                 log.cl_error("unknown jobstat pattern [%s] when configuring "
                              "job ID parser for MDT",
-                             self.cdc_jobstat_pattern)
-                return -1
+                             jobstat_pattern)
+                return None
 
         config += """
     <Item>
@@ -1087,6 +1288,29 @@ PostCacheChain "PostCache"
 
         # Client support, e.g. max_rpcs_in_flight of mdc could be added
         config += "</Plugin>\n\n"
+        return config
+
+    def cdc_plugin_lustre(self, log, version, enable_lustre_oss=False,
+                          enable_lustre_mds=False, enable_lustre_client=False,
+                          enable_lustre_exp_ost=False, enable_lustre_exp_mdt=False,
+                          exp_client_regex=None):
+        """
+        Config the Lustre plugin. If exp_client_regex is not None, only
+        collect the exp_* stats of the clients whose NIDs match it.
+        """
+        # pylint: disable=too-many-arguments
+        config = \
+            self.cdc_lustre_filedata_config(log, version,
+                                            self.cdc_jobstat_pattern,
+                                            enable_lustre_oss=enable_lustre_oss,
+                                            enable_lustre_mds=enable_lustre_mds,
+                                            enable_lustre_client=enable_lustre_client,
+                                            enable_lustre_exp_ost=enable_lustre_exp_ost,
+                                            enable_lustre_exp_mdt=enable_lustre_exp_mdt)
+        if config is None:
+            return -1
+        if exp_client_regex is not None:
+            config = self._cdc_exp_sample_rules(config, exp_client_regex)
         self.cdc_filedatas["lustre"] = config
         barreleye_agent = self.cdc_barreleye_agent
         rpm_name = "collectd-filedata"
@@ -1229,9 +1453,10 @@ PostCacheChain "PostCache"
             self.cdc_checks.append(self.cdc_plugin_users_check)
         return 0
 
-    def cdc_plugin_infiniband(self):
+    @staticmethod
+    def cdc_infiniband_filedata_config():
         """
-        Add IB configuration
+        Return the config of the filedata plugin for IB
         """
         config = """<Plugin "filedata">
     <Common>
@@ -1288,6 +1513,13 @@ PostCacheChain "PostCache"
 </Plugin>
 
 """
+        return config
+
+    def cdc_plugin_infiniband(self):
+        """
+        Add IB configuration
+        """
+        config = self.cdc_infiniband_filedata_config()
         self.cdc_filedatas["infiniband"] = config
         barreleye_agent = self.cdc_barreleye_agent
         rpm_name = "collectd-filedata"
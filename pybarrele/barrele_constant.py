@@ -10,6 +10,8 @@ BARRELE_CONFIG_FNAME = "barreleye.conf"
 BARRELE_DIR = constant.CORAL_DIR + "/barrele"
 # The dir for XML files
 BARRELE_XML_DIR = BARRELE_DIR + "/xmls"
+# The index of the measurements defined by the XML files
+BARRELE_DEFINITION_INDEX = BARRELE_XML_DIR + "/definition_index.json"
 # Config file path of barrelelye.conf
 BARRELE_CONFIG = constant.ETC_CORAL_DIR + "/" + BARRELE_CONFIG_FNAME
 BARRELE_LOG_DIR = constant.CORAL_LOG_DIR + "/barrele"
@@ -38,6 +40,10 @@ BARRELE_TEST_LOG_DIR_BASENAME = "barrele_test"
 
 
 BRL_AGENTS = "agents"
+BRL_AGENT_HOSTNAMES = "agent_hostnames"
+BRL_AGGREGATE_DROP_TAGS = "aggregate_drop_tags"
+BRL_AGGREGATE_MEASUREMENTS = "aggregate_measurements"
+BRL_BATCH_SIZE = "batch_size"
 BRL_CONTINUOUS_QUERY_PERIODS = "continuous_query_periods"
 BRL_COLLECT_INTERVAL = "collect_interval"
 BRL_DATA_PATH = "data_path"
@@ -49,11 +55,22 @@ BRL_ENABLE_LUSTRE_MDS = "enable_lustre_mds"
 BRL_ENABLE_LUSTRE_OSS = "enable_lustre_oss"
 BRL_ENABLE_LUSTRE_EXP_MDT = "enable_lustre_exp_mdt"
 BRL_ENABLE_LUSTRE_EXP_OST = "enable_lustre_exp_ost"
+BRL_FLUSH_INTERVAL = "flush_interval"
+BRL_GZIP = "gzip"
 BRL_HOSTNAME = "hostname"
+BRL_ITEM_INTERVALS = "item_intervals"
 BRL_JOBSTAT_PATTERN = "jobstat_pattern"
+BRL_LUSTRE_EXP_SAMPLE_SHARD = "lustre_exp_sample_shard"
+BRL_LUSTRE_EXP_SAMPLE_SHARDS = "lustre_exp_sample_shards"
 BRL_LUSTRE_FALLBACK_VERSION = "lustre_fallback_version"
+BRL_PLUGIN_INTERVALS = "plugin_intervals"
+BRL_PORT = "port"
+BRL_RELAYS = "relays"
 BRL_SERVER = "server"
+BRL_SERVERS = "servers"
+BRL_SLOW_INTERVAL_MULTIPLIER = "slow_interval_multiplier"
 BRL_SSH_IDENTITY_FILE = "ssh_identity_file"
+BRL_TRANSPORT = "transport"
 
 GRAFANA_STATUS_PANEL = "Grafana_Status_panel"
 GRAFANA_PIECHART_PANEL = "grafana-piechart-panel"
@@ -61,6 +78,14 @@ GRAFANA_PIECHART_PANEL = "grafana-piechart-panel"
 GRAFANA_PLUGINS = [GRAFANA_STATUS_PANEL,
                    GRAFANA_PIECHART_PANEL]
 
+# The agent sends the data points to the OpenTSDB listener of Influxdb
+# with the write_tsdb plugin of Collectd.
+BARRELE_TRANSPORT_OPENTSDB = "opentsdb"
+# The agent sends the data points to a local relay, which writes batches
+# of line protocol to the HTTP API of Influxdb.
+BARRELE_TRANSPORT_HTTP = "http"
+BARRELE_TRANSPORTS = [BARRELE_TRANSPORT_OPENTSDB, BARRELE_TRANSPORT_HTTP]
+
 # The jobstat pattern configured in Lustre is unknown.
 BARRELE_JOBSTAT_PATTERN_UNKNOWN = "unknown"
 # The jobstat configured in Lustre is "procname_uid". Some metrics of users
@@ -72,6 +97,23 @@ BARRELE_JOBSTAT_PATTERNS = [BARRELE_JOBSTAT_PATTERN_UNKNOWN,
                             BARRELE_JOBSTAT_PATTERN_PROCNAME_UID,
                             BARRELE_JOBSTAT_PATTERN_UID_GID]
 
+# The roles of agents that enable the measurements. Every agent with the
+# Lustre plugin has the measurements of the Lustre role.
+BARRELE_ROLE_LUSTRE = "lustre"
+BARRELE_ROLE_OSS = "oss"
+BARRELE_ROLE_MDS = "mds"
+BARRELE_ROLE_CLIENT = "client"
+BARRELE_ROLE_EXP_OST = "exp_ost"
+BARRELE_ROLE_EXP_MDT = "exp_mdt"
+BARRELE_ROLE_INFINIBAND = "infiniband"
+BARRELE_ROLES = [BARRELE_ROLE_LUSTRE,
+                 BARRELE_ROLE_OSS,
+                 BARRELE_ROLE_MDS,
+                 BARRELE_ROLE_CLIENT,
+                 BARRELE_ROLE_EXP_OST,
+                 BARRELE_ROLE_EXP_MDT,
+                 BARRELE_ROLE_INFINIBAND]
+
 # The Collectd/Influxdb service is active
 BARRELE_AGENT_ACTIVE = "active"
 # The Collectd/Influxdb service is inactive
@@ -89,6 +131,8 @@ BARRELE_AGENT_STOPPED = "stopped"
 
 # The agent hostname
 BARRELE_FIELD_HOST = "Host"
+# The hostname of the server that the agent sends data to
+BARRELE_FIELD_SERVER = "Server"
 # Lustre version name
 BARRELE_FIELD_LUSTRE_VERSION = "Lustre Version"
 # The status of agent up
@@ -105,3 +149,63 @@ BARRELE_FIELD_GRAFANA_VERSION = "Grafana Version"
 BARRELE_FIELD_INFLUXDB = "Influxdb"
 # The version of Influxdb
 BARRELE_FIELD_INFLUXDB_VERSION = "Influxdb Version"
+# The name of Grafana dashboard
+BARRELE_FIELD_DASHBOARD = "Dashboard"
+# The title of Grafana panel
+BARRELE_FIELD_PANEL = "Panel"
+# The issue found by dashboard lint
+BARRELE_FIELD_ISSUE = "Issue"
+# The detail of the issue found by dashboard lint
+BARRELE_FIELD_DETAIL = "Detail"
+# The rank of the query cost
+BARRELE_FIELD_RANK = "Rank"
+# The seconds that the query took
+BARRELE_FIELD_COST = "Cost"
+# The seconds since the first event of the run
+BARRELE_FIELD_TIME = "Time"
+# The type of the event
+BARRELE_FIELD_TYPE = "Type"
+# The stage of the event
+BARRELE_FIELD_STAGE = "Stage"
+# The seconds that the command or stage took
+BARRELE_FIELD_DURATION = "Duration"
+# The exit status of the command or the status of the stage
+BARRELE_FIELD_STATUS = "Status"
+# The command that ran on the host
+BARRELE_FIELD_COMMAND = "Command"
+# The number of the commands that ran on the host
+BARRELE_FIELD_COMMANDS = "Commands"
+# The number of the failed commands
+BARRELE_FIELD_FAILURES = "Failures"
+# The bytes of stdout and stderr of the commands
+BARRELE_FIELD_BYTES = "Bytes"
+# The name of the measurement
+BARRELE_FIELD_MEASUREMENT = "Measurement"
+# The tag keys of the measurement
+BARRELE_FIELD_TAGS = "Tags"
+# The Collectd items that produce the measurement
+BARRELE_FIELD_ITEMS = "Items"
+# The agent roles that enable the measurement
+BARRELE_FIELD_ROLES = "Roles"
+# The Lustre versions that have the measurement
+BARRELE_FIELD_VERSIONS = "Versions"
+# The number of the series
+BARRELE_FIELD_SERIES = "Series"
+# The number of the data points written per second
+BARRELE_FIELD_POINTS_RATE = "Points/s"
+# The bytes of the data saved each day
+BARRELE_FIELD_DAILY_GROWTH = "Daily Growth"
+# The number of the agents
+BARRELE_FIELD_AGENTS = "Agents"
+# The name of the Lustre file system
+BARRELE_FIELD_FILESYSTEM = "Filesystem"
+# The job ID in jobstats
+BARRELE_FIELD_JOB_ID = "Job ID"
+# The UID in jobstats
+BARRELE_FIELD_UID = "UID"
+# The GID in jobstats
+BARRELE_FIELD_GID = "GID"
+# The bytes or operations in the time window
+BARRELE_FIELD_TOTAL = "Total"
+# The average bytes or operations per second in the time window
+BARRELE_FIELD_RATE = "Rate"
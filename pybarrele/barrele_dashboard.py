@@ -0,0 +1,885 @@
+"""
+Library for parsing and optimizing the InfluxQL queries in Grafana
+dashboards of Barreleye.
+"""
+import copy
+import re
+import traceback
+from http import HTTPStatus
+from pybarrele import barrele_influxdb
+
+# The regular expression of a InfluxQL SELECT query used in the dashboards
+INFLUXQL_SELECT_PATTERN = re.compile(
+    r'^\s*SELECT\s+(?P<fields>.+?)\s+'
+    r'FROM\s+(?P<measurement>"[^"]+"|/(?:[^/\\]|\\.)+/|[\w.\-]+)'
+    r'(?:\s+WHERE\s+(?P<where>.+?))?'
+    r'(?:\s+GROUP\s+BY\s+(?P<group>.+?))?'
+    r'(?P<tail>\s+(?:fill|ORDER|LIMIT|SLIMIT|OFFSET|SOFFSET|tz)\b.*?)?'
+    r'\s*;?\s*$', re.IGNORECASE | re.DOTALL)
+# The regular expression of a tag condition, e.g. "fs_name" = '$fs_name'
+INFLUXQL_TAG_CONDITION_PATTERN = re.compile(
+    r'^"?(?P<tag>\w+)"?\s*(?:=~|!~|!=|<>|=)\s*(?:\'[^\']*\'|/[^/]*/)$')
+# The regular expression of a time condition
+INFLUXQL_TIME_CONDITION_PATTERN = re.compile(
+    r'^(?:\$timeFilter|"?time"?\s*[<>=].*)$', re.IGNORECASE)
+# The regular expression of time() in GROUP BY
+INFLUXQL_GROUP_TIME_PATTERN = re.compile(r'^time\((?P<interval>[^)]*)\)$',
+                                         re.IGNORECASE)
+# The regular expression of a duration, e.g. 1m
+INFLUXQL_DURATION_PATTERN = re.compile(r'^(?P<number>\d+)(?P<unit>s|m|h|d|w)$')
+# Seconds of duration units
+INFLUXQL_DURATION_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400,
+                             "w": 604800}
+# The Grafana variables of auto interval
+GRAFANA_INTERVAL_VARIABLES = ["$__interval", "$interval"]
+# The aggregation functions that still give the right result when the
+# points are replaced by the averaged points of continuous queries. Only
+# used on the continuous queries that average a single series in each
+# group, since the sum of the series in a group is not their mean.
+CQ_COMPATIBLE_FUNCTIONS = ["mean"]
+# The tags that could have a huge number of values
+INFLUXQL_HIGH_CARDINALITY_TAGS = ["job_id", "exp_client", "client_uuid",
+                                  "uid", "gid", "user_id", "group_id",
+                                  "project_id"]
+# The regular expression of wildcard in fields, e.g. * or mean(*)
+INFLUXQL_SELECT_ALL_PATTERN = re.compile(r'(?:^|,|\()\s*\*\s*(?:$|,|\))')
+# The regular expression of LIMIT or SLIMIT clause
+INFLUXQL_LIMIT_PATTERN = re.compile(r'\b(?:S?LIMIT)\s+\d+', re.IGNORECASE)
+# The regular expression of a condition comparing a tag to a variable
+INFLUXQL_VARIABLE_EQUAL_PATTERN = re.compile(r"=\s*'\$\w+'")
+# The regular expression of a condition matching a tag to a variable
+INFLUXQL_VARIABLE_REGEX_PATTERN = re.compile(r"=~\s*/\^?\$\w+\$?/")
+# The regular expression of a time line in the output of EXPLAIN ANALYZE
+EXPLAIN_TIME_PATTERN = re.compile(
+    r'^[\s\u2502\u251c\u2514\u2500|`-]*(?P<key>\w+_time):\s*(?P<duration>\S+)\s*$')
+# The regular expression of the parts of a duration printed by Go
+GO_DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ns|us|\u00b5s|\u03bcs|ms|s|m|h)')
+# Seconds of the duration units of Go
+GO_DURATION_SECONDS = {"ns": 1e-9, "us": 1e-6, "\u00b5s": 1e-6,
+                       "\u03bcs": 1e-6, "ms": 1e-3, "s": 1, "m": 60,
+                       "h": 3600}
+# The builtin Grafana datasource that allows the targets of a panel to use
+# different datasources
+GRAFANA_DATASOURCE_MIXED = "-- Mixed --"
+# The name of the datasource variable to select the shard for the template
+# variables
+GRAFANA_SHARD_VARIABLE = "barreleye_shard"
+# The tag that has a different value on each agent host
+INFLUXQL_HOST_TAG = "fqdn"
+# The tags of Lustre targets. Each target is served by only one agent host
+# at a time, so the series of a target are never split across shards when
+# grouped together with the file system name.
+INFLUXQL_TARGET_TAGS = ["ost_index", "mdt_index"]
+# The regular expression of a condition that selects a single value of a
+# tag
+INFLUXQL_SINGLE_VALUE_PATTERN = re.compile(
+    r"^\(?\s*\"?(?P<tag>\w+)\"?\s*=\s*'[^']*'\s*\)?$")
+# The prefix of the measurements written by continuous queries. They do
+# not have the tags that are not grouped by the continuous query.
+INFLUXQL_CQ_MEASUREMENT_PREFIX = "cqm_"
+# The functions that select some of the series or points, which give
+# wrong results when applied on each shard separately
+INFLUXQL_SELECTOR_FUNCTIONS = ["top", "bottom"]
+# Lint issue of a query that can not be parsed
+LINT_ISSUE_UNPARSED = "unparsed"
+# Lint issue of a query that uses wildcard
+LINT_ISSUE_SELECT_ALL = "select_all"
+# Lint issue of a query without time filter
+LINT_ISSUE_NO_TIME_FILTER = "no_time_filter"
+# Lint issue of a query that groups by high cardinality tags without limit
+LINT_ISSUE_UNBOUNDED_GROUP_BY = "unbounded_group_by"
+# Lint issue of a query that reads raw measurement while continuous query
+# measurements exist
+LINT_ISSUE_RAW_MEASUREMENT = "raw_measurement"
+# Lint issue of a query that reads a measurement no agent produces
+LINT_ISSUE_UNKNOWN_MEASUREMENT = "unknown_measurement"
+# Lint issue of a query that uses a tag the measurement does not have
+LINT_ISSUE_UNKNOWN_TAG = "unknown_tag"
+# The regular expression of a measurement name that could be in the
+# measurement catalog, i.e. not a regular expression or a name of the
+# Collectd plugins that are not defined by definition files
+INFLUXQL_CATALOG_MEASUREMENT_PATTERN = re.compile(r'^\w+$')
+
+
+def separator_at(string, index, separator):
+    """
+    Whether the separator (case insensitive) is at the index of the string.
+    A separator other than comma is a word, so it needs to be surrounded by
+    spaces or the ends of the string.
+    """
+    end = index + len(separator)
+    if string[index:end].upper() != separator:
+        return False
+    if separator == ",":
+        return True
+    space_before = index == 0 or string[index - 1].isspace()
+    space_after = end >= len(string) or string[end].isspace()
+    return space_before and space_after
+
+
+def split_top_level(string, separator):
+    """
+    Split the string by separator (case insensitive word) which is not
+    in parentheses or quotes.
+    """
+    items = []
+    depth = 0
+    quote = None
+    start = 0
+    index = 0
+    while index < len(string):
+        char = string[index]
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0 and separator_at(string, index, separator):
+            items.append(string[start:index].strip())
+            start = index + len(separator)
+            index = start
+            continue
+        index += 1
+    items.append(string[start:].strip())
+    return items
+
+
+def duration_seconds(duration):
+    """
+    Return the seconds of a InfluxQL duration, e.g. 1m. Return None if
+    not a fixed duration.
+    """
+    match = INFLUXQL_DURATION_PATTERN.match(duration.strip())
+    if match is None:
+        return None
+    return int(match.group("number")) * INFLUXQL_DURATION_SECONDS[match.group("unit")]
+
+
+class InfluxqlQuery():
+    """
+    A parsed InfluxQL SELECT query in a dashboard
+    """
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    def __init__(self, query):
+        # The original query
+        self.iq_query = query
+        # Whether the query is parsed successfully
+        self.iq_parsed = False
+        # The fields part of the query
+        self.iq_fields = None
+        # The measurement name, quotes removed
+        self.iq_measurement = None
+        # The conditions splited by AND in WHERE clause
+        self.iq_conditions = []
+        # Whether the query has a time condition
+        self.iq_has_time_filter = False
+        # The tags that are used in WHERE clause
+        self.iq_where_tags = []
+        # Whether all the conditions in WHERE clause are understood
+        self.iq_where_parsed = True
+        # The tags in GROUP BY clause, "*" means all tags
+        self.iq_group_tags = []
+        # The interval in time() of GROUP BY clause, None if no time()
+        self.iq_group_time = None
+        # The part after GROUP BY, e.g. fill(null)
+        self.iq_tail = ""
+        self._iq_parse()
+
+    def _iq_parse_condition(self, condition):
+        """
+        Parse a condition in WHERE clause
+        """
+        while condition.startswith("(") and condition.endswith(")"):
+            condition = condition[1:-1].strip()
+        if INFLUXQL_TIME_CONDITION_PATTERN.match(condition):
+            self.iq_has_time_filter = True
+            return
+        ors = split_top_level(condition, "OR")
+        if len(ors) > 1:
+            for sub_condition in ors:
+                self._iq_parse_condition(sub_condition)
+            return
+        ands = split_top_level(condition, "AND")
+        if len(ands) > 1:
+            for sub_condition in ands:
+                self._iq_parse_condition(sub_condition)
+            return
+        match = INFLUXQL_TAG_CONDITION_PATTERN.match(condition)
+        if match is None:
+            self.iq_where_parsed = False
+            return
+        tag = match.group("tag")
+        if tag not in self.iq_where_tags:
+            self.iq_where_tags.append(tag)
+
+    def _iq_parse(self):
+        """
+        Parse the query
+        """
+        match = INFLUXQL_SELECT_PATTERN.match(self.iq_query)
+        if match is None:
+            return
+        self.iq_fields = match.group("fields").strip()
+        self.iq_measurement = match.group("measurement").strip('"')
+        where = match.group("where")
+        if where is not None:
+            self.iq_conditions = split_top_level(where, "AND")
+            for condition in self.iq_conditions:
+                self._iq_parse_condition(condition)
+        group = match.group("group")
+        if group is not None:
+            for item in split_top_level(group, ","):
+                time_match = INFLUXQL_GROUP_TIME_PATTERN.match(item)
+                if time_match is not None:
+                    self.iq_group_time = time_match.group("interval").strip()
+                    continue
+                self.iq_group_tags.append(item.strip('"'))
+        tail = match.group("tail")
+        if tail is not None:
+            self.iq_tail = tail.strip()
+        self.iq_parsed = True
+
+    def iq_functions(self):
+        """
+        Return the functions used in the fields
+        """
+        return [function.lower()
+                for function in re.findall(r'(\w+)\s*\(', self.iq_fields)]
+
+    def iq_field_keys(self):
+        """
+        Return the quoted field keys used in the fields
+        """
+        return re.findall(r'"(\w+)"', self.iq_fields)
+
+    def iq_group_time_seconds(self):
+        """
+        Return the seconds of time() in GROUP BY. Return 0 if auto interval
+        of Grafana is used, return None if not a fixed duration.
+        """
+        if self.iq_group_time in GRAFANA_INTERVAL_VARIABLES:
+            return 0
+        return duration_seconds(self.iq_group_time)
+
+    def iq_rewrite(self, measurement, field_from, field_to):
+        """
+        Return the query that reads another measurement and field
+        """
+        match = INFLUXQL_SELECT_PATTERN.match(self.iq_query)
+        fields = re.sub(r'"%s"' % re.escape(field_from), '"%s"' % field_to,
+                        self.iq_fields)
+        query = (self.iq_query[:match.start("fields")] + fields +
+                 self.iq_query[match.end("fields"):match.start("measurement")] +
+                 '"%s"' % measurement +
+                 self.iq_query[match.end("measurement"):])
+        return query
+
+
+def dashboard_panels(container):
+    """
+    Yield all panels in a dashboard, including the panels in rows and the
+    nested panels.
+    """
+    panels = []
+    if "rows" in container:
+        for row in container["rows"]:
+            if "panels" in row:
+                panels += row["panels"]
+    if "panels" in container:
+        panels += container["panels"]
+    for panel in panels:
+        yield panel
+        yield from dashboard_panels(panel)
+
+
+def dashboard_raw_targets(dashboard):
+    """
+    Yield (panel, target) of the targets with raw InfluxQL query.
+    """
+    for panel in dashboard_panels(dashboard):
+        if "targets" not in panel:
+            continue
+        for target in panel["targets"]:
+            if not target.get("rawQuery", False):
+                continue
+            if "query" not in target:
+                continue
+            yield panel, target
+
+
+def builder_select_part(expression, part):
+    """
+    Return the expression with the select part of Grafana query builder
+    applied.
+    """
+    part_type = part["type"]
+    params = part.get("params", [])
+    if part_type == "field":
+        return '"%s"' % params[0]
+    if part_type == "math":
+        return expression + params[0]
+    if part_type == "alias":
+        return expression + ' AS "%s"' % params[0]
+    arguments = [expression] + [str(param) for param in params]
+    return "%s(%s)" % (part_type, ", ".join(arguments))
+
+
+def builder_target_select(target):
+    """
+    Return the SELECT clause of the target built by query builder.
+    """
+    fields = []
+    for parts in target.get("select", []):
+        expression = ""
+        for part in parts:
+            expression = builder_select_part(expression, part)
+        fields.append(expression)
+    if len(fields) == 0:
+        fields.append('"value"')
+    return 'SELECT %s FROM "%s"' % (", ".join(fields),
+                                    target.get("measurement", ""))
+
+
+def builder_target_where(target):
+    """
+    Return the WHERE clause of the target built by query builder.
+    """
+    where = "WHERE "
+    for index, tag in enumerate(target.get("tags", [])):
+        if index > 0:
+            where += "%s " % tag.get("condition", "AND")
+        operator = tag.get("operator", "=")
+        value = str(tag["value"])
+        if operator not in ["=~", "!~"]:
+            value = "'%s'" % value.replace("'", "\\'")
+        where += '"%s" %s %s ' % (tag["key"], operator, value)
+    if len(target.get("tags", [])) > 0:
+        where += "AND "
+    return where + "$timeFilter"
+
+
+def builder_target_group_by(target):
+    """
+    Return the GROUP BY and fill clauses of the target built by query
+    builder, could be an empty string.
+    """
+    groups = []
+    fill = None
+    for group in target.get("groupBy", []):
+        params = group.get("params", [])
+        if group["type"] == "time":
+            interval = params[0]
+            if interval == "auto":
+                interval = "$__interval"
+            groups.append("time(%s)" % interval)
+        elif group["type"] == "tag":
+            groups.append('"%s"' % params[0])
+        elif group["type"] == "fill":
+            fill = "fill(%s)" % params[0]
+    clauses = ""
+    if len(groups) > 0:
+        clauses += " GROUP BY " + ", ".join(groups)
+    if fill is not None:
+        clauses += " " + fill
+    return clauses
+
+
+def builder_target_query(target):
+    """
+    Return the InfluxQL query that Grafana generates from the target built
+    by query builder.
+    """
+    query = (builder_target_select(target) + " " +
+             builder_target_where(target) +
+             builder_target_group_by(target))
+    for key in ["limit", "slimit"]:
+        if target.get(key):
+            query += " %s %s" % (key.upper(), target[key])
+    return query
+
+
+def target_query(target):
+    """
+    Return the InfluxQL query of the target, either raw query or built by
+    query builder. Return "" if the target has no query.
+    """
+    if target.get("rawQuery", False):
+        return target.get("query", "").strip()
+    if "measurement" in target:
+        return builder_target_query(target)
+    return ""
+
+
+def dashboard_queries(dashboard):
+    """
+    Yield (panel, target, query) of all the targets, including the targets
+    built by query builder.
+    """
+    for panel in dashboard_panels(dashboard):
+        if "targets" not in panel:
+            continue
+        for target in panel["targets"]:
+            query = target_query(target)
+            if query == "":
+                continue
+            yield panel, target, query
+
+
+def panel_add_note(panel, note):
+    """
+    Append a note to the description of the panel.
+    """
+    description = panel.get("description", "")
+    if description != "":
+        description += "\n\n"
+    panel["description"] = description + note
+
+
+def dashboard_note_exp_sampling(dashboard, shards, shard):
+    """
+    Tell in the panels of exp_* metrics that only a shard of the clients
+    are collected. Return the number of changed panels.
+    """
+    note = ("Only the clients whose NIDs end with a number N that "
+            "N %% %d == %d are collected." % (shards, shard))
+    changed = 0
+    for panel in dashboard_panels(dashboard):
+        if "targets" not in panel:
+            continue
+        sampled = False
+        for target in panel["targets"]:
+            if "exp_" in target.get("measurement", ""):
+                sampled = True
+            elif "exp_" in target.get("query", ""):
+                sampled = True
+        if not sampled:
+            continue
+        panel_add_note(panel, note)
+        title = panel.get("title", "")
+        if title != "":
+            panel["title"] = title + " (sampled 1/%d)" % shards
+        changed += 1
+    return changed
+
+
+def influxql_query_shard_safe(query):
+    """
+    Whether the results of the query on the shards can be shown together
+    as the result of the whole system. That is true only if each series in
+    the result comes from the agents of a single shard, e.g. the series
+    are grouped by host, or the query selects a single host. Otherwise,
+    Grafana would show a partial result of each shard instead of a merged
+    one, e.g. the sums of a file system or the top N jobs.
+    """
+    influxql_query = InfluxqlQuery(query)
+    if not influxql_query.iq_parsed:
+        return False
+    if INFLUXQL_LIMIT_PATTERN.search(influxql_query.iq_tail):
+        return False
+    for function in influxql_query.iq_functions():
+        if function in INFLUXQL_SELECTOR_FUNCTIONS:
+            return False
+    if "*" in influxql_query.iq_group_tags:
+        return not influxql_query.iq_measurement.startswith(INFLUXQL_CQ_MEASUREMENT_PREFIX)
+    # The tags that the series of the result each have a single value of
+    tags = set(influxql_query.iq_group_tags)
+    for condition in influxql_query.iq_conditions:
+        match = INFLUXQL_SINGLE_VALUE_PATTERN.match(condition)
+        if match is not None:
+            tags.add(match.group("tag"))
+    if INFLUXQL_HOST_TAG in tags:
+        return True
+    if "fs_name" not in tags:
+        return False
+    for tag in INFLUXQL_TARGET_TAGS:
+        if tag in tags:
+            return True
+    return False
+
+
+def panel_shard_safe(panel):
+    """
+    Whether all the targets of the panel are safe to be queried on every
+    shard.
+    """
+    for target in panel["targets"]:
+        query = target_query(target)
+        if query == "" or not influxql_query_shard_safe(query):
+            return False
+    return True
+
+
+def panel_shard_targets(panel, shard_datasource_names):
+    """
+    Change the panel to use the mixed datasource with the targets copied
+    for every shard.
+    """
+    targets = []
+    for target in panel["targets"]:
+        for index, shard_datasource_name in enumerate(shard_datasource_names):
+            shard_target = copy.deepcopy(target)
+            shard_target["datasource"] = shard_datasource_name
+            shard_target["refId"] = "%s%d" % (target.get("refId", "A"),
+                                              index)
+            targets.append(shard_target)
+    panel["targets"] = targets
+    panel["datasource"] = GRAFANA_DATASOURCE_MIXED
+
+
+def dashboard_shard(dashboard, datasource_name, shard_datasource_names):
+    """
+    Change the dashboard that uses a single datasource to query all the
+    shards. Grafana can not merge the series of different datasources, so
+    only the panels whose series each come from a single shard use the
+    mixed datasource with the targets copied for every shard. The other
+    panels query the shard selected by a datasource variable, which the
+    template variables use too, since they can not use the mixed
+    datasource. Return the number of panels that only show the selected
+    shard.
+    """
+    if "templating" not in dashboard:
+        dashboard["templating"] = {"list": []}
+    variables = dashboard["templating"]["list"]
+    for variable in variables:
+        if variable.get("type") != "query":
+            continue
+        if variable.get("datasource") in [None, datasource_name]:
+            variable["datasource"] = "$" + GRAFANA_SHARD_VARIABLE
+    regex = "|".join([re.escape(name) for name in shard_datasource_names])
+    default_name = shard_datasource_names[0]
+    shard_variable = {"type": "datasource",
+                      "name": GRAFANA_SHARD_VARIABLE,
+                      "label": "Shard",
+                      "query": "influxdb",
+                      "regex": "/^(%s)$/" % regex,
+                      "current": {"text": default_name,
+                                  "value": default_name},
+                      "hide": 0,
+                      "refresh": 1,
+                      "options": []}
+    variables.insert(0, shard_variable)
+
+    note = ("Only the data of the Barreleye server selected by the Shard "
+            "variable is shown, since the results of the servers can not "
+            "be merged.")
+    selected = 0
+    for panel in dashboard_panels(dashboard):
+        if "targets" not in panel:
+            continue
+        if panel.get("datasource") not in [None, datasource_name]:
+            continue
+        if not panel_shard_safe(panel):
+            panel["datasource"] = "$" + GRAFANA_SHARD_VARIABLE
+            panel_add_note(panel, note)
+            selected += 1
+            continue
+        panel_shard_targets(panel, shard_datasource_names)
+    return selected
+
+
+def continuous_query_interval(continuous_query, cq_interval):
+    """
+    Return the interval of the continuous query. The interval of the
+    continuous queries of the slow-moving metrics is multiplied.
+    """
+    return cq_interval * continuous_query.icq_interval_multiplier
+
+
+def influxql_query_cq_compatible(influxql_query, continuous_query,
+                                 cq_interval):
+    """
+    Whether the InfluxQL query could read the measurement of the continuous
+    query instead, i.e. it only selects the "value" field, aggregates it
+    only with the functions that work on the results of the continuous
+    query, and does not group by a time shorter than the interval of the
+    continuous query.
+    """
+    if not influxql_query.iq_parsed or not influxql_query.iq_where_parsed:
+        return False
+    field_keys = influxql_query.iq_field_keys()
+    if len(field_keys) == 0 or field_keys != ["value"] * len(field_keys):
+        return False
+    functions = influxql_query.iq_functions()
+    if (len(functions) > 0 and continuous_query.icq_function !=
+            barrele_influxdb.INFLUXDB_CQ_FUNCTION_MEAN):
+        return False
+    for function in functions:
+        if function not in CQ_COMPATIBLE_FUNCTIONS:
+            return False
+    if "*" in influxql_query.iq_group_tags:
+        return False
+    if influxql_query.iq_group_time is None:
+        return True
+    seconds = influxql_query.iq_group_time_seconds()
+    if seconds is None:
+        return False
+    # Auto interval is fine, since the min interval of the panel will be
+    # limited
+    interval = continuous_query_interval(continuous_query, cq_interval)
+    return not 0 < seconds < interval
+
+
+def continuous_query_matches(continuous_query, measurement, tags):
+    """
+    Whether the continuous query aggregates all points of the measurement
+    by exactly the tags.
+    """
+    return (continuous_query.icq_where == "" and
+            continuous_query.icq_measurement == measurement and
+            set(continuous_query.icq_groups) == tags)
+
+
+def find_covering_cq(influxql_query, continuous_queries, cq_interval):
+    """
+    Return the continuous query that covers the InfluxQL query. Return None
+    if no continuous query covers it.
+    """
+    if not influxql_query.iq_parsed or not influxql_query.iq_where_parsed:
+        return None
+    tags = set(influxql_query.iq_where_tags + influxql_query.iq_group_tags)
+    for continuous_query in continuous_queries:
+        if not continuous_query_matches(continuous_query,
+                                        influxql_query.iq_measurement, tags):
+            continue
+        if influxql_query_cq_compatible(influxql_query, continuous_query,
+                                        cq_interval):
+            return continuous_query
+    return None
+
+
+def panel_limit_min_interval(panel, cq_interval):
+    """
+    Make sure the min interval of the panel is not smaller than the interval
+    of the continuous queries.
+    """
+    if "interval" in panel and panel["interval"]:
+        interval = panel["interval"].lstrip(">")
+        seconds = duration_seconds(interval)
+        if seconds is not None and seconds >= cq_interval:
+            return
+    panel["interval"] = ">%ds" % cq_interval
+
+
+def dashboard_rewrite_cq_queries(log, title_name, dashboard,
+                                 continuous_queries, cq_interval):
+    """
+    Rewrite the queries of a dashboard to read the measurements of
+    continuous queries if the continuous queries cover the queries.
+    Return the number of rewritten queries.
+    """
+    rewritten = 0
+    for panel, target in dashboard_raw_targets(dashboard):
+        influxql_query = InfluxqlQuery(target["query"])
+        continuous_query = find_covering_cq(influxql_query,
+                                            continuous_queries,
+                                            cq_interval)
+        if continuous_query is None:
+            continue
+        query = influxql_query.iq_rewrite(continuous_query.icq_cq_measurement(),
+                                          "value", "sum")
+        log.cl_debug("rewriting query [%s] of dashboard [%s] to [%s]",
+                     target["query"], title_name, query)
+        target["query"] = query
+        interval = continuous_query_interval(continuous_query, cq_interval)
+        panel_limit_min_interval(panel, interval)
+        rewritten += 1
+    return rewritten
+
+
+class DashboardQueryLint():
+    """
+    The lint result of a query in a dashboard
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, dashboard_name, panel_title, query):
+        # Name of the dashboard
+        self.dql_dashboard_name = dashboard_name
+        # Title of the panel
+        self.dql_panel_title = panel_title
+        # The query string
+        self.dql_query = query
+        # A list of (issue, detail)
+        self.dql_issues = []
+        # The seconds that the query took on the server, None if unknown
+        self.dql_cost = None
+
+    def dql_add_issue(self, issue, detail):
+        """
+        Add an issue of the query
+        """
+        self.dql_issues.append((issue, detail))
+
+
+def influxql_lint_catalog(influxql_query, continuous_queries, catalog):
+    """
+    Return a list of (issue, detail) of a query by checking the measurement
+    and tags against the measurement catalog.
+    """
+    issues = []
+    measurement = influxql_query.iq_measurement
+    if not INFLUXQL_CATALOG_MEASUREMENT_PATTERN.match(measurement):
+        return issues
+    for continuous_query in continuous_queries:
+        if continuous_query.icq_cq_measurement() == measurement:
+            return issues
+    if measurement not in catalog:
+        issues.append((LINT_ISSUE_UNKNOWN_MEASUREMENT,
+                       "query reads measurement [%s] which no agent "
+                       "produces" % measurement))
+        return issues
+    tags = catalog[measurement].bm_tags
+    for tag in influxql_query.iq_where_tags + influxql_query.iq_group_tags:
+        if tag == "*" or tag in tags:
+            continue
+        issues.append((LINT_ISSUE_UNKNOWN_TAG,
+                       "query uses tag [%s] which measurement [%s] does not "
+                       "have" % (tag, measurement)))
+    return issues
+
+
+def influxql_lint_query(influxql_query, continuous_queries, cq_interval,
+                        rewritable=True, catalog=None):
+    """
+    Return a list of (issue, detail) of a query. If rewritable, the query
+    covered by continuous query will be rewritten when installing, thus is
+    not reported. If catalog is not None, check the measurement and tags
+    against the measurement catalog too.
+    """
+    # pylint: disable=too-many-branches
+    issues = []
+    if not influxql_query.iq_parsed:
+        issues.append((LINT_ISSUE_UNPARSED,
+                       "query can not be parsed"))
+        return issues
+
+    if (INFLUXQL_SELECT_ALL_PATTERN.search(influxql_query.iq_fields) or
+            "*" in influxql_query.iq_group_tags):
+        issues.append((LINT_ISSUE_SELECT_ALL,
+                       "query reads all fields or tags by wildcard"))
+
+    if not influxql_query.iq_has_time_filter:
+        issues.append((LINT_ISSUE_NO_TIME_FILTER,
+                       "query has no time filter in WHERE clause"))
+
+    limited = INFLUXQL_LIMIT_PATTERN.search(influxql_query.iq_tail) is not None
+    if not limited:
+        for tag in influxql_query.iq_group_tags:
+            if tag == "*" or tag in INFLUXQL_HIGH_CARDINALITY_TAGS:
+                issues.append((LINT_ISSUE_UNBOUNDED_GROUP_BY,
+                               "query groups by high cardinality tag [%s] "
+                               "without LIMIT or SLIMIT" % tag))
+
+    cq_measurements = []
+    for continuous_query in continuous_queries:
+        if continuous_query.icq_measurement != influxql_query.iq_measurement:
+            continue
+        cq_measurements.append(continuous_query.icq_cq_measurement())
+    if len(cq_measurements) > 0 and (not rewritable or
+                                     find_covering_cq(influxql_query,
+                                                      continuous_queries,
+                                                      cq_interval) is None):
+        issues.append((LINT_ISSUE_RAW_MEASUREMENT,
+                       "query reads raw measurement [%s] which has "
+                       "continuous query measurements %s" %
+                       (influxql_query.iq_measurement, cq_measurements)))
+    if catalog is not None:
+        issues += influxql_lint_catalog(influxql_query, continuous_queries,
+                                        catalog)
+    return issues
+
+
+def dashboard_lint(dashboard_name, dashboard, continuous_queries,
+                   cq_interval, catalog=None):
+    """
+    Return a list of DashboardQueryLint of the queries in a dashboard.
+    """
+    lints = []
+    for panel, target, query in dashboard_queries(dashboard):
+        lint = DashboardQueryLint(dashboard_name, panel.get("title", ""),
+                                  query)
+        influxql_query = InfluxqlQuery(query)
+        rewritable = target.get("rawQuery", False)
+        for issue, detail in influxql_lint_query(influxql_query,
+                                                 continuous_queries,
+                                                 cq_interval,
+                                                 rewritable=rewritable,
+                                                 catalog=catalog):
+            lint.dql_add_issue(issue, detail)
+        lints.append(lint)
+    return lints
+
+
+def influxql_explain_query(query, collect_interval, time_range):
+    """
+    Return the EXPLAIN ANALYZE query with Grafana variables replaced. The
+    tag variables are replaced to match all values, which is the worst
+    case of the panel.
+    """
+    query = query.replace("$timeFilter", "time > now() - %s" % time_range)
+    for variable in GRAFANA_INTERVAL_VARIABLES:
+        query = query.replace(variable, "%ss" % collect_interval)
+    query = INFLUXQL_VARIABLE_EQUAL_PATTERN.sub("=~ /.*/", query)
+    query = INFLUXQL_VARIABLE_REGEX_PATTERN.sub("=~ /.*/", query)
+    return "EXPLAIN ANALYZE " + query
+
+
+def go_duration_seconds(duration):
+    """
+    Return the seconds of a duration printed by Go, e.g. 1m2.5s or 18.3ms.
+    Return None if not a valid duration.
+    """
+    matches = GO_DURATION_PATTERN.findall(duration.strip())
+    if len(matches) == 0:
+        return None
+    seconds = 0
+    for number, unit in matches:
+        seconds += float(number) * GO_DURATION_SECONDS[unit]
+    return seconds
+
+
+def influxdb_explain_cost(log, influxdb_client, explain_query):
+    """
+    Run the EXPLAIN ANALYZE query and return the total seconds. Return
+    None on error.
+    """
+    # pylint: disable=bare-except
+    response = influxdb_client.bic_query(log, explain_query)
+    if response is None:
+        log.cl_error("failed to run query [%s]", explain_query)
+        return None
+    if response.status_code != HTTPStatus.OK:
+        log.cl_error("got status [%d] when running query [%s]",
+                     response.status_code, explain_query)
+        return None
+    try:
+        data = response.json()
+        lines = []
+        for result in data["results"]:
+            if "error" in result:
+                log.cl_error("got error [%s] when running query [%s]",
+                             result["error"], explain_query)
+                return None
+            for series in result.get("series", []):
+                for value in series["values"]:
+                    lines.append(value[0])
+    except:
+        log.cl_error("invalid response of query [%s]: %s",
+                     explain_query, traceback.format_exc())
+        return None
+
+    # Prefer total_time, use execution_time if Influxdb does not print it
+    for key in ["total_time", "execution_time"]:
+        for line in lines:
+            match = EXPLAIN_TIME_PATTERN.match(line)
+            if match is None or match.group("key") != key:
+                continue
+            seconds = go_duration_seconds(match.group("duration"))
+            if seconds is not None:
+                return seconds
+    log.cl_error("no execution time in the output of query [%s]",
+                 explain_query)
+    return None
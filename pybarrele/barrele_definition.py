@@ -0,0 +1,298 @@
+"""
+Library for checking the definition XML files of Collectd and extracting
+the measurements defined by them
+"""
+import ctypes
+import ctypes.util
+import json
+import re
+from xml.etree import ElementTree
+
+# The cflag of regcomp() to use POSIX Extended Regular Expression syntax,
+# which is used by Collectd when compiling the patterns
+REG_EXTENDED = 1
+# The valid name of a measurement or a tag
+DEFINITION_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# The key of the definition version in the index
+DEFINITION_INDEX_VERSION = "version"
+# The key of the measurements in the index
+DEFINITION_INDEX_MEASUREMENTS = "measurements"
+# The key of the tag keys of a measurement in the index
+DEFINITION_INDEX_TAGS = "tags"
+# The key of the Collectd types (e.g. gauge, derive) of a measurement
+DEFINITION_INDEX_TYPES = "types"
+# The key of the items that produce a measurement. Value is a dict, key is
+# item name, value is the number of the fields of the item that produce
+# the measurement.
+DEFINITION_INDEX_ITEMS = "items"
+
+
+class PosixRegex(ctypes.Structure):
+    """
+    The regex_t of glibc. Extra space is reserved at the end in case the
+    structure is larger on other platforms.
+    """
+    # pylint: disable=too-few-public-methods
+    _fields_ = [("buffer", ctypes.c_void_p),
+                ("allocated", ctypes.c_size_t),
+                ("used", ctypes.c_size_t),
+                ("syntax", ctypes.c_ulong),
+                ("fastmap", ctypes.c_void_p),
+                ("translate", ctypes.c_void_p),
+                ("re_nsub", ctypes.c_size_t),
+                ("reserved", ctypes.c_char * 64)]
+
+
+# The C library to compile POSIX regular expressions, None if not loaded
+LIBC = None
+
+
+def posix_regex_groups(pattern):
+    """
+    Compile the pattern by regcomp() of the C library, the same way as
+    Collectd does. Return (number of groups, None) on success, return
+    (None, error message) on failure.
+    """
+    # pylint: disable=global-statement
+    global LIBC
+    if LIBC is None:
+        LIBC = ctypes.CDLL(ctypes.util.find_library("c"))
+    regex = PosixRegex()
+    ret = LIBC.regcomp(ctypes.byref(regex), pattern.encode("utf-8"),
+                       REG_EXTENDED)
+    if ret:
+        error = ctypes.create_string_buffer(256)
+        LIBC.regerror(ret, ctypes.byref(regex), error, len(error))
+        return None, error.value.decode("utf-8", errors="replace")
+    groups = regex.re_nsub
+    LIBC.regfree(ctypes.byref(regex))
+    return groups, None
+
+
+def parse_tsdb_tags(tags_string):
+    """
+    Return a list of (key, value) of tags in string "key1=value1 key2=value2".
+    Return None if the string is invalid.
+    """
+    tags = []
+    for tag in tags_string.split():
+        fields = tag.split("=", 1)
+        if len(fields) != 2 or len(fields[0]) == 0:
+            return None
+        tags.append((fields[0], fields[1]))
+    return tags
+
+
+def field_options(field):
+    """
+    Return the dict of options of a field element.
+    """
+    options = {}
+    for option in field.findall("option"):
+        name = option.findtext("name")
+        if name is not None:
+            options[name] = option.findtext("string", default="")
+    return options
+
+
+class DefinitionChecker():
+    """
+    Check a definition XML and collect the measurements defined by it.
+    """
+    def __init__(self, source):
+        # The name of the definition in the error messages
+        self.dc_source = source
+        # The version of the definition
+        self.dc_version = None
+        # Key is measurement name, value is the list of tag keys
+        self.dc_measurement_tags = {}
+        # Key is measurement name, value is the set of Collectd types
+        self.dc_measurement_types = {}
+        # Key is measurement name, value is a dict with item name as key
+        # and the number of the fields of the item as value
+        self.dc_measurement_items = {}
+        # The list of error messages
+        self.dc_errors = []
+
+    def _dc_error(self, message, *args):
+        """
+        Record an error.
+        """
+        self.dc_errors.append(message % args)
+
+    def _dc_check_field(self, item_name, field, groups):
+        """
+        Check a field of an item.
+        """
+        index_string = field.findtext("index", default="")
+        try:
+            index = int(index_string)
+        except ValueError:
+            self._dc_error("item [%s] has invalid field index [%s]",
+                           item_name, index_string)
+            return
+        if groups is not None and (index < 1 or index > groups):
+            self._dc_error("field index [%d] of item [%s] is out of the "
+                           "[%d] groups of its pattern", index, item_name,
+                           groups)
+
+        options = field_options(field)
+        tsdb_name = options.get("tsdb_name")
+        if tsdb_name is None:
+            self._dc_error("field [%s] of item [%s] has no tsdb_name",
+                           field.findtext("name"), item_name)
+            return
+        if tsdb_name == "NA":
+            # Not sent to the TSDB
+            return
+        if not DEFINITION_NAME_PATTERN.match(tsdb_name):
+            self._dc_error("invalid tsdb_name [%s] of item [%s]",
+                           tsdb_name, item_name)
+            return
+
+        tags = parse_tsdb_tags(options.get("tsdb_tags", ""))
+        if tags is None:
+            self._dc_error("invalid tsdb_tags [%s] of item [%s]",
+                           options.get("tsdb_tags"), item_name)
+            return
+        tag_keys = [key for key, _ in tags]
+        for key in tag_keys:
+            if not DEFINITION_NAME_PATTERN.match(key):
+                self._dc_error("invalid tag [%s] of measurement [%s] in "
+                               "item [%s]", key, tsdb_name, item_name)
+        if len(set(tag_keys)) != len(tag_keys):
+            self._dc_error("duplicated tags %s of measurement [%s] in item "
+                           "[%s]", tag_keys, tsdb_name, item_name)
+        tag_keys = sorted(set(tag_keys))
+        if tsdb_name not in self.dc_measurement_tags:
+            self.dc_measurement_tags[tsdb_name] = tag_keys
+            self.dc_measurement_types[tsdb_name] = set()
+            self.dc_measurement_items[tsdb_name] = {}
+        elif self.dc_measurement_tags[tsdb_name] != tag_keys:
+            self._dc_error("measurement [%s] has tags %s in item [%s], but "
+                           "has tags %s elsewhere", tsdb_name, tag_keys,
+                           item_name, self.dc_measurement_tags[tsdb_name])
+        collectd_type = options.get("type", "")
+        if collectd_type != "":
+            self.dc_measurement_types[tsdb_name].add(collectd_type)
+        items = self.dc_measurement_items[tsdb_name]
+        items[item_name] = items.get(item_name, 0) + 1
+
+    def _dc_check_entry(self, entry):
+        """
+        Check the items of an entry.
+        """
+        item_names = []
+        for item in entry.findall("item"):
+            item_name = item.findtext("name", default="")
+            if item_name in item_names:
+                self._dc_error("duplicated item name [%s] in entry [%s]",
+                               item_name, entry.findtext("subpath/path"))
+            item_names.append(item_name)
+
+            pattern = item.findtext("pattern")
+            groups = None
+            if pattern is None:
+                self._dc_error("item [%s] has no pattern", item_name)
+            else:
+                groups, error = posix_regex_groups(pattern)
+                if groups is None:
+                    self._dc_error("invalid pattern [%s] of item [%s]: %s",
+                                   pattern, item_name, error)
+            for field in item.findall("field"):
+                self._dc_check_field(item_name, field, groups)
+
+    def _dc_check_math_entry(self, math_entry):
+        """
+        Check a math entry. The operands should have been defined and the
+        result has the tags of the left operand.
+        """
+        tsdb_name = math_entry.findtext("tsdb_name", default="")
+        operands = [math_entry.findtext("left_operand", default=""),
+                    math_entry.findtext("right_operand", default="")]
+        for operand in operands:
+            if operand not in self.dc_measurement_tags:
+                self._dc_error("operand [%s] of math entry [%s] is not "
+                               "defined", operand, tsdb_name)
+                return
+        if not DEFINITION_NAME_PATTERN.match(tsdb_name):
+            self._dc_error("invalid tsdb_name [%s] of math entry", tsdb_name)
+            return
+        self.dc_measurement_tags[tsdb_name] = \
+            self.dc_measurement_tags[operands[0]]
+        self.dc_measurement_types[tsdb_name] = \
+            set(self.dc_measurement_types[operands[0]])
+        # The result has a value for each value of the left operand, and
+        # is available only when the items of both operands are enabled
+        items = dict(self.dc_measurement_items[operands[0]])
+        for item_name in self.dc_measurement_items[operands[1]]:
+            if item_name not in items:
+                items[item_name] = 0
+        self.dc_measurement_items[tsdb_name] = items
+
+    def dc_check(self, data):
+        """
+        Check the XML data. Return the number of errors.
+        """
+        try:
+            root = ElementTree.fromstring(data)
+        except ElementTree.ParseError as error:
+            self._dc_error("invalid XML: %s", error)
+            return len(self.dc_errors)
+        if root.tag != "definition":
+            self._dc_error("unexpected root element [%s]", root.tag)
+            return len(self.dc_errors)
+        self.dc_version = root.findtext("version")
+        for entry in root.iter("entry"):
+            self._dc_check_entry(entry)
+        for math_entry in root.findall("math_entry"):
+            self._dc_check_math_entry(math_entry)
+        return len(self.dc_errors)
+
+    def dc_index(self):
+        """
+        Return the index of the measurements in this definition.
+        """
+        measurements = {}
+        for tsdb_name, tag_keys in self.dc_measurement_tags.items():
+            types = sorted(self.dc_measurement_types[tsdb_name])
+            items = self.dc_measurement_items[tsdb_name]
+            measurements[tsdb_name] = {DEFINITION_INDEX_TAGS: tag_keys,
+                                       DEFINITION_INDEX_TYPES: types,
+                                       DEFINITION_INDEX_ITEMS: items}
+        return {DEFINITION_INDEX_VERSION: self.dc_version,
+                DEFINITION_INDEX_MEASUREMENTS: measurements}
+
+
+def check_definition(log, xml_fpath):
+    """
+    Check the definition XML file. Return the DefinitionChecker, None on
+    error.
+    """
+    try:
+        with open(xml_fpath, "rb") as xml_file:
+            data = xml_file.read()
+    except OSError as error:
+        log.cl_error("failed to read definition file [%s]: %s",
+                     xml_fpath, error)
+        return None
+    checker = DefinitionChecker(xml_fpath)
+    if checker.dc_check(data):
+        for error in checker.dc_errors:
+            log.cl_error("definition file [%s]: %s", xml_fpath, error)
+        return None
+    return checker
+
+
+def load_definition_index(log, fpath):
+    """
+    Return the index of the measurements saved in the file. Key is the
+    fname of the definition XML file. None on error.
+    """
+    try:
+        with open(fpath, "r", encoding="utf-8") as index_file:
+            return json.load(index_file)
+    except (OSError, ValueError) as error:
+        log.cl_error("failed to load definition index [%s]: %s", fpath,
+                     error)
+        return None
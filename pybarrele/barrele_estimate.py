@@ -0,0 +1,393 @@
+"""
+Library for estimating the load that Barreleye agents put on Influxdb
+before enabling them. The series of each measurement are estimated from
+the measurement catalog, the items enabled in the Collectd config of each
+agent and the numbers of Lustre objects found on the agent hosts.
+"""
+import collections
+import concurrent.futures
+from pycoral import ssh_host
+from pybarrele import barrele_measurement
+
+# The number of objects that the items need on the host. Collectd finds
+# no file of the item if the host has no such object. The first matched
+# prefix of the item name is used.
+ESTIMATE_ITEM_PREFIX_OBJECTS = [("zfs_ost_", "zfs_osts"),
+                                ("zfs_mdt_", "zfs_mdts"),
+                                ("ost_acct", "ldiskfs_osts"),
+                                ("mdt_acct", "ldiskfs_mdts"),
+                                ("ost_", "osts"),
+                                ("mdt_", "mdts"),
+                                ("md_", "mdts"),
+                                ("client_", "clients")]
+# The tags that have a value for each object under a target. Key is tag,
+# value is the suffix of the survey name after the target type.
+ESTIMATE_TARGET_SUB_TAGS = collections.OrderedDict()
+ESTIMATE_TARGET_SUB_TAGS["exp_client"] = "exports"
+ESTIMATE_TARGET_SUB_TAGS["job_id"] = "jobs"
+ESTIMATE_TARGET_SUB_TAGS["user_id"] = "users"
+ESTIMATE_TARGET_SUB_TAGS["group_id"] = "groups"
+ESTIMATE_TARGET_SUB_TAGS["project_id"] = "projects"
+# The typical number of the rows in a histogram of brw_stats
+ESTIMATE_HISTOGRAM_ROWS = 12
+# The series of the disk plugin of Collectd for each line of
+# /proc/diskstats: disk_octets, disk_ops, disk_time, disk_merged and
+# disk_io_time have 2 values each, pending_operations has 1
+ESTIMATE_DISK_SERIES = 11
+# The name of the disk plugin in the estimate
+ESTIMATE_DISK_MEASUREMENT = "disk.*"
+# The bytes that Influxdb uses to save a point after compression. The
+# values of Collectd are floats, which usually takes 2-3 bytes in TSM.
+ESTIMATE_BYTES_PER_POINT = 3
+# The days that the free disk space of the server should be able to save.
+# The data is kept forever since no retention policy is configured.
+ESTIMATE_DISK_DAYS = 180
+# The hardware sizing guidelines of single node Influxdb. Each one is
+# (cores, memory in GiB, max points per second, max series).
+INFLUXDB_SIZINGS = [(8, 32, 750000, 10000000),
+                    (4, 8, 250000, 1000000),
+                    (0, 0, 5000, 100000)]
+# The command to survey the cores and memory of a server
+SERVER_SURVEY_COMMAND = ("nproc; awk '/^MemTotal:/ {print $2}' /proc/meminfo; "
+                         "d=%s; while [ ! -e \"$d\" ]; do d=$(dirname \"$d\"); "
+                         "done; df -Pk \"$d\" | awk 'NR == 2 {print $4}'")
+
+
+def survey_commands():
+    """
+    Return the commands to survey the number of objects on an agent host.
+    Key is the name of the number.
+    """
+    commands = collections.OrderedDict()
+    commands["osts"] = "lctl list_param 'obdfilter.*' 2>/dev/null | wc -l"
+    commands["mdts"] = "lctl list_param 'mdt.*' 2>/dev/null | wc -l"
+    commands["zfs_osts"] = "lctl list_param 'osd-zfs.*-OST*' 2>/dev/null | wc -l"
+    commands["zfs_mdts"] = "lctl list_param 'osd-zfs.*-MDT*' 2>/dev/null | wc -l"
+    commands["ldiskfs_osts"] = "lctl list_param 'osd-ldiskfs.*-OST*' 2>/dev/null | wc -l"
+    commands["ldiskfs_mdts"] = "lctl list_param 'osd-ldiskfs.*-MDT*' 2>/dev/null | wc -l"
+    commands["ost_exports"] = "lctl list_param 'obdfilter.*.exports.*@*' 2>/dev/null | wc -l"
+    commands["mdt_exports"] = "lctl list_param 'mdt.*.exports.*@*' 2>/dev/null | wc -l"
+    commands["ost_jobs"] = "lctl get_param -n 'obdfilter.*.job_stats' 2>/dev/null | grep -c job_id:"
+    commands["mdt_jobs"] = "lctl get_param -n 'mdt.*.job_stats' 2>/dev/null | grep -c job_id:"
+    for target in ["ost", "mdt"]:
+        for acct in ["user", "group", "project"]:
+            commands["%s_%ss" % (target, acct)] = \
+                ("lctl get_param -n 'osd-*.*-%s*.quota_slave.acct_%s' "
+                 "2>/dev/null | grep -c id:" % (target.upper(), acct))
+    commands["clients"] = "lctl list_param 'llite.*' 2>/dev/null | wc -l"
+    commands["ib_ports"] = "ls -d /sys/class/infiniband/*/ports/* 2>/dev/null | wc -l"
+    commands["disks"] = "cat /proc/diskstats 2>/dev/null | wc -l"
+    return commands
+
+
+def survey_command():
+    """
+    Return the command to survey the number of objects on agent host.
+    """
+    commands = []
+    for name, command in survey_commands().items():
+        commands.append("echo %s $(%s)" % (name, command))
+    return "; ".join(commands)
+
+
+def survey_parse(log, host, stdout):
+    """
+    Return the dict of the numbers in the output of the survey command.
+    Return None on error.
+    """
+    survey = {}
+    for line in stdout.splitlines():
+        fields = line.split()
+        if len(fields) != 2:
+            continue
+        try:
+            survey[fields[0]] = int(fields[1])
+        except ValueError:
+            log.cl_error("invalid line [%s] in the survey output of host "
+                         "[%s]", line, host.sh_hostname)
+            return None
+    for name in survey_commands():
+        if name not in survey:
+            log.cl_error("no [%s] in the survey output of host [%s]",
+                         name, host.sh_hostname)
+            return None
+    return survey
+
+
+def survey_agent_hosts(log, hosts):
+    """
+    Survey the number of objects on the hosts in parallel. Return a dict
+    with hostname as key and the dict of numbers as value. Return None on
+    error.
+    """
+    command = survey_command()
+    surveys = {}
+    host_results = []
+    for host, retval in ssh_host.run_on_hosts(log, hosts, command):
+        host_results.append((host, retval))
+        if retval.cr_exit_status or retval.cr_timeout:
+            continue
+        survey = survey_parse(log, host, retval.cr_stdout)
+        if survey is None:
+            return None
+        surveys[host.sh_hostname] = survey
+    ssh_host.log_host_results(log, command, host_results,
+                              quiet=True)
+    if len(surveys) != len(hosts):
+        log.cl_error("failed to survey [%d] agent hosts",
+                     len(hosts) - len(surveys))
+        return None
+    return surveys
+
+
+def item_has_objects(item, survey):
+    """
+    Whether the host has the objects that the item reads.
+    """
+    for prefix, name in ESTIMATE_ITEM_PREFIX_OBJECTS:
+        if item.startswith(prefix):
+            return survey[name] > 0
+    return True
+
+
+def measurement_objects(measurement, survey, exp_sample_shards):
+    """
+    Return the number of objects on the host that have values of the
+    measurement.
+    """
+    tags = measurement.bm_tags
+    if "ost_index" in tags:
+        target = "ost"
+    elif "mdt_index" in tags:
+        target = "mdt"
+    else:
+        target = None
+
+    if target is not None:
+        objects = survey[target + "s"]
+        for tag, suffix in ESTIMATE_TARGET_SUB_TAGS.items():
+            if tag in tags:
+                objects = survey[target + "_" + suffix]
+                if tag == "exp_client":
+                    # Each agent only collects one shard of the exports
+                    objects = -(-objects // exp_sample_shards)
+                break
+    elif "client_uuid" in tags:
+        objects = survey["clients"]
+    elif "port_number" in tags:
+        objects = survey["ib_ports"]
+    else:
+        objects = 1
+    if "size" in tags:
+        objects *= ESTIMATE_HISTOGRAM_ROWS
+    return objects
+
+
+class MeasurementEstimate():
+    """
+    The estimated load of a measurement
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, name):
+        # Name of the measurement
+        self.mee_name = name
+        # The number of series
+        self.mee_series = 0
+        # The number of points per second
+        self.mee_points_per_second = 0
+
+    def mee_daily_bytes(self):
+        """
+        Return the bytes added to Influxdb each day
+        """
+        return self.mee_points_per_second * 86400 * ESTIMATE_BYTES_PER_POINT
+
+
+class ServerEstimate(MeasurementEstimate):
+    """
+    The estimated load of a Barreleye server and its sizing
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, server):
+        super().__init__(server.bes_server_host.sh_hostname)
+        # The server, type: BarreleServer
+        self.see_server = server
+        # The number of agents that send data to the server
+        self.see_agents = 0
+        # The number of CPU cores, None if unknown
+        self.see_cores = None
+        # The memory size in KiB, None if unknown
+        self.see_memory_kb = None
+        # The free disk space of the data path in KiB, None if unknown
+        self.see_disk_free_kb = None
+
+    def see_survey(self, log):
+        """
+        Get the cores, memory and free disk space of the server.
+        """
+        server = self.see_server
+        host = server.bes_server_host
+        command = SERVER_SURVEY_COMMAND % server.bes_data_path
+        retval = host.sh_run(log, command)
+        if retval.cr_exit_status:
+            log.cl_error("failed to run command [%s] on host [%s], "
+                         "ret = [%d], stdout = [%s], stderr = [%s]",
+                         command,
+                         host.sh_hostname,
+                         retval.cr_exit_status,
+                         retval.cr_stdout,
+                         retval.cr_stderr)
+            return -1
+        lines = retval.cr_stdout.split()
+        try:
+            self.see_cores, self.see_memory_kb, self.see_disk_free_kb = \
+                [int(line) for line in lines]
+        except ValueError:
+            log.cl_error("unexpected output [%s] of command [%s] on host "
+                         "[%s]", retval.cr_stdout, command, host.sh_hostname)
+            return -1
+        return 0
+
+    def see_check_sizing(self, log):
+        """
+        Warn if the server can not absorb the load. Return the number of
+        warnings.
+        """
+        warnings = 0
+        memory_gib = self.see_memory_kb / 1024 / 1024
+        for cores, memory, max_points, max_series in INFLUXDB_SIZINGS:
+            if self.see_cores >= cores and memory_gib >= memory:
+                break
+        if self.mee_points_per_second > max_points:
+            log.cl_warning("server [%s] with [%d] cores and [%.1f] GiB "
+                           "memory can write about [%d] points per second, "
+                           "but [%.1f] are estimated",
+                           self.mee_name, self.see_cores, memory_gib,
+                           max_points, self.mee_points_per_second)
+            warnings += 1
+        if self.mee_series > max_series:
+            log.cl_warning("server [%s] with [%d] cores and [%.1f] GiB "
+                           "memory can index about [%d] series, but [%d] "
+                           "are estimated",
+                           self.mee_name, self.see_cores, memory_gib,
+                           max_series, self.mee_series)
+            warnings += 1
+        needed_kb = self.mee_daily_bytes() * ESTIMATE_DISK_DAYS / 1024
+        if needed_kb > self.see_disk_free_kb:
+            log.cl_warning("server [%s] has [%d] KiB free space under [%s], "
+                           "which is less than the [%d] KiB needed by "
+                           "[%d] days of data",
+                           self.mee_name, self.see_disk_free_kb,
+                           self.see_server.bes_data_path, needed_kb,
+                           ESTIMATE_DISK_DAYS)
+            warnings += 1
+        return warnings
+
+
+def measurement_series(measurement, items, collectd_config, survey,
+                       exp_sample_shards):
+    """
+    Return (series, points per second) of a measurement on an agent with
+    the enabled items.
+    """
+    objects = measurement_objects(measurement, survey, exp_sample_shards)
+    series = 0
+    points_per_second = 0
+    for item, fields in measurement.bm_items.items():
+        if item not in items or not item_has_objects(item, survey):
+            continue
+        item_series = fields * objects
+        series += item_series
+        interval = collectd_config.cdc_effective_item_interval(item)
+        points_per_second += item_series / float(interval)
+    return series, points_per_second
+
+
+def agent_estimate(catalog, agent, collectd_config, survey,
+                   exp_sample_shards):
+    """
+    Return a list of (name, series, points per second) of an agent.
+    """
+    items = set()
+    for config in collectd_config.cdc_filedatas.values():
+        enabled_items, _ = barrele_measurement.filedata_config_items(config)
+        items |= enabled_items
+
+    estimates = []
+    for name, measurement in catalog.items():
+        series, points_per_second = \
+            measurement_series(measurement, items, collectd_config, survey,
+                               exp_sample_shards)
+        if series > 0:
+            estimates.append((name, series, points_per_second))
+
+    if agent.bea_enable_disk:
+        series = survey["disks"] * ESTIMATE_DISK_SERIES
+        interval = collectd_config.cdc_effective_plugin_interval("disk")
+        estimates.append((ESTIMATE_DISK_MEASUREMENT, series,
+                          series / float(interval)))
+    return estimates
+
+
+def estimate_load(log, barreleye_instance):
+    """
+    Estimate the load of all agents. Return (list of MeasurementEstimate,
+    list of ServerEstimate), (None, None) on error.
+    """
+    # pylint: disable=too-many-locals
+    catalog = \
+        barrele_measurement.measurement_catalog(log,
+                                                barreleye_instance.bei_jobstat_pattern)
+    if catalog is None:
+        log.cl_error("failed to get the measurement catalog")
+        return None, None
+
+    agents = list(barreleye_instance.bei_agent_dict.values())
+    hosts = [agent.bea_host for agent in agents]
+    surveys = survey_agent_hosts(log, hosts)
+    if surveys is None:
+        log.cl_error("failed to survey the objects on agent hosts")
+        return None, None
+
+    max_workers = max(1, min(ssh_host.RUN_ON_HOSTS_PARALLELISM, len(agents)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(agent.bea_estimate_collectd_config, log,
+                                   barreleye_instance)
+                   for agent in agents]
+        collectd_configs = [future.result() for future in futures]
+
+    measurement_estimates = {}
+    server_estimates = collections.OrderedDict()
+    for server in barreleye_instance.bei_barreleye_servers:
+        server_estimates[server.bes_server_host.sh_hostname] = \
+            ServerEstimate(server)
+    shards = barreleye_instance.bei_lustre_exp_sample_shards
+    for agent, collectd_config in zip(agents, collectd_configs):
+        hostname = agent.bea_host.sh_hostname
+        if collectd_config is None:
+            log.cl_error("failed to generate Collectd config of agent [%s]",
+                         hostname)
+            return None, None
+        server_hostname = agent.bea_barreleye_server.bes_server_host.sh_hostname
+        server_estimate = server_estimates[server_hostname]
+        server_estimate.see_agents += 1
+        for name, series, points_per_second in \
+                agent_estimate(catalog, agent, collectd_config,
+                               surveys[hostname], shards):
+            if name not in measurement_estimates:
+                measurement_estimates[name] = MeasurementEstimate(name)
+            measurement_estimate = measurement_estimates[name]
+            for estimate in [measurement_estimate, server_estimate]:
+                estimate.mee_series += series
+                estimate.mee_points_per_second += points_per_second
+
+    for server_estimate in server_estimates.values():
+        ret = server_estimate.see_survey(log)
+        if ret:
+            log.cl_error("failed to survey Barreleye server [%s]",
+                         server_estimate.mee_name)
+            return None, None
+    estimates = list(measurement_estimates.values())
+    estimates.sort(key=lambda estimate: estimate.mee_points_per_second,
+                   reverse=True)
+    return estimates, list(server_estimates.values())
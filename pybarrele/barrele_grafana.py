@@ -0,0 +1,97 @@
+"""
+Library for access Grafana through HTTP API
+"""
+import traceback
+from http import HTTPStatus
+import requests
+from requests.adapters import HTTPAdapter
+
+# The number of connections to keep in the pool of the session
+GRAFANA_POOL_SIZE = 16
+
+
+class BarreleGrafanaClient():
+    """
+    The client object holds the information and a pooled HTTP session
+    necessary to connect to Grafana. The session is shared by all the
+    requests so that the connections can be reused.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, hostname, port, login, password,
+                 pool_size=GRAFANA_POOL_SIZE):
+        self.bgc_hostname = hostname
+        self.bgc_port = port
+        self.bgc_baseurl = "http://%s:%s" % (hostname, port)
+        self.bgc_headers = {
+            "Content-type": "application/json",
+            "Accept": "application/json"
+        }
+        self.bgc_session = requests.Session()
+        self.bgc_session.auth = (login, password)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.bgc_session.mount("http://", adapter)
+
+    def bgc_request(self, log, method, api_path, data=None, quiet=False):
+        """
+        Send a request to Grafana. Return the response, or None on error.
+        """
+        # pylint: disable=bare-except
+        url = self.bgc_baseurl + api_path
+        try:
+            response = self.bgc_session.request(method=method, url=url,
+                                                json=data,
+                                                headers=self.bgc_headers)
+        except:
+            if quiet:
+                log.cl_debug("got exception when sending [%s] request to "
+                             "[%s]: %s", method, url,
+                             traceback.format_exc())
+            else:
+                log.cl_error("got exception when sending [%s] request to "
+                             "[%s]: %s", method, url,
+                             traceback.format_exc())
+            return None
+        return response
+
+    def bgc_get(self, log, api_path, quiet=False):
+        """
+        Send a GET request to Grafana.
+        """
+        return self.bgc_request(log, "GET", api_path, quiet=quiet)
+
+    def bgc_post(self, log, api_path, data):
+        """
+        Send a POST request to Grafana.
+        """
+        return self.bgc_request(log, "POST", api_path, data=data)
+
+    def bgc_delete(self, log, api_path):
+        """
+        Send a DELETE request to Grafana.
+        """
+        return self.bgc_request(log, "DELETE", api_path)
+
+    def bgc_search_dashboards(self, log):
+        """
+        Search all dashboards with a single request. Return a dict with
+        title as key and a list of search items as value. Return None on
+        error.
+        """
+        response = self.bgc_get(log, "/api/search?type=dash-db")
+        if response is None:
+            log.cl_error("failed to search dashboards of Grafana")
+            return None
+        if response.status_code != HTTPStatus.OK:
+            log.cl_error("got status [%d] when searching dashboards of "
+                         "Grafana", response.status_code)
+            return None
+        dashboard_dict = {}
+        for item in response.json():
+            if item["type"] != "dash-db":
+                continue
+            title = item["title"]
+            if title not in dashboard_dict:
+                dashboard_dict[title] = []
+            dashboard_dict[title].append(item)
+        return dashboard_dict
@@ -3,6 +3,19 @@ Library for access Influxdb through HTTP API
 """
 import traceback
 import requests
+from pybarrele import barrele_constant
+
+# The common prefix of Influxdb continuous query
+INFLUXDB_CQ_PREFIX = "cq_"
+# The common prefix of Influxdb continuous query measurement
+INFLUXDB_CQ_MEASUREMENT_PREFIX = "cqm_"
+# The continuous query sums the points of each group and divides the sum by
+# the periods, i.e. the total value of the series in each interval
+INFLUXDB_CQ_FUNCTION_SUM = "sum"
+# The continuous query averages the points of each group. Only used when
+# each group is a single series of a gauge, so that the result does not
+# depend on how many points the series has in each interval.
+INFLUXDB_CQ_FUNCTION_MEAN = "mean"
 
 
 class BarreleInfluxdbClient():
@@ -24,13 +37,17 @@ class BarreleInfluxdbClient():
         }
         self.bic_session = requests.Session()
 
-    def bic_query(self, log, query, epoch=None):
+    def bic_query(self, log, query, epoch=None, chunk_size=None):
         """
         Send a query to InfluxDB.
         :param epoch: response timestamps to be in epoch format either 'h',
             'm', 's', 'ms', 'u', or 'ns',defaults to `None` which is
             RFC3339 UTC format with nanosecond precision
         :type epoch: str
+        :param chunk_size: if not `None`, ask InfluxDB to return the points
+            in chunks of this size. The response is streamed and each line
+            of it is a JSON result of a chunk.
+        :type chunk_size: int
         """
         # pylint: disable=bare-except
         params = {}
@@ -40,12 +57,19 @@ class BarreleInfluxdbClient():
         if epoch is not None:
             params['epoch'] = epoch
 
+        stream = False
+        if chunk_size is not None:
+            params['chunked'] = 'true'
+            params['chunk_size'] = chunk_size
+            stream = True
+
         log.cl_debug("querying [%s] to [%s]", query, self.bic_queryurl)
         try:
             response = self.bic_session.request(method='GET',
                                                 url=self.bic_queryurl,
                                                 params=params,
-                                                headers=self.bic_headers)
+                                                headers=self.bic_headers,
+                                                stream=stream)
         except:
             log.cl_error("got exception with query [%s]: %s", query,
                          traceback.format_exc())
@@ -59,10 +83,238 @@ class InfluxdbContinuousQuery():
     Information about a countinous query
     """
     # pylint: disable=too-few-public-methods
-    def __init__(self, measurement, groups, where=""):
+    def __init__(self, measurement, groups, where="",
+                 function=INFLUXDB_CQ_FUNCTION_SUM, interval_multiplier=1):
         # Name of the measurement
         self.icq_measurement = measurement
-        # List of group names
-        self.icq_groups = groups
+        # List of group names. Sort the groups so that we will get a unique
+        # cq name for the same groups
+        self.icq_groups = sorted(groups)
         # where query
         self.icq_where = where
+        # INFLUXDB_CQ_FUNCTION_*
+        self.icq_function = function
+        # The times that the measurement is collected less often than the
+        # collect interval. The interval of the continuous query is
+        # multiplied by it too.
+        self.icq_interval_multiplier = interval_multiplier
+
+    def icq_name(self):
+        """
+        Return the name of the continuous query
+        """
+        cq_name = INFLUXDB_CQ_PREFIX + self.icq_measurement
+        for group in self.icq_groups:
+            cq_name += "_%s" % group
+        return cq_name
+
+    def icq_cq_measurement(self):
+        """
+        Return the measurement that the continuous query writes into
+        """
+        cq_measurement = INFLUXDB_CQ_MEASUREMENT_PREFIX + self.icq_measurement
+        for group in self.icq_groups:
+            cq_measurement += "-%s" % group
+        return cq_measurement
+
+
+def barrele_continuous_queries(log, jobstat_pattern,
+                               slow_interval_multiplier=1):
+    """
+    Return the list of InfluxdbContinuousQuery that Barreleye creates.
+    The kbytesinfo and filesinfo are collected at the slow interval, thus
+    the intervals of their continuous queries are multiplied by
+    slow_interval_multiplier.
+    """
+    # pylint: disable=too-many-statements
+    continuous_queries = []
+    continuous_query = InfluxdbContinuousQuery("mdt_acctuser_samples",
+                                               ["fs_name", "optype",
+                                                "user_id"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("mdt_acctgroup_samples",
+                                               ["fs_name", "group_id",
+                                                "optype"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("mdt_acctproject_samples",
+                                               ["fs_name", "optype",
+                                                "project_id"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("ost_acctuser_samples",
+                                               ["fs_name", "optype",
+                                                "user_id"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("ost_acctgroup_samples",
+                                               ["fs_name", "optype",
+                                                "group_id"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("ost_acctproject_samples",
+                                               ["fs_name", "optype",
+                                                "project_id"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("exp_md_stats",
+                                               ["exp_client", "fs_name"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("mdt_jobstats_samples",
+                                               ["fs_name", "job_id"])
+    continuous_queries.append(continuous_query)
+
+    if (jobstat_pattern ==
+            barrele_constant.BARRELE_JOBSTAT_PATTERN_PROCNAME_UID):
+        continuous_query = InfluxdbContinuousQuery("mdt_jobstats_samples",
+                                                   ["fs_name", "uid"])
+        continuous_queries.append(continuous_query)
+    elif (jobstat_pattern ==
+          barrele_constant.BARRELE_JOBSTAT_PATTERN_UID_GID):
+        continuous_query = InfluxdbContinuousQuery("mdt_jobstats_samples",
+                                                   ["fs_name", "uid"])
+        continuous_queries.append(continuous_query)
+        continuous_query = InfluxdbContinuousQuery("mdt_jobstats_samples",
+                                                   ["fs_name", "gid"])
+        continuous_queries.append(continuous_query)
+    elif (jobstat_pattern !=
+          barrele_constant.BARRELE_JOBSTAT_PATTERN_UNKNOWN):
+        log.cl_error("unknown jobstat pattern [%s] when creating "
+                     "continuous queries for MDT",
+                     jobstat_pattern)
+        return None
+    continuous_query = InfluxdbContinuousQuery("ost_stats_bytes",
+                                               ["fs_name", "optype",
+                                                "fqdn"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("ost_stats_bytes",
+                                               ["fs_name", "ost_index"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("ost_stats_bytes",
+                                               ["fs_name", "fqdn"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("ost_stats_bytes",
+                                               ["fs_name", "optype"])
+    continuous_queries.append(continuous_query)
+    continuous_query = \
+        InfluxdbContinuousQuery("ost_kbytesinfo_used",
+                                ["fs_name", "optype"],
+                                interval_multiplier=slow_interval_multiplier)
+    continuous_queries.append(continuous_query)
+    measure_meants = ["ost_brw_stats_page_discontiguous_rpc_samples",
+                      "ost_brw_stats_block_discontiguous_rpc_samples",
+                      "ost_brw_stats_fragmented_io_samples",
+                      "ost_brw_stats_io_in_flight_samples",
+                      "ost_brw_stats_io_time_samples",
+                      "ost_brw_stats_io_size_samples"]
+    for measure_meant in measure_meants:
+        continuous_query = \
+            InfluxdbContinuousQuery(measure_meant,
+                                    ["field", "fs_name", "size"])
+        continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                               ["fs_name", "job_id", "optype"])
+    continuous_queries.append(continuous_query)
+    where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
+    continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                               ["fs_name", "job_id"],
+                                               where=where)
+    continuous_queries.append(continuous_query)
+    where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
+    continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                               ["fs_name", "job_id",
+                                                "ost_index"],
+                                               where=where)
+    continuous_queries.append(continuous_query)
+    if (jobstat_pattern ==
+            barrele_constant.BARRELE_JOBSTAT_PATTERN_PROCNAME_UID):
+        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                                   ["fs_name", "uid",
+                                                    "optype"])
+        continuous_queries.append(continuous_query)
+        where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
+        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                                   ["fs_name", "uid"],
+                                                   where=where)
+        continuous_queries.append(continuous_query)
+        where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
+        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                                   ["fs_name", "uid",
+                                                    "ost_index"],
+                                                   where=where)
+        continuous_queries.append(continuous_query)
+    elif (jobstat_pattern ==
+          barrele_constant.BARRELE_JOBSTAT_PATTERN_UID_GID):
+        # UID
+        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                                   ["fs_name", "uid",
+                                                    "optype"])
+        continuous_queries.append(continuous_query)
+        where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
+        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                                   ["fs_name", "uid"],
+                                                   where=where)
+        continuous_queries.append(continuous_query)
+        where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
+        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                                   ["fs_name", "uid",
+                                                    "ost_index"],
+                                                   where=where)
+        continuous_queries.append(continuous_query)
+
+        # GID
+        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                                   ["fs_name", "gid",
+                                                    "optype"])
+        continuous_queries.append(continuous_query)
+        where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
+        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                                   ["fs_name", "gid"],
+                                                   where=where)
+        continuous_queries.append(continuous_query)
+        where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
+        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                                   ["fs_name", "gid",
+                                                    "ost_index"],
+                                                   where=where)
+        continuous_queries.append(continuous_query)
+    elif (jobstat_pattern !=
+          barrele_constant.BARRELE_JOBSTAT_PATTERN_UNKNOWN):
+        log.cl_error("unknown jobstat pattern [%s] when creating "
+                     "continuous queries for OST",
+                     jobstat_pattern)
+        return None
+    continuous_query = InfluxdbContinuousQuery("ost_brw_stats_rpc_bulk_samples",
+                                               ["field", "fs_name",
+                                                "size"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("exp_ost_stats_bytes",
+                                               ["fs_name", "exp_client",
+                                                "optype"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("md_stats",
+                                               ["fs_name"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("md_stats",
+                                               ["fs_name", "mdt_index"])
+    continuous_queries.append(continuous_query)
+    continuous_query = InfluxdbContinuousQuery("md_stats",
+                                               ["fs_name", "optype"])
+    continuous_queries.append(continuous_query)
+    for measurement in ["mdt_filesinfo_free", "mdt_filesinfo_used",
+                        "ost_kbytesinfo_free", "ost_kbytesinfo_used"]:
+        continuous_query = \
+            InfluxdbContinuousQuery(measurement, ["fs_name"],
+                                    interval_multiplier=slow_interval_multiplier)
+        continuous_queries.append(continuous_query)
+    # Used by the dashboards of space usage per OST/MDT. Each group is a
+    # single series, so average it instead of summing its points.
+    for measurement in ["ost_kbytesinfo_free", "ost_kbytesinfo_used",
+                        "ost_filesinfo_free", "ost_filesinfo_used"]:
+        continuous_query = \
+            InfluxdbContinuousQuery(measurement, ["fs_name", "ost_index"],
+                                    function=INFLUXDB_CQ_FUNCTION_MEAN,
+                                    interval_multiplier=slow_interval_multiplier)
+        continuous_queries.append(continuous_query)
+    for measurement in ["mdt_filesinfo_free", "mdt_filesinfo_used"]:
+        continuous_query = \
+            InfluxdbContinuousQuery(measurement, ["fs_name", "mdt_index"],
+                                    function=INFLUXDB_CQ_FUNCTION_MEAN,
+                                    interval_multiplier=slow_interval_multiplier)
+        continuous_queries.append(continuous_query)
+    return continuous_queries
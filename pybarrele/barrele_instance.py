@@ -2,16 +2,20 @@
 Library for Barreleye.
 Barreleye is a performance monitoring system for Lustre.
 """
+import bisect
+import hashlib
 from pycoral import utils
 from pycoral import lustre_version
 from pycoral import constant
 from pycoral import install_common
 from pycoral import ssh_host
-from pycoral import cmd_general
+from pycoral import host_range
+from pycoral import stage_timeline
 from pybarrele import barrele_constant
 from pybarrele import barrele_collectd
 from pybarrele import barrele_server
 from pybarrele import barrele_agent
+from pybarrele import barrele_relay
 
 # Default collect interval in seconds
 BARRELE_COLLECT_INTERVAL = 60
@@ -22,6 +26,10 @@ BARRELE_CONTINUOUS_QUERY_PERIODS = 4
 BARRELE_LUSTRE_FALLBACK_VERSION = lustre_version.LUSTRE_VERSION_NAME_2_12
 # Default dir of Barreleye data
 BARRELE_DATA_DIR = "/var/log/coral/barreleye_data"
+# The fname of the timeline of installation under workspace
+BARRELE_INSTALL_TIMELINE_FNAME = "install_timeline.json"
+# The number of points of each server on the consistent hash ring
+BARRELE_SERVER_RING_POINTS = 128
 
 
 class BarreleInstance():
@@ -33,7 +41,9 @@ class BarreleInstance():
                  logdir_is_default, iso_fpath, local_host, collect_interval,
                  continuous_query_periods, jobstat_pattern, lustre_fallback_version,
                  enable_lustre_exp_mdt, enable_lustre_exp_ost, host_dict,
-                 agent_dict, barreleye_server):
+                 agent_dict, barreleye_servers, relay_dict, plugin_intervals,
+                 item_intervals, slow_interval_multiplier,
+                 lustre_exp_sample_shards, lustre_exp_sample_shard):
         # pylint: disable=too-many-locals
         # Log to file for debugging
         self.bei_log_to_file = log_to_file
@@ -47,6 +57,15 @@ class BarreleInstance():
         self.bei_workspace = workspace
         # Collect interval of data points in seconds
         self.bei_collect_interval = collect_interval
+        # The configured intervals of Collectd plugins. Key is plugin
+        # name, value is interval in seconds.
+        self.bei_plugin_intervals = plugin_intervals
+        # The configured intervals of filedata items. Key is item type,
+        # value is interval in seconds.
+        self.bei_item_intervals = item_intervals
+        # The times that the slow-moving metrics are collected less often
+        # than the collect interval
+        self.bei_slow_interval_multiplier = slow_interval_multiplier
         # Continuous query periods of Influxdb
         self.bei_continuous_query_periods = continuous_query_periods
         # The jobstat pattern configured in Lustre
@@ -60,16 +79,28 @@ class BarreleInstance():
         # Whether Barreleye agents collect exp_ost_stats_* metrics from Lustre
         # OST.
         self.bei_enable_lustre_exp_ost = enable_lustre_exp_ost
+        # The number of shards that the clients are divided into when
+        # collecting exp_* metrics. 1 means collecting all clients.
+        self.bei_lustre_exp_sample_shards = lustre_exp_sample_shards
+        # The shard of the clients to collect exp_* metrics
+        self.bei_lustre_exp_sample_shard = lustre_exp_sample_shard
         # Diction of host. Key is hostname, value is SSHHost
         self.bei_host_dict = host_dict
         # Diction of agents. Key is hostname, value is BarreleAgent
         self.bei_agent_dict = agent_dict
+        # HostRangeSet of the agent hostnames
+        self.bei_agent_hostnames = host_range.host_range_set_from_names(agent_dict)
+        # Diction of relays. Key is hostname, value is BarreleRelay
+        self.bei_relay_dict = relay_dict
         # Local host to run commands
         self.bei_local_host = local_host
         # The dir of the ISO
         self.bei_iso_dir = constant.CORAL_ISO_DIR
-        # The server of barreleye
-        self.bei_barreleye_server = barreleye_server
+        # The servers of Barreleye, each one saves the data of a shard of
+        # the agents
+        self.bei_barreleye_servers = barreleye_servers
+        # The first server of Barreleye, which runs Grafana
+        self.bei_barreleye_server = barreleye_servers[0]
         # The Collectd RPM types. The RPM type is the minimum string
         # that yum could understand and find the RPM.
         # For example:
@@ -81,6 +112,8 @@ class BarreleInstance():
         self.bei_collectd_rpm_type_dict = None
         # ISO file path
         self.bei_iso_fpath = iso_fpath
+        # The timeline to record the time of installation stages
+        self.bei_timeline = stage_timeline.StageTimeline()
 
     def _bei_get_collectd_rpm_types(self, log):
         """
@@ -117,6 +150,55 @@ class BarreleInstance():
                          self.bei_local_host.sh_hostname)
         return 0
 
+    def _bei_install_cluster_add_hosts(self, install_cluster):
+        """
+        Add the agents, relays and servers to the installation cluster
+        """
+        need_backup_fpaths = []
+        send_fpath_dict = {}
+        send_fpath_dict[self.bei_config_fpath] = self.bei_config_fpath
+        agent_rpms = constant.CORAL_DEPENDENT_RPMS[:]
+        agent_rpms += barrele_constant.BARRELE_AGENT_DEPENDENT_RPMS
+        server_hostnames = [server.bes_server_host.sh_hostname
+                            for server in self.bei_barreleye_servers]
+        for agent in self.bei_agent_dict.values():
+            if agent.bea_host.sh_hostname in server_hostnames:
+                continue
+            rpms = agent_rpms + agent.bea_needed_collectd_rpm_types
+            install_cluster.cic_add_hosts([agent.bea_host],
+                                          [],
+                                          rpms,
+                                          send_fpath_dict,
+                                          need_backup_fpaths,
+                                          coral_reinstall=True)
+
+        for relay in self.bei_relay_dict.values():
+            relay_hostname = relay.bre_host.sh_hostname
+            if (relay_hostname in server_hostnames or
+                    relay_hostname in self.bei_agent_dict):
+                continue
+            install_cluster.cic_add_hosts([relay.bre_host],
+                                          [],
+                                          constant.CORAL_DEPENDENT_RPMS[:],
+                                          send_fpath_dict,
+                                          need_backup_fpaths,
+                                          coral_reinstall=True)
+
+        for server in self.bei_barreleye_servers:
+            server_host = server.bes_server_host
+            server_rpms = constant.CORAL_DEPENDENT_RPMS[:]
+            server_rpms += barrele_constant.BARRELE_SERVER_DEPENDENT_RPMS
+            if server_host.sh_hostname in self.bei_agent_dict:
+                agent_on_server = self.bei_agent_dict[server_host.sh_hostname]
+                server_rpms += barrele_constant.BARRELE_AGENT_DEPENDENT_RPMS
+                server_rpms += agent_on_server.bea_needed_collectd_rpm_types
+            install_cluster.cic_add_hosts([server_host],
+                                          [],
+                                          server_rpms,
+                                          send_fpath_dict,
+                                          need_backup_fpaths,
+                                          coral_reinstall=True)
+
     def _bei_cluster_install_rpms(self, log):
         """
         Install RPMs on the cluster
@@ -127,8 +209,11 @@ class BarreleInstance():
             log.cl_error("failed to get Collectd RPM types")
             return -1
 
+        timeline = self.bei_timeline
         for agent in self.bei_agent_dict.values():
-            ret = agent.bea_generate_configs(log, self)
+            ret = timeline.stl_run(log, "generate_agent_configs",
+                                   agent.bea_generate_configs, self,
+                                   hostname=agent.bea_host.sh_hostname)
             if ret:
                 log.cl_error("failed to detect the Lustre version on host [%s]",
                              agent.bea_host.sh_hostname)
@@ -137,41 +222,10 @@ class BarreleInstance():
         install_cluster = \
             install_common.CoralInstallationCluster(self.bei_workspace,
                                                     self.bei_local_host,
-                                                    self.bei_iso_dir)
-
-        need_backup_fpaths = []
-        send_fpath_dict = {}
-        send_fpath_dict[self.bei_config_fpath] = self.bei_config_fpath
-        agent_rpms = constant.CORAL_DEPENDENT_RPMS[:]
-        agent_rpms += barrele_constant.BARRELE_AGENT_DEPENDENT_RPMS
-        agent_on_server = None
-        for agent in self.bei_agent_dict.values():
-            if agent.bea_host.sh_hostname == self.bei_barreleye_server.bes_server_host.sh_hostname:
-                if agent_on_server is not None:
-                    log.cl_error("multiple agents for Barreleye server [%s]",
-                                 self.bei_barreleye_server.bes_server_host.sh_hostname)
-                    return -1
-                agent_on_server = agent
-                continue
-            rpms = agent_rpms + agent.bea_needed_collectd_rpm_types
-            install_cluster.cic_add_hosts([agent.bea_host],
-                                          [],
-                                          rpms,
-                                          send_fpath_dict,
-                                          need_backup_fpaths,
-                                          coral_reinstall=True)
+                                                    self.bei_iso_dir,
+                                                    timeline=timeline)
 
-        server_rpms = constant.CORAL_DEPENDENT_RPMS[:]
-        server_rpms += barrele_constant.BARRELE_SERVER_DEPENDENT_RPMS
-        if agent_on_server is not None:
-            server_rpms += barrele_constant.BARRELE_AGENT_DEPENDENT_RPMS
-            server_rpms += agent_on_server.bea_needed_collectd_rpm_types
-        install_cluster.cic_add_hosts([self.bei_barreleye_server.bes_server_host],
-                                      [],
-                                      server_rpms,
-                                      send_fpath_dict,
-                                      need_backup_fpaths,
-                                      coral_reinstall=True)
+        self._bei_install_cluster_add_hosts(install_cluster)
         ret = install_cluster.cic_install(log)
         if ret:
             log.cl_error("failed to install dependent RPMs on all hosts of "
@@ -179,26 +233,29 @@ class BarreleInstance():
             return -1
         return 0
 
-    def bei_cluster_install(self, log, erase_influxdb=False,
-                            drop_database=False):
+    def _bei_cluster_install(self, log, erase_influxdb=False,
+                             drop_database=False):
         """
         Install Barrele on all host (could include localhost).
         """
         # Gives a little bit time for canceling the command
         iso = self.bei_iso_fpath
-        if erase_influxdb:
-            log.cl_warning("data and metadata of Influxdb on host [%s] "
-                           "will be all erased",
-                           self.bei_barreleye_server.bes_server_host.sh_hostname)
-        if drop_database:
-            log.cl_warning("database [%s] of Influxdb on host [%s] will be "
-                           "dropped",
-                           barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME,
-                           self.bei_barreleye_server.bes_server_host.sh_hostname)
+        timeline = self.bei_timeline
+        for server in self.bei_barreleye_servers:
+            if erase_influxdb:
+                log.cl_warning("data and metadata of Influxdb on host [%s] "
+                               "will be all erased",
+                               server.bes_server_host.sh_hostname)
+            if drop_database:
+                log.cl_warning("database [%s] of Influxdb on host [%s] will "
+                               "be dropped",
+                               barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME,
+                               server.bes_server_host.sh_hostname)
         if iso is not None:
-            ret = install_common.sync_iso_dir(log, self.bei_workspace,
-                                              self.bei_local_host, iso,
-                                              self.bei_iso_dir)
+            ret = timeline.stl_run(log, "sync_iso_dir",
+                                   install_common.sync_iso_dir,
+                                   self.bei_workspace, self.bei_local_host,
+                                   iso, self.bei_iso_dir)
             if ret:
                 log.cl_error("failed to sync ISO files from [%s] to dir [%s] "
                              "on local host [%s]",
@@ -206,24 +263,48 @@ class BarreleInstance():
                              self.bei_local_host.sh_hostname)
                 return -1
 
-        ret = self._bei_cluster_install_rpms(log)
+        ret = timeline.stl_run(log, "install_rpms",
+                               self._bei_cluster_install_rpms)
         if ret:
             log.cl_error("failed to install RPMs in the cluster")
             return -1
 
+        # Reinstall the server running Grafana at last, so that all the
+        # Influxdb datasources are ready when the dashboards are created.
         server = self.bei_barreleye_server
-        ret = server.bes_server_reinstall(log, self,
-                                          erase_influxdb=erase_influxdb,
-                                          drop_database=drop_database)
-        if ret:
-            log.cl_error("failed to reinstall Barreleye server")
-            return -1
+        servers = self.bei_barreleye_servers[1:] + [server]
+        for shard_server in servers:
+            ret = timeline.stl_run(log, "reinstall_server",
+                                   shard_server.bes_server_reinstall, self,
+                                   erase_influxdb=erase_influxdb,
+                                   drop_database=drop_database,
+                                   reinstall_grafana=(shard_server is server))
+            if ret:
+                log.cl_error("failed to reinstall Barreleye server [%s]",
+                             shard_server.bes_server_host.sh_hostname)
+                return -1
+
+        record = timeline.stl_start("config_relays")
+        for relay in self.bei_relay_dict.values():
+            ret = timeline.stl_run(log, "config_relay",
+                                   relay.bre_config_relay, self,
+                                   hostname=relay.bre_host.sh_hostname)
+            if ret:
+                timeline.stl_finish(record, ret)
+                log.cl_error("failed to configure Barreleye relay")
+                return -1
+        timeline.stl_finish(record, 0)
 
+        record = timeline.stl_start("config_agents")
         for agent in self.bei_agent_dict.values():
-            ret = agent.bea_config_agent(log, self)
+            ret = timeline.stl_run(log, "config_agent",
+                                   agent.bea_config_agent, self,
+                                   hostname=agent.bea_host.sh_hostname)
             if ret:
+                timeline.stl_finish(record, ret)
                 log.cl_error("failed to configure Barreleye agent")
                 return -1
+        timeline.stl_finish(record, 0)
 
         log.cl_info("URL of the dashboards is [%s]",
                     server.bes_grafana_url())
@@ -235,52 +316,131 @@ class BarreleInstance():
                     server.bes_grafana_admin_password)
         return 0
 
+    def bei_cluster_install(self, log, erase_influxdb=False,
+                            drop_database=False):
+        """
+        Install Barrele on all host and report the time of the stages.
+        """
+        ret = self._bei_cluster_install(log, erase_influxdb=erase_influxdb,
+                                        drop_database=drop_database)
+        timeline_fpath = (self.bei_workspace + "/" +
+                          BARRELE_INSTALL_TIMELINE_FNAME)
+        self.bei_timeline.stl_report(log)
+        if self.bei_timeline.stl_dump(log, timeline_fpath) == 0:
+            log.cl_info("timeline of the installation is saved to file [%s]",
+                        timeline_fpath)
+        return ret
+
+    def bei_relay_run(self, log, hostname):
+        """
+        Run the relay on this host until killed
+        """
+        if hostname not in self.bei_relay_dict:
+            log.cl_error("host [%s] is not configured as Barreleye relay",
+                         hostname)
+            return -1
+        relay = self.bei_relay_dict[hostname]
+        relay.bre_run(log, int(self.bei_collect_interval))
+        return 0
+
+    def _bei_agents_systemctl(self, log, hostnames, operation,
+                              expected_states):
+        """
+        Run systemctl operation on the Collectd service of the agents in
+        parallel, and check the service ends in one of the expected states.
+        The hostnames is a HostRangeSet.
+        """
+        unknown_hostnames = hostnames - self.bei_agent_hostnames
+        if len(unknown_hostnames) > 0:
+            log.cl_error("hosts [%s] are not configured as Barreleye agent",
+                         unknown_hostnames)
+            return -1
+        hosts = [self.bei_agent_dict[hostname].bea_host
+                 for hostname in hostnames]
+
+        service_name = "collectd"
+        # The state is checked even if the operation fails, e.g. stopping
+        # a service that is not installed.
+        command = ("systemctl %s %s; systemctl is-active %s" %
+                   (operation, service_name, service_name))
+        host_results = []
+        failed_hostnames = []
+        for host, retval in ssh_host.run_on_hosts(log, hosts, command):
+            state = retval.cr_stdout.strip().split("\n")[-1]
+            if retval.cr_timeout or state not in expected_states:
+                failed_hostnames.append(host.sh_hostname)
+                # Make sure the failure is reported as an error
+                if retval.cr_exit_status == 0:
+                    retval.cr_exit_status = -1
+            else:
+                retval.cr_exit_status = 0
+            host_results.append((host, retval))
+        ssh_host.log_host_results(log, command, host_results, quiet=True)
+        if len(failed_hostnames) > 0:
+            log.cl_error("failed to %s [%s] service on [%d] agent hosts",
+                         operation, service_name, len(failed_hostnames))
+            return -1
+        log.cl_info("[%s] service is %s on [%d] agent hosts",
+                    service_name, expected_states[0], len(hosts))
+        return 0
+
     def bei_stop_agents(self, log, hostnames):
         """
         Stop agents
         """
-        for hostname in hostnames:
-            if hostname not in self.bei_agent_dict:
-                log.cl_error("host [%s] is not configured as Barreleye agent",
-                             hostname)
-                return -1
-            agent = self.bei_agent_dict[hostname]
-            ret = agent.bea_collectd_stop(log)
-            if ret:
-                log.cl_error("failed to stop Barreleye agent on host [%s]",
-                             hostname)
-                return -1
-        return 0
+        return self._bei_agents_systemctl(log, hostnames, "stop",
+                                          ["inactive", "unknown", "failed"])
 
     def bei_start_agents(self, log, hostnames):
         """
         Start agents
         """
-        for hostname in hostnames:
-            if hostname not in self.bei_agent_dict:
-                log.cl_error("host [%s] is not configured as Barreleye agent",
-                             hostname)
-                return -1
-            agent = self.bei_agent_dict[hostname]
-            ret = agent.bea_collectd_start(log)
-            if ret:
-                log.cl_error("failed to start Barreleye agent on host [%s]",
-                             hostname)
-                return -1
-        return 0
+        return self._bei_agents_systemctl(log, hostnames, "start",
+                                          ["active"])
 
 
-def parse_server_config(log, config, config_fpath, host_dict):
+class BarreleServerRing():
     """
-    Parse server config.
+    The consistent hash ring to assign the agents to the servers. Adding
+    or removing a server only moves the agents of a small part of the ring.
     """
-    server_config = utils.config_value(config, barrele_constant.BRL_SERVER)
-    if server_config is None:
-        log.cl_error("can NOT find [%s] in the config file, "
-                     "please correct file [%s]",
-                     barrele_constant.BRL_SERVER, config_fpath)
-        return None
+    # pylint: disable=too-few-public-methods
+    def __init__(self, servers, points=BARRELE_SERVER_RING_POINTS):
+        # Sorted list of (hash, index of server)
+        self.bsr_points = []
+        # The servers on the ring
+        self.bsr_servers = servers
+        for index, server in enumerate(servers):
+            hostname = server.bes_server_host.sh_hostname
+            for point in range(points):
+                key = ring_hash("%s-%d" % (hostname, point))
+                self.bsr_points.append((key, index))
+        self.bsr_points.sort()
+
+    def bsr_server(self, hostname):
+        """
+        Return the server that the agent is assigned to
+        """
+        key = ring_hash(hostname)
+        position = bisect.bisect(self.bsr_points, (key, len(self.bsr_servers)))
+        if position == len(self.bsr_points):
+            position = 0
+        return self.bsr_servers[self.bsr_points[position][1]]
 
+
+def ring_hash(string):
+    """
+    Return the hash of the string on the ring. Not using hash() since it
+    is randomized for each Python process.
+    """
+    return int(hashlib.md5(string.encode()).hexdigest()[:16], 16)
+
+
+def parse_server_config(log, server_config, config_fpath, host_dict,
+                        datasource_name):
+    """
+    Parse the config of a server.
+    """
     hostname = utils.config_value(server_config,
                                   barrele_constant.BRL_HOSTNAME)
     if hostname is None:
@@ -303,7 +463,103 @@ def parse_server_config(log, config, config_fpath, host_dict):
                                             ssh_identity_file)
     if host is None:
         return None
-    return barrele_server.BarreleServer(host, data_path)
+    if datasource_name is None:
+        datasource_name = (barrele_server.GRAFANA_DATASOURCE_NAME + "_" +
+                           hostname)
+    return barrele_server.BarreleServer(host, data_path,
+                                        datasource_name=datasource_name)
+
+
+def parse_servers_config(log, config, config_fpath, host_dict):
+    """
+    Parse the config of [server] or [[servers]]. Return the list of servers
+    and a diction of the agents explicitly assigned to the servers, key is
+    the hostname of agent, value is BarreleServer.
+    """
+    # pylint: disable=too-many-branches
+    server_config = utils.config_value(config, barrele_constant.BRL_SERVER)
+    server_configs = utils.config_value(config, barrele_constant.BRL_SERVERS)
+    if server_config is not None and server_configs is not None:
+        log.cl_error("both [%s] and [%s] are configured, please correct "
+                     "file [%s]", barrele_constant.BRL_SERVER,
+                     barrele_constant.BRL_SERVERS, config_fpath)
+        return None, None
+
+    if server_config is not None:
+        server = parse_server_config(log, server_config, config_fpath,
+                                     host_dict,
+                                     barrele_server.GRAFANA_DATASOURCE_NAME)
+        if server is None:
+            return None, None
+        return [server], {}
+
+    if server_configs is None or len(server_configs) == 0:
+        log.cl_error("can NOT find [%s] or [%s] in the config file, "
+                     "please correct file [%s]",
+                     barrele_constant.BRL_SERVER,
+                     barrele_constant.BRL_SERVERS, config_fpath)
+        return None, None
+
+    if len(server_configs) == 1:
+        datasource_name = barrele_server.GRAFANA_DATASOURCE_NAME
+    else:
+        datasource_name = None
+    servers = []
+    agent_server_dict = {}
+    for server_config in server_configs:
+        server = parse_server_config(log, server_config, config_fpath,
+                                     host_dict, datasource_name)
+        if server is None:
+            return None, None
+        for other in servers:
+            if other.bes_server_host is server.bes_server_host:
+                log.cl_error("server [%s] is configured for multiple times",
+                             server.bes_server_host.sh_hostname)
+                return None, None
+        servers.append(server)
+
+        hostname_config = utils.config_value(server_config,
+                                             barrele_constant.BRL_AGENT_HOSTNAMES)
+        if hostname_config is None:
+            continue
+        hostnames = host_range.parse_host_range_set(log, hostname_config)
+        if hostnames is None:
+            log.cl_error("[%s] as [%s] is invalid in the config file [%s]",
+                         hostname_config,
+                         barrele_constant.BRL_AGENT_HOSTNAMES,
+                         config_fpath)
+            return None, None
+        for hostname in hostnames:
+            if hostname in agent_server_dict:
+                log.cl_error("agent [%s] is assigned to multiple servers",
+                             hostname)
+                return None, None
+            agent_server_dict[hostname] = server
+    return servers, agent_server_dict
+
+
+def parse_intervals_config(log, config, option, config_fpath):
+    """
+    Parse the intervals that override the collect interval. Return a dict,
+    or None on error.
+    """
+    interval_config = utils.config_value(config, option)
+    if interval_config is None:
+        return {}
+    if not isinstance(interval_config, dict):
+        log.cl_error("invalid [%s] in the config file [%s], should be a "
+                     "table", option, config_fpath)
+        return None
+    intervals = {}
+    for name, interval in interval_config.items():
+        if (not isinstance(interval, int) or isinstance(interval, bool) or
+                interval <= 0):
+            log.cl_error("invalid interval [%s] of [%s] in [%s] of the config "
+                         "file [%s], should be a positive integer",
+                         interval, name, option, config_fpath)
+            return None
+        intervals[name] = interval
+    return intervals
 
 
 def barrele_init_instance(log, workspace, config, config_fpath, log_to_file,
@@ -321,6 +577,40 @@ def barrele_init_instance(log, workspace, config, config_fpath, log_to_file,
                      config_fpath, BARRELE_COLLECT_INTERVAL)
         collect_interval = BARRELE_COLLECT_INTERVAL
 
+    plugin_intervals = \
+        parse_intervals_config(log, config,
+                               barrele_constant.BRL_PLUGIN_INTERVALS,
+                               config_fpath)
+    if plugin_intervals is None:
+        return None
+
+    item_intervals = \
+        parse_intervals_config(log, config,
+                               barrele_constant.BRL_ITEM_INTERVALS,
+                               config_fpath)
+    if item_intervals is None:
+        return None
+
+    slow_interval_multiplier = \
+        utils.config_value(config,
+                           barrele_constant.BRL_SLOW_INTERVAL_MULTIPLIER)
+    if slow_interval_multiplier is None:
+        log.cl_debug("no [%s] is configured in the config file [%s], "
+                     "using default value [%s]",
+                     barrele_constant.BRL_SLOW_INTERVAL_MULTIPLIER,
+                     config_fpath,
+                     barrele_collectd.COLLECTD_SLOW_INTERVAL_MULTIPLIER)
+        slow_interval_multiplier = \
+            barrele_collectd.COLLECTD_SLOW_INTERVAL_MULTIPLIER
+    if (not isinstance(slow_interval_multiplier, int) or
+            isinstance(slow_interval_multiplier, bool) or
+            slow_interval_multiplier <= 0):
+        log.cl_error("invalid [%s] as [%s] in the config file [%s], should "
+                     "be a positive integer", slow_interval_multiplier,
+                     barrele_constant.BRL_SLOW_INTERVAL_MULTIPLIER,
+                     config_fpath)
+        return None
+
     continuous_query_periods = utils.config_value(config,
                                                   barrele_constant.BRL_CONTINUOUS_QUERY_PERIODS)
     if continuous_query_periods is None:
@@ -380,6 +670,41 @@ def barrele_init_instance(log, workspace, config, config_fpath, log_to_file,
                      config_fpath)
         enable_lustre_exp_ost = False
 
+    lustre_exp_sample_shards = \
+        utils.config_value(config,
+                           barrele_constant.BRL_LUSTRE_EXP_SAMPLE_SHARDS)
+    if lustre_exp_sample_shards is None:
+        log.cl_debug("no [%s] is configured in the config file [%s], "
+                     "using default value [1]",
+                     barrele_constant.BRL_LUSTRE_EXP_SAMPLE_SHARDS,
+                     config_fpath)
+        lustre_exp_sample_shards = 1
+    if lustre_exp_sample_shards not in barrele_collectd.EXP_SAMPLE_SHARD_NUMBERS:
+        log.cl_error("unsupported [%s] as [%s] in the config file [%s], "
+                     "supported: %s", lustre_exp_sample_shards,
+                     barrele_constant.BRL_LUSTRE_EXP_SAMPLE_SHARDS,
+                     config_fpath, barrele_collectd.EXP_SAMPLE_SHARD_NUMBERS)
+        return None
+
+    lustre_exp_sample_shard = \
+        utils.config_value(config,
+                           barrele_constant.BRL_LUSTRE_EXP_SAMPLE_SHARD)
+    if lustre_exp_sample_shard is None:
+        log.cl_debug("no [%s] is configured in the config file [%s], "
+                     "using default value [0]",
+                     barrele_constant.BRL_LUSTRE_EXP_SAMPLE_SHARD,
+                     config_fpath)
+        lustre_exp_sample_shard = 0
+    if (not isinstance(lustre_exp_sample_shard, int) or
+            isinstance(lustre_exp_sample_shard, bool) or
+            lustre_exp_sample_shard < 0 or
+            lustre_exp_sample_shard >= lustre_exp_sample_shards):
+        log.cl_error("invalid [%s] as [%s] in the config file [%s], should "
+                     "be an integer from 0 to %d", lustre_exp_sample_shard,
+                     barrele_constant.BRL_LUSTRE_EXP_SAMPLE_SHARD,
+                     config_fpath, lustre_exp_sample_shards - 1)
+        return None
+
     agent_configs = utils.config_value(config, barrele_constant.BRL_AGENTS)
     if agent_configs is None:
         log.cl_error("can NOT find [%s] in the config file, "
@@ -388,11 +713,55 @@ def barrele_init_instance(log, workspace, config, config_fpath, log_to_file,
         return None
 
     host_dict = {}
-    barreleye_server = parse_server_config(log, config, config_fpath,
-                                           host_dict)
-    if barreleye_server is None:
+    barreleye_servers, agent_server_dict = \
+        parse_servers_config(log, config, config_fpath, host_dict)
+    if barreleye_servers is None:
         log.cl_error("failed to parse server config")
         return None
+    server_ring = BarreleServerRing(barreleye_servers)
+
+    relay_dict = {}
+    # Key is hostname of agent, value is BarreleRelay
+    agent_relay_dict = {}
+    relay_configs = utils.config_value(config, barrele_constant.BRL_RELAYS)
+    if relay_configs is None:
+        relay_configs = []
+    for relay_config in relay_configs:
+        relay_hostname = utils.config_value(relay_config,
+                                            barrele_constant.BRL_HOSTNAME)
+        # The relay forwards to the server that the relay host would be
+        # assigned to, and so do the agents behind the relay.
+        if relay_hostname in agent_server_dict:
+            barreleye_server = agent_server_dict[relay_hostname]
+        elif relay_hostname is not None:
+            barreleye_server = server_ring.bsr_server(relay_hostname)
+        else:
+            barreleye_server = None
+        relay, agent_hostnames = \
+            barrele_relay.parse_relay_config(log, relay_config, config_fpath,
+                                             host_dict, barreleye_server)
+        if relay is None:
+            log.cl_error("failed to parse relay config")
+            return None
+        if relay_hostname in relay_dict:
+            log.cl_error("relay [%s] is configured for multiple times",
+                         relay_hostname)
+            return None
+        relay_dict[relay_hostname] = relay
+        for hostname in agent_hostnames:
+            if hostname in agent_relay_dict:
+                log.cl_error("agent [%s] is assigned to multiple relays",
+                             hostname)
+                return None
+            if (hostname in agent_server_dict and
+                    agent_server_dict[hostname] is not barreleye_server):
+                log.cl_error("agent [%s] is assigned to server [%s] but its "
+                             "relay [%s] forwards to server [%s]", hostname,
+                             agent_server_dict[hostname].bes_server_host.sh_hostname,
+                             relay_hostname,
+                             barreleye_server.bes_server_host.sh_hostname)
+                return None
+            agent_relay_dict[hostname] = relay
 
     agent_dict = {}
     for agent_config in agent_configs:
@@ -405,7 +774,7 @@ def barrele_init_instance(log, workspace, config, config_fpath, log_to_file,
                          config_fpath)
             return None
 
-        hostnames = cmd_general.parse_list_string(log, hostname_config)
+        hostnames = host_range.parse_host_range_set(log, hostname_config)
         if hostnames is None:
             log.cl_error("[%s] as [%s] is invalid in the config file [%s]",
                          hostname_config, barrele_constant.BRL_HOSTNAME,
@@ -460,6 +829,33 @@ def barrele_init_instance(log, workspace, config, config_fpath, log_to_file,
                          config_fpath)
             enable_lustre_oss = True
 
+        transport = utils.config_value(agent_config,
+                                       barrele_constant.BRL_TRANSPORT)
+        if transport is None:
+            log.cl_debug("no [%s] is configured in the config file [%s], "
+                         "using default value [%s]",
+                         barrele_constant.BRL_TRANSPORT,
+                         config_fpath,
+                         barrele_constant.BARRELE_TRANSPORT_OPENTSDB)
+            transport = barrele_constant.BARRELE_TRANSPORT_OPENTSDB
+        if transport not in barrele_constant.BARRELE_TRANSPORTS:
+            log.cl_error("invalid [%s] as [%s] in the config file [%s], "
+                         "should be one of %s", transport,
+                         barrele_constant.BRL_TRANSPORT, config_fpath,
+                         barrele_constant.BARRELE_TRANSPORTS)
+            return None
+
+        transport_kwargs = None
+        if transport == barrele_constant.BARRELE_TRANSPORT_HTTP:
+            transport_kwargs = \
+                barrele_relay.parse_relay_options(log, agent_config,
+                                                  hostname_config,
+                                                  config_fpath)
+            if transport_kwargs is None:
+                return None
+            if "port" not in transport_kwargs:
+                transport_kwargs["port"] = barrele_relay.RELAY_LOCAL_PORT
+
         for hostname in hostnames:
             if hostname in agent_dict:
                 log.cl_error("agent of host [%s] is configured for multiple times",
@@ -471,19 +867,61 @@ def barrele_init_instance(log, workspace, config, config_fpath, log_to_file,
             if host is None:
                 return None
 
+            relay = None
+            if hostname in agent_relay_dict:
+                relay = agent_relay_dict[hostname]
+                barreleye_server = relay.bre_barreleye_server
+            elif hostname in agent_server_dict:
+                barreleye_server = agent_server_dict[hostname]
+            else:
+                barreleye_server = server_ring.bsr_server(hostname)
+
+            if transport_kwargs is not None:
+                if relay is not None:
+                    log.cl_error("agent [%s] with [%s] transport is also "
+                                 "assigned to relay [%s]", hostname,
+                                 transport, relay.bre_host.sh_hostname)
+                    return None
+                if hostname in relay_dict:
+                    log.cl_error("agent [%s] with [%s] transport is also "
+                                 "configured as relay", hostname, transport)
+                    return None
+                relay = barrele_relay.BarreleRelay(host, barreleye_server,
+                                                   local=True,
+                                                   **transport_kwargs)
+                relay_dict[hostname] = relay
             agent = barrele_agent.BarreleAgent(host, barreleye_server,
                                                enable_disk=enable_disk,
                                                enable_lustre_oss=enable_lustre_oss,
                                                enable_lustre_mds=enable_lustre_mds,
                                                enable_lustre_client=enable_lustre_client,
-                                               enable_infiniband=enable_infiniband)
+                                               enable_infiniband=enable_infiniband,
+                                               relay=relay)
             agent_dict[hostname] = agent
 
+    for hostname, relay in agent_relay_dict.items():
+        if hostname not in agent_dict:
+            log.cl_error("host [%s] is assigned to relay [%s] but is not "
+                         "configured as Barreleye agent", hostname,
+                         relay.bre_host.sh_hostname)
+            return None
+
+    for hostname in agent_server_dict:
+        if hostname not in agent_dict:
+            log.cl_error("host [%s] is assigned to server [%s] but is not "
+                         "configured as Barreleye agent", hostname,
+                         agent_server_dict[hostname].bes_server_host.sh_hostname)
+            return None
+
     local_host = ssh_host.get_local_host()
     instance = BarreleInstance(workspace, config, config_fpath, log_to_file,
                                logdir_is_default, iso_fpath, local_host, collect_interval,
                                continuous_query_periods, jobstat_pattern,
                                lustre_fallback_version, enable_lustre_exp_mdt,
                                enable_lustre_exp_ost, host_dict,
-                               agent_dict, barreleye_server)
+                               agent_dict, barreleye_servers, relay_dict,
+                               plugin_intervals, item_intervals,
+                               slow_interval_multiplier,
+                               lustre_exp_sample_shards,
+                               lustre_exp_sample_shard)
     return instance
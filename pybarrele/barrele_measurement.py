@@ -0,0 +1,219 @@
+"""
+Library for the catalog of the measurements that Barreleye agents send to
+Influxdb. The catalog is generated from the index of the definition XML
+files and the filedata items that the Collectd config enables for each
+agent role.
+"""
+import re
+from pycoral import lustre_version
+from pybarrele import barrele_constant
+from pybarrele import barrele_collectd
+from pybarrele import barrele_definition
+
+# The tag added by Collectd to all data points
+MEASUREMENT_HOST_TAG = "fqdn"
+# The pattern of an ItemType block in filedata config
+FILEDATA_ITEM_TYPE_BLOCK_PATTERN = re.compile(r"^ *<ItemType>\n.*?^ *</ItemType>\n",
+                                              re.DOTALL | re.MULTILINE)
+# The pattern of the extra tags of the item in an ItemType block
+FILEDATA_TSDB_TAGS_PATTERN = re.compile(r'^ *TsdbTags "([^"]*)"', re.MULTILINE)
+# The arguments of the Lustre filedata config to enable each role
+LUSTRE_ROLE_ARGUMENTS = {barrele_constant.BARRELE_ROLE_LUSTRE: {},
+                         barrele_constant.BARRELE_ROLE_OSS:
+                         {"enable_lustre_oss": True},
+                         barrele_constant.BARRELE_ROLE_MDS:
+                         {"enable_lustre_mds": True},
+                         barrele_constant.BARRELE_ROLE_CLIENT:
+                         {"enable_lustre_client": True},
+                         barrele_constant.BARRELE_ROLE_EXP_OST:
+                         {"enable_lustre_exp_ost": True},
+                         barrele_constant.BARRELE_ROLE_EXP_MDT:
+                         {"enable_lustre_exp_mdt": True}}
+
+
+def filedata_config_items(config):
+    """
+    Return (items, item_tags) of a filedata config. The items is the set of
+    the enabled item types. Key of item_tags is item type, value is the
+    list of the extra tag keys added by the ItemType block.
+    """
+    item_tags = {}
+    for block in FILEDATA_ITEM_TYPE_BLOCK_PATTERN.findall(config):
+        type_match = barrele_collectd.FILEDATA_ITEM_TYPE_PATTERN.search(block)
+        tags_match = FILEDATA_TSDB_TAGS_PATTERN.search(block)
+        if type_match is None or tags_match is None:
+            continue
+        tags = barrele_definition.parse_tsdb_tags(tags_match.group(1))
+        if tags is None:
+            continue
+        item_tags[type_match.group(1)] = [key for key, _ in tags]
+    config = FILEDATA_ITEM_TYPE_BLOCK_PATTERN.sub("", config)
+    items = set(barrele_collectd.FILEDATA_ITEM_TYPE_PATTERN.findall(config))
+    return items, item_tags
+
+
+def lustre_role_items(log, version, jobstat_pattern):
+    """
+    Return (role_items, item_tags) of a Lustre version. Key of role_items
+    is role, value is the set of the items enabled by the role but not by
+    the Lustre role. Return (None, None) on error.
+    """
+    role_items = {}
+    item_tags = {}
+    for role, arguments in LUSTRE_ROLE_ARGUMENTS.items():
+        config = \
+            barrele_collectd.CollectdConfig.cdc_lustre_filedata_config(log,
+                                                                       version,
+                                                                       jobstat_pattern,
+                                                                       **arguments)
+        if config is None:
+            log.cl_error("failed to get the filedata config of role [%s] "
+                         "for Lustre version [%s]", role, version.lv_name)
+            return None, None
+        items, tags = filedata_config_items(config)
+        role_items[role] = items
+        item_tags.update(tags)
+
+    common_items = role_items[barrele_constant.BARRELE_ROLE_LUSTRE]
+    for role, items in role_items.items():
+        if role != barrele_constant.BARRELE_ROLE_LUSTRE:
+            role_items[role] = items - common_items
+    return role_items, item_tags
+
+
+class BarreleMeasurement():
+    """
+    A measurement in the catalog
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, name):
+        # Name of the measurement
+        self.bm_name = name
+        # The set of tag keys
+        self.bm_tags = set([MEASUREMENT_HOST_TAG])
+        # The set of Collectd types, e.g. gauge and derive
+        self.bm_types = set()
+        # The filedata items that produce the measurement. Key is item
+        # name, value is the number of the fields of the item that produce
+        # the measurement.
+        self.bm_items = {}
+        # The set of agent roles that enable the measurement
+        self.bm_roles = set()
+        # The set of Lustre version names that have the measurement
+        self.bm_versions = set()
+
+
+def catalog_add_definition(log, catalog, index, xml_fname, role_items,
+                           item_tags, version_name):
+    """
+    Add the measurements of the enabled items in a definition XML into the
+    catalog.
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    if xml_fname not in index:
+        log.cl_error("definition file [%s] is not in the index",
+                     xml_fname)
+        return -1
+    definition = index[xml_fname]
+    measurements = definition[barrele_definition.DEFINITION_INDEX_MEASUREMENTS]
+    for name, info in measurements.items():
+        item_fields = info[barrele_definition.DEFINITION_INDEX_ITEMS]
+        defined_items = set(item_fields)
+        roles = set()
+        items = set()
+        for role, enabled_items in role_items.items():
+            role_enabled = defined_items & enabled_items
+            if len(role_enabled) == 0:
+                continue
+            roles.add(role)
+            items |= role_enabled
+        if len(roles) == 0:
+            continue
+
+        if name not in catalog:
+            catalog[name] = BarreleMeasurement(name)
+        measurement = catalog[name]
+        measurement.bm_tags |= set(info[barrele_definition.DEFINITION_INDEX_TAGS])
+        for item in items:
+            measurement.bm_tags |= set(item_tags.get(item, []))
+        measurement.bm_types |= set(info[barrele_definition.DEFINITION_INDEX_TYPES])
+        for item in items:
+            measurement.bm_items[item] = max(measurement.bm_items.get(item, 0),
+                                             item_fields[item])
+        measurement.bm_roles |= roles
+        if version_name is not None:
+            measurement.bm_versions.add(version_name)
+    return 0
+
+
+def measurement_catalog(log, jobstat_pattern,
+                        index_fpath=barrele_constant.BARRELE_DEFINITION_INDEX):
+    """
+    Return the catalog of the measurements produced by the filedata plugins
+    of Barreleye agents. Key is measurement name, value is
+    BarreleMeasurement. Return None on error.
+    """
+    index = barrele_definition.load_definition_index(log, index_fpath)
+    if index is None:
+        return None
+
+    catalog = {}
+    for version in lustre_version.LUSTRE_VERSION_DICT.values():
+        xml_fname = barrele_collectd.lustre_version_xml_fname(log, version,
+                                                              quiet=True)
+        if xml_fname is None:
+            continue
+        role_items, item_tags = lustre_role_items(log, version,
+                                                  jobstat_pattern)
+        if role_items is None:
+            return None
+        ret = catalog_add_definition(log, catalog, index, xml_fname,
+                                     role_items, item_tags, version.lv_name)
+        if ret:
+            log.cl_error("failed to add measurements of Lustre version [%s] "
+                         "into catalog", version.lv_name)
+            return None
+
+    config = barrele_collectd.CollectdConfig.cdc_infiniband_filedata_config()
+    items, item_tags = filedata_config_items(config)
+    role_items = {barrele_constant.BARRELE_ROLE_INFINIBAND: items}
+    ret = catalog_add_definition(log, catalog, index,
+                                 barrele_collectd.XML_FNAME_INFINIBAND,
+                                 role_items, item_tags, None)
+    if ret:
+        log.cl_error("failed to add measurements of Infiniband into catalog")
+        return None
+    return catalog
+
+
+def catalog_check_continuous_query(catalog, continuous_query):
+    """
+    Return None if the measurement of the continuous query is in the
+    catalog and has all the tags that the query groups by. Otherwise,
+    return the reason.
+    """
+    name = continuous_query.icq_measurement
+    if name not in catalog:
+        return "measurement [%s] is not produced by any agent" % name
+    missing = [group for group in continuous_query.icq_groups
+               if group not in catalog[name].bm_tags]
+    if len(missing) > 0:
+        return ("measurement [%s] does not have tags %s" %
+                (name, missing))
+    return None
+
+
+def catalog_filter_continuous_queries(log, catalog, continuous_queries):
+    """
+    Return the continuous queries that read the measurements and tags in
+    the catalog. The others would only write empty or meaningless points.
+    """
+    filtered = []
+    for continuous_query in continuous_queries:
+        reason = catalog_check_continuous_query(catalog, continuous_query)
+        if reason is not None:
+            log.cl_warning("skipping continuous query [%s] because %s",
+                           continuous_query.icq_name(), reason)
+            continue
+        filtered.append(continuous_query)
+    return filtered
@@ -0,0 +1,590 @@
+"""
+Library for Barreleye relay.
+A relay accepts the OpenTSDB put lines sent by the write_tsdb plugin of
+Collectd on a subset of agents, pre-aggregates the configured measurements
+and forwards the data points to Influxdb in large batches of line protocol.
+An agent using the HTTP transport runs a local relay that only listens on
+the loopback interface.
+"""
+import gzip
+import math
+import re
+import socketserver
+import threading
+import time
+import traceback
+from http import HTTPStatus
+import requests
+from pycoral import host_range
+from pycoral import ssh_host
+from pycoral import utils
+from pybarrele import barrele_constant
+
+# The port of the OpenTSDB listener of Influxdb on Barreleye server
+INFLUXDB_OPENTSDB_PORT = 4242
+# The default port that the local relay of an agent listens on. Differs
+# from INFLUXDB_OPENTSDB_PORT so as not to conflict with the OpenTSDB
+# listener of Influxdb when the agent is also a Barreleye server.
+RELAY_LOCAL_PORT = 4243
+# The default port that the relay listens on. Differs from
+# INFLUXDB_OPENTSDB_PORT for the same reason, and from RELAY_LOCAL_PORT
+# so that the relay host can also be an agent with a local relay.
+RELAY_PORT = 4244
+# The default max number of data points in a batch sent to Influxdb
+RELAY_BATCH_SIZE = 5000
+# The default max seconds to wait before sending a batch to Influxdb
+RELAY_FLUSH_INTERVAL = 10
+# The default tags to remove when aggregating the data points
+RELAY_AGGREGATE_DROP_TAGS = ["fqdn"]
+# The tag added to the aggregated data points with the hostname of the
+# relay as value. Each relay serves its own subset of agents, so without
+# this tag the sums of different relays would be written into the same
+# series and timestamp, and Influxdb would only keep the last one.
+RELAY_AGGREGATE_TAG = "relay"
+# The max number of data points to keep when Influxdb is unreachable. The
+# oldest data points will be dropped if exceeded.
+RELAY_MAX_PENDING = 1000000
+# The number of aggregation intervals to keep an aggregation after it is
+# sent. A data point that comes late in these intervals updates the sent
+# aggregation, which is then sent again to overwrite the old value in
+# Influxdb. Older data points are dropped.
+RELAY_AGGREGATE_KEEP_INTERVALS = 10
+# The seconds to wait before retrying if failed to send a batch
+RELAY_RETRY_INTERVAL = 5
+# The max bytes to receive from a connection at once
+RELAY_RECV_SIZE = 65536
+# The seconds between two logs of statistics
+RELAY_STATS_INTERVAL = 60
+# The name of the service of relay
+RELAY_SERVICE_NAME = "barrele_relay"
+# The path of the systemd unit of the relay service
+RELAY_SERVICE_FPATH = "/etc/systemd/system/%s.service" % RELAY_SERVICE_NAME
+# The content of the systemd unit of the relay service
+RELAY_SERVICE_CONTENT = """[Unit]
+Description=Barreleye relay from Collectd to Influxdb
+After=network.target
+
+[Service]
+ExecStart=/usr/bin/barrele relay run --host %s
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+def line_protocol_escape(string, measurement=False):
+    """
+    Escape the measurement, tag key or tag value in line protocol
+    """
+    string = string.replace("\\", "\\\\")
+    string = string.replace(",", "\\,").replace(" ", "\\ ")
+    if not measurement:
+        string = string.replace("=", "\\=")
+    return string
+
+
+def line_protocol_point(measurement, tags, value, timestamp_ms):
+    """
+    Return the line protocol of a data point. The tags is a tuple of
+    (key, value) sorted by key, which is the best order for Influxdb.
+    """
+    line = line_protocol_escape(measurement, measurement=True)
+    for key, tag_value in tags:
+        line += ",%s=%s" % (line_protocol_escape(key),
+                            line_protocol_escape(tag_value))
+    line += " value=%r %d" % (value, timestamp_ms)
+    return line
+
+
+def opentsdb_put_parse(line):
+    """
+    Parse a line like "put <metric> <timestamp> <value> <tagk=tagv>...".
+    Return (measurement, timestamp_ms, value, tags), or None if the line
+    is not a valid put line. Like the OpenTSDB listener of Influxdb, a
+    timestamp with more than 10 digits is in milliseconds.
+    """
+    # pylint: disable=too-many-return-statements
+    fields = line.split()
+    if len(fields) < 4 or fields[0] != "put":
+        return None
+    measurement = fields[1]
+    try:
+        timestamp = float(fields[2])
+        value = float(fields[3])
+    except ValueError:
+        return None
+    if not math.isfinite(value):
+        return None
+    if timestamp >= 1e10:
+        timestamp_ms = int(timestamp)
+    else:
+        timestamp_ms = int(timestamp * 1000)
+    tags = []
+    for field in fields[4:]:
+        key, sep, tag_value = field.partition("=")
+        if sep == "" or key == "" or tag_value == "":
+            return None
+        tags.append((key, tag_value))
+    tags.sort()
+    return measurement, timestamp_ms, value, tuple(tags)
+
+
+class RelayBuffer():
+    """
+    The buffer of the data points to send. The data points of aggregated
+    measurements are summed up after removing some tags, and are sent after
+    the aggregation interval is surely over. Only the last value of each
+    series in an interval is summed, since Collectd might send more than
+    one data point of a series in an interval. The sums are tagged with
+    the hostname of the relay.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, aggregate_patterns, aggregate_drop_tags,
+                 aggregate_interval, relay_hostname):
+        # The condition to protect the buffer and notify the sender
+        self.rb_condition = threading.Condition()
+        # The line protocol of the data points to send
+        self.rb_lines = []
+        # Key is (measurement, aggregated tags, bucket start in ms), value
+        # is a dict whose key is the tags of the series before aggregation,
+        # and value is the last value of the series in the bucket.
+        self.rb_aggregations = {}
+        # The keys of the aggregations that have been moved to the lines
+        self.rb_aggregations_sent = set()
+        # The keys of the sent aggregations that late data points have
+        # updated, and that need to be sent again
+        self.rb_aggregations_updated = set()
+        # The compiled regular expressions of the aggregated measurements
+        self.rb_aggregate_patterns = aggregate_patterns
+        # The tags to remove when aggregating
+        self.rb_aggregate_drop_tags = aggregate_drop_tags
+        # The aggregation interval in milliseconds
+        self.rb_aggregate_interval_ms = aggregate_interval * 1000
+        # The tag added to the aggregated data points
+        self.rb_aggregate_tag = (RELAY_AGGREGATE_TAG, relay_hostname)
+        # The measurements that have been checked whether to aggregate.
+        # Key is measurement, value is bool.
+        self.rb_aggregate_cache = {}
+        # The number of the received data points
+        self.rb_received = 0
+        # The number of the invalid lines
+        self.rb_invalid = 0
+        # The number of the dropped data points
+        self.rb_dropped = 0
+        # The number of the data points that are too late to aggregate
+        self.rb_late = 0
+
+    def _rb_should_aggregate(self, measurement):
+        """
+        Whether the measurement should be aggregated
+        """
+        if measurement in self.rb_aggregate_cache:
+            return self.rb_aggregate_cache[measurement]
+        aggregate = False
+        for pattern in self.rb_aggregate_patterns:
+            if pattern.search(measurement):
+                aggregate = True
+                break
+        self.rb_aggregate_cache[measurement] = aggregate
+        return aggregate
+
+    def rb_add_lines(self, lines, batch_size):
+        """
+        Add the received put lines to the buffer. Wake up the sender if a
+        batch is full.
+        """
+        with self.rb_condition:
+            for line in lines:
+                point = opentsdb_put_parse(line)
+                if point is None:
+                    self.rb_invalid += 1
+                    continue
+                self.rb_received += 1
+                measurement, timestamp_ms, value, tags = point
+                if not self._rb_should_aggregate(measurement):
+                    self.rb_lines.append(line_protocol_point(measurement,
+                                                             tags, value,
+                                                             timestamp_ms))
+                    continue
+                self._rb_aggregate(measurement, timestamp_ms, value, tags)
+            if len(self.rb_lines) >= batch_size:
+                self.rb_condition.notify()
+
+    def _rb_aggregate(self, measurement, timestamp_ms, value, tags):
+        """
+        Add a data point into the aggregation of its bucket
+        """
+        interval_ms = self.rb_aggregate_interval_ms
+        bucket = timestamp_ms - timestamp_ms % interval_ms
+        aggregated_tags = [tag for tag in tags
+                           if tag[0] not in self.rb_aggregate_drop_tags]
+        aggregated_tags.append(self.rb_aggregate_tag)
+        aggregated_tags = tuple(sorted(aggregated_tags))
+        key = (measurement, aggregated_tags, bucket)
+        if key not in self.rb_aggregations:
+            expire_ms = (time.time() * 1000 -
+                         (3 + RELAY_AGGREGATE_KEEP_INTERVALS) * interval_ms)
+            if bucket <= expire_ms:
+                self.rb_late += 1
+                return
+            self.rb_aggregations[key] = {}
+        self.rb_aggregations[key][tags] = value
+        if key in self.rb_aggregations_sent:
+            self.rb_aggregations_updated.add(key)
+
+    def _rb_flush_aggregations(self, now_ms, force):
+        """
+        Move the finished aggregations to the lines. An aggregation is
+        finished when three intervals have passed after the end of the bucket,
+        so that the data points of the slow agents are still counted. The
+        sent aggregations updated by late data points are sent again, and
+        the expired ones are removed.
+        """
+        interval_ms = self.rb_aggregate_interval_ms
+        deadline = now_ms - 3 * interval_ms
+        expire_ms = deadline - RELAY_AGGREGATE_KEEP_INTERVALS * interval_ms
+        for key, series in list(self.rb_aggregations.items()):
+            measurement, tags, bucket = key
+            if key in self.rb_aggregations_sent:
+                if key not in self.rb_aggregations_updated:
+                    if force or bucket <= expire_ms:
+                        self.rb_aggregations_sent.remove(key)
+                        del self.rb_aggregations[key]
+                    continue
+                self.rb_aggregations_updated.remove(key)
+            elif not force and bucket > deadline:
+                continue
+            else:
+                self.rb_aggregations_sent.add(key)
+            self.rb_lines.append(line_protocol_point(measurement, tags,
+                                                     sum(series.values()),
+                                                     bucket))
+
+    def rb_take(self, batch_size, flush_interval, force=False):
+        """
+        Wait and take a batch of lines. Return an empty list if no line is
+        ready until the flush interval.
+        """
+        with self.rb_condition:
+            deadline = time.time() + flush_interval
+            while len(self.rb_lines) < batch_size and not force:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.rb_condition.wait(timeout=remaining)
+            self._rb_flush_aggregations(int(time.time() * 1000), force)
+            lines = self.rb_lines[:batch_size]
+            del self.rb_lines[:batch_size]
+            return lines
+
+    def rb_giveback(self, lines):
+        """
+        Put back the lines that failed to be sent. Drop the oldest lines if
+        too many pending.
+        """
+        with self.rb_condition:
+            self.rb_lines[0:0] = lines
+            overflow = len(self.rb_lines) - RELAY_MAX_PENDING
+            if overflow > 0:
+                del self.rb_lines[:overflow]
+                self.rb_dropped += overflow
+
+
+class RelayRequestHandler(socketserver.BaseRequestHandler):
+    """
+    The handler of a connection from the write_tsdb plugin of Collectd
+    """
+    def handle(self):
+        # pylint: disable=bare-except
+        log = self.server.rts_log
+        relay_buffer = self.server.rts_buffer
+        batch_size = self.server.rts_batch_size
+        # The incomplete line at the end of the last chunk
+        partial = b""
+        try:
+            while True:
+                # Add the lines of each chunk together so that the lock of
+                # the buffer is not taken for each line, and the lines are
+                # not held by this connection for long.
+                chunk = self.request.recv(RELAY_RECV_SIZE)
+                if not chunk:
+                    break
+                raw_lines = (partial + chunk).split(b"\n")
+                partial = raw_lines.pop()
+                lines = []
+                for raw_line in raw_lines:
+                    line = raw_line.decode("utf-8", errors="replace").strip()
+                    if line != "":
+                        lines.append(line)
+                if len(lines) > 0:
+                    relay_buffer.rb_add_lines(lines, batch_size)
+        except:
+            log.cl_error("got exception when receiving data points from "
+                         "[%s]: %s", self.client_address[0],
+                         traceback.format_exc())
+        line = partial.decode("utf-8", errors="replace").strip()
+        if line != "":
+            relay_buffer.rb_add_lines([line], batch_size)
+
+
+class RelayTCPServer(socketserver.ThreadingTCPServer):
+    """
+    The TCP server that accepts the OpenTSDB connections
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, log, address, relay_buffer, batch_size):
+        # The log to print the errors of the connections
+        self.rts_log = log
+        # The buffer to save the received data points
+        self.rts_buffer = relay_buffer
+        # The max number of data points in a batch
+        self.rts_batch_size = batch_size
+        super().__init__(address, RelayRequestHandler)
+
+
+class BarreleRelay():
+    """
+    Each relay has an object of this type
+    """
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    def __init__(self, host, barreleye_server, port=RELAY_PORT,
+                 batch_size=RELAY_BATCH_SIZE,
+                 flush_interval=RELAY_FLUSH_INTERVAL, gzip_enabled=True,
+                 aggregate_patterns=None,
+                 aggregate_drop_tags=None, local=False):
+        # pylint: disable=too-many-arguments
+        # Host to run the relay
+        self.bre_host = host
+        # Barreleye server to forward the data points to
+        self.bre_barreleye_server = barreleye_server
+        # The port to listen on
+        self.bre_port = port
+        # Whether the relay only serves the agent on the same host
+        self.bre_local = local
+        # The max number of data points in a batch
+        self.bre_batch_size = batch_size
+        # The max seconds to wait before sending a batch
+        self.bre_flush_interval = flush_interval
+        # Whether to compress the batches by gzip
+        self.bre_gzip = gzip_enabled
+        # The compiled regular expressions of the measurements to aggregate
+        if aggregate_patterns is None:
+            aggregate_patterns = []
+        self.bre_aggregate_patterns = aggregate_patterns
+        # The tags to remove when aggregating
+        if aggregate_drop_tags is None:
+            aggregate_drop_tags = RELAY_AGGREGATE_DROP_TAGS
+        self.bre_aggregate_drop_tags = aggregate_drop_tags
+
+    def _bre_send_batch(self, log, session, lines):
+        """
+        Send a batch of lines to Influxdb
+        """
+        # pylint: disable=bare-except
+        server = self.bre_barreleye_server
+        url = "http://%s:8086/write" % server.bes_server_host.sh_hostname
+        params = {"db": barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME,
+                  "precision": "ms"}
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        headers = {"Content-Type": "text/plain; charset=utf-8"}
+        if self.bre_gzip:
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+        try:
+            response = session.post(url, params=params, data=data,
+                                    headers=headers)
+        except:
+            log.cl_error("got exception when sending [%d] data points to "
+                         "[%s]: %s", len(lines), url,
+                         traceback.format_exc())
+            return -1
+        if response.status_code != HTTPStatus.NO_CONTENT:
+            log.cl_error("got status [%d] when sending [%d] data points to "
+                         "[%s]: %s", response.status_code, len(lines), url,
+                         response.text)
+            # The points are rejected, retrying will not help
+            if response.status_code == HTTPStatus.BAD_REQUEST:
+                return 0
+            return -1
+        return 0
+
+    def bre_run(self, log, collect_interval):
+        """
+        Run the relay until killed
+        """
+        relay_buffer = RelayBuffer(self.bre_aggregate_patterns,
+                                   self.bre_aggregate_drop_tags,
+                                   collect_interval,
+                                   self.bre_host.sh_hostname)
+        if self.bre_local:
+            address = "127.0.0.1"
+        else:
+            address = ""
+        tcp_server = RelayTCPServer(log, (address, self.bre_port),
+                                    relay_buffer, self.bre_batch_size)
+        thread = threading.Thread(target=tcp_server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        log.cl_info("relay on host [%s] is listening on port [%d] and "
+                    "forwarding to Influxdb on host [%s]",
+                    self.bre_host.sh_hostname, self.bre_port,
+                    self.bre_barreleye_server.bes_server_host.sh_hostname)
+
+        session = requests.Session()
+        sent = 0
+        stats_time = time.time()
+        while True:
+            lines = relay_buffer.rb_take(self.bre_batch_size,
+                                         self.bre_flush_interval)
+            if len(lines) > 0:
+                ret = self._bre_send_batch(log, session, lines)
+                if ret:
+                    relay_buffer.rb_giveback(lines)
+                    time.sleep(RELAY_RETRY_INTERVAL)
+                else:
+                    sent += len(lines)
+            now = time.time()
+            if now - stats_time >= RELAY_STATS_INTERVAL:
+                stats_time = now
+                log.cl_info("relay received [%d] data points, sent [%d], "
+                            "invalid lines [%d], dropped [%d], too late to "
+                            "aggregate [%d]",
+                            relay_buffer.rb_received, sent,
+                            relay_buffer.rb_invalid,
+                            relay_buffer.rb_dropped, relay_buffer.rb_late)
+
+    def bre_config_relay(self, log, barreleye_instance):
+        """
+        Install the relay service and restart it
+        """
+        host = self.bre_host
+        log.cl_info("configuring relay on host [%s]", host.sh_hostname)
+        fpath = (barreleye_instance.bei_workspace + "/" +
+                 RELAY_SERVICE_NAME + ".service." + host.sh_hostname)
+        with open(fpath, "w", encoding="utf-8") as service_file:
+            service_file.write(RELAY_SERVICE_CONTENT % host.sh_hostname)
+
+        ret = host.sh_send_file(log, fpath, RELAY_SERVICE_FPATH)
+        if ret:
+            log.cl_error("failed to send file [%s] on local host [%s] to "
+                         "[%s] on host [%s]",
+                         fpath, barreleye_instance.bei_local_host.sh_hostname,
+                         RELAY_SERVICE_FPATH, host.sh_hostname)
+            return -1
+
+        command = "systemctl daemon-reload"
+        retval = host.sh_run(log, command)
+        if retval.cr_exit_status:
+            log.cl_error("failed to run command [%s] on host [%s], "
+                         "ret = [%d], stdout = [%s], stderr = [%s]",
+                         command,
+                         host.sh_hostname,
+                         retval.cr_exit_status,
+                         retval.cr_stdout,
+                         retval.cr_stderr)
+            return -1
+
+        ret = host.sh_service_start_enable(log, RELAY_SERVICE_NAME,
+                                           restart=True)
+        if ret:
+            log.cl_error("failed to start and enable service [%s] on "
+                         "host [%s]", RELAY_SERVICE_NAME, host.sh_hostname)
+            return -1
+        return 0
+
+
+def parse_relay_options(log, relay_config, hostname, config_fpath):
+    """
+    Parse the batching options of a relay. Return the keyword arguments of
+    BarreleRelay, or None on error.
+    """
+    kwargs = {}
+    int_options = {barrele_constant.BRL_PORT: "port",
+                   barrele_constant.BRL_BATCH_SIZE: "batch_size",
+                   barrele_constant.BRL_FLUSH_INTERVAL: "flush_interval"}
+    for option, argument in int_options.items():
+        value = utils.config_value(relay_config, option)
+        if value is None:
+            continue
+        if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+            log.cl_error("invalid [%s] of relay [%s] in the config file [%s], "
+                         "should be a positive integer", option, hostname,
+                         config_fpath)
+            return None
+        kwargs[argument] = value
+
+    if kwargs.get("port") == INFLUXDB_OPENTSDB_PORT:
+        log.cl_error("port [%d] of relay [%s] in the config file [%s] "
+                     "conflicts with the OpenTSDB listener of Influxdb",
+                     INFLUXDB_OPENTSDB_PORT, hostname,
+                     config_fpath)
+        return None
+
+    gzip_enabled = utils.config_value(relay_config, barrele_constant.BRL_GZIP)
+    if gzip_enabled is not None:
+        kwargs["gzip_enabled"] = gzip_enabled
+    return kwargs
+
+
+def parse_relay_config(log, relay_config, config_fpath, host_dict,
+                       barreleye_server):
+    """
+    Parse the config of a relay. Return (relay, hostnames of agents).
+    """
+    # pylint: disable=too-many-return-statements,too-many-branches
+    hostname = utils.config_value(relay_config, barrele_constant.BRL_HOSTNAME)
+    if hostname is None:
+        log.cl_error("can NOT find [%s] in the config of relay, "
+                     "please correct file [%s]",
+                     barrele_constant.BRL_HOSTNAME, config_fpath)
+        return None, None
+
+    hostname_config = utils.config_value(relay_config,
+                                         barrele_constant.BRL_AGENT_HOSTNAMES)
+    if hostname_config is None:
+        log.cl_error("can NOT find [%s] in the config of relay [%s], "
+                     "please correct file [%s]",
+                     barrele_constant.BRL_AGENT_HOSTNAMES, hostname,
+                     config_fpath)
+        return None, None
+    agent_hostnames = host_range.parse_host_range_set(log, hostname_config)
+    if agent_hostnames is None:
+        log.cl_error("[%s] as [%s] is invalid in the config file [%s]",
+                     hostname_config, barrele_constant.BRL_AGENT_HOSTNAMES,
+                     config_fpath)
+        return None, None
+
+    kwargs = parse_relay_options(log, relay_config, hostname, config_fpath)
+    if kwargs is None:
+        return None, None
+
+    patterns = []
+    measurements = utils.config_value(relay_config,
+                                      barrele_constant.BRL_AGGREGATE_MEASUREMENTS)
+    if measurements is not None:
+        for measurement in measurements:
+            try:
+                patterns.append(re.compile(measurement))
+            except re.error:
+                log.cl_error("invalid regular expression [%s] of [%s] in the "
+                             "config file [%s]", measurement,
+                             barrele_constant.BRL_AGGREGATE_MEASUREMENTS,
+                             config_fpath)
+                return None, None
+    kwargs["aggregate_patterns"] = patterns
+    kwargs["aggregate_drop_tags"] = \
+        utils.config_value(relay_config,
+                           barrele_constant.BRL_AGGREGATE_DROP_TAGS)
+
+    ssh_identity_file = utils.config_value(relay_config,
+                                           barrele_constant.BRL_SSH_IDENTITY_FILE)
+    host = ssh_host.get_or_add_host_to_dict(log, host_dict, hostname,
+                                            ssh_identity_file)
+    if host is None:
+        return None, None
+    relay = BarreleRelay(host, barreleye_server, **kwargs)
+    return relay, agent_hostnames
@@ -4,14 +4,17 @@ Barreleye is a performance monitoring system for Lustre.
 """
 # pylint: disable=too-many-lines
 import os
-import traceback
 import json
+import hashlib
 from http import HTTPStatus
 from slugify import slugify
-import requests
 from pycoral import utils
+from pycoral import parallel
 from pybarrele import barrele_constant
 from pybarrele import barrele_influxdb
+from pybarrele import barrele_grafana
+from pybarrele import barrele_dashboard
+from pybarrele import barrele_measurement
 
 
 # The Influxdb config fpath
@@ -23,10 +26,6 @@ INFLUXDB_CONFIG_FNAME = os.path.basename(INFLUXDB_CONFIG_FPATH)
 # The backuped Influxdb config fpath
 INFLUXDB_CONFIG_BACKUP_FPATH = (barrele_constant.BARRELE_DIR + "/" +
                                 INFLUXDB_CONFIG_FNAME)
-# The common prefix of Influxdb continuous query
-INFLUXDB_CQ_PREFIX = "cq_"
-# The common prefix of Influxdb continuous query measurement
-INFLUXDB_CQ_MEASUREMENT_PREFIX = "cqm_"
 # Data source name of Influxdb on Grafana
 GRAFANA_DATASOURCE_NAME = "barreleye_datasource"
 # The dir of Grafana plugins
@@ -60,6 +59,12 @@ TEMPLATE_DATASOURCE_NAME = "$BARRELEYE_DATASOURCE_NAME"
 GRAFANA_FOLDER_DISABLED = "Disabled"
 # Grafana folders
 GRAFANA_FOLDERS = [GRAFANA_FOLDER_DISABLED]
+# The number of dashboards to upload to Grafana in parallel
+GRAFANA_DASHBOARD_PARALLELISM = 6
+# The prefix of the dashboard tag that saves the hash of the dashboard
+GRAFANA_DASHBOARD_HASH_TAG_PREFIX = "barreleye_hash:"
+# The title of the default folder of Grafana
+GRAFANA_FOLDER_GENERAL = "General"
 
 
 def sed_replacement_escape(path):
@@ -86,16 +91,100 @@ def grafana_dashboard_check(log, title_name, dashboard):
     return 0
 
 
+def grafana_dashboard_hash(content, collect_interval, datasource_name,
+                           folder_title):
+    """
+    Return the hash tag of a rendered dashboard
+    """
+    sha256 = hashlib.sha256()
+    for item in [content, collect_interval, datasource_name, folder_title]:
+        sha256.update(item.encode("utf-8"))
+        sha256.update(b"\0")
+    return GRAFANA_DASHBOARD_HASH_TAG_PREFIX + sha256.hexdigest()
+
+
+def grafana_dashboard_set_hash(dashboard, hash_tag):
+    """
+    Save the hash tag into the tags of the dashboard
+    """
+    tags = []
+    if "tags" in dashboard:
+        for tag in dashboard["tags"]:
+            if not tag.startswith(GRAFANA_DASHBOARD_HASH_TAG_PREFIX):
+                tags.append(tag)
+    tags.append(hash_tag)
+    dashboard["tags"] = tags
+
+
+def grafana_dashboard_load(log, local_host, workspace, fname,
+                           collect_interval):
+    """
+    Load the dashboard from the template or the JSON file. Return the
+    dashboard, or None on error.
+    """
+    dashboard_json_fpath = GRAFANA_DASHBOARD_DIR + "/" + fname
+    dashboard_template_fpath = dashboard_json_fpath + ".template"
+    ret = local_host.sh_path_exists(log, dashboard_template_fpath)
+    if ret < 0:
+        log.cl_error("failed to check whether file [%s] exists on "
+                     "host [%s]", dashboard_template_fpath,
+                     local_host.sh_hostname)
+        return None
+    if ret:
+        dashboard_json_fpath = (workspace + "/" + fname)
+        with open(dashboard_template_fpath, 'r', encoding='utf-8') as template_file:
+            content = template_file.read()
+
+        content = content.replace(TEMPLATE_COLLECT_INTERVAL,
+                                  collect_interval)
+        content = content.replace(TEMPLATE_DATASOURCE_NAME,
+                                  GRAFANA_DATASOURCE_NAME)
+        with open(dashboard_json_fpath, 'w', encoding='utf-8') as json_file:
+            json_file.write(content)
+    else:
+        ret = local_host.sh_path_exists(log, dashboard_json_fpath)
+        if ret < 0:
+            log.cl_error("failed to check whether file [%s] exists on "
+                         "host [%s]", dashboard_json_fpath,
+                         local_host.sh_hostname)
+            return None
+        if ret == 0:
+            log.cl_error("file [%s] does not on host [%s]",
+                         dashboard_json_fpath,
+                         local_host.sh_hostname)
+            return None
+
+        with open(dashboard_json_fpath, "r", encoding='utf-8') as json_file:
+            content = json_file.read()
+
+    return json.loads(content)
+
+
+def grafana_dashboard_upsert(log, workspace, barreleye_server, title_name,
+                             dashboard, folder_id):
+    """
+    Create or overwrite a dashboard of Grafana, run in a thread
+    """
+    # pylint: disable=unused-argument,protected-access
+    return barreleye_server._bes_grafana_create_dashboard(log, title_name,
+                                                          dashboard,
+                                                          overwrite=True,
+                                                          folder_id=folder_id)
+
+
 class BarreleServer():
     """
     Barreleye server object
     """
     # pylint: disable=too-few-public-methods,too-many-instance-attributes
-    def __init__(self, host, data_path):
+    def __init__(self, host, data_path,
+                 datasource_name=GRAFANA_DATASOURCE_NAME):
         # Host to run commands.
         self.bes_server_host = host
         # Dir to save monitoring data.
         self.bes_data_path = data_path
+        # The name of the Grafana datasource of the Influxdb on this server
+        self.bes_grafana_datasource_name = datasource_name
         # Influxdb client to run queries.
         self.bes_influxdb_client = \
             barrele_influxdb.BarreleInfluxdbClient(host.sh_hostname,
@@ -114,6 +203,12 @@ class BarreleServer():
         self.bes_grafana_port = "3000"
         # The folder id (not uid) of disabled
         self.bes_disabled_folder_id = None
+        # Grafana client to send requests through a pooled session
+        self.bes_grafana_client = \
+            barrele_grafana.BarreleGrafanaClient(host.sh_hostname,
+                                                 self.bes_grafana_port,
+                                                 self.bes_grafana_admin_login,
+                                                 self.bes_grafana_admin_password)
 
     def _bes_erase_influxdb(self, log):
         """
@@ -262,6 +357,27 @@ class BarreleServer():
                          retval.cr_stderr)
             return -1
 
+        # The OpenTSDB listener is only needed when some agents send the
+        # data points with write_tsdb to this server directly.
+        opentsdb_enabled = "false"
+        for agent in barreleye_instance.bei_agent_dict.values():
+            if (agent.bea_barreleye_server is self and
+                    agent.bea_relay is None):
+                opentsdb_enabled = "true"
+                break
+        command = ("sed -i 's/BARRELE_INFLUXDB_OPENTSDB_ENABLED/%s/g' %s" %
+                   (opentsdb_enabled, final_diff))
+        retval = host.sh_run(log, command)
+        if retval.cr_exit_status:
+            log.cl_error("failed to run command [%s] on host [%s], "
+                         "ret = [%d], stdout = [%s], stderr = [%s]",
+                         command,
+                         host.sh_hostname,
+                         retval.cr_exit_status,
+                         retval.cr_stdout,
+                         retval.cr_stderr)
+            return -1
+
         command = ("/usr/bin/cp -f %s %s" %
                    (INFLUXDB_CONFIG_BACKUP_FPATH,
                     INFLUXDB_CONFIG_FPATH))
@@ -401,12 +517,10 @@ class BarreleServer():
         """
         Check whether we can connect to Grafana
         """
-        url = self.bes_grafana_admin_url("")
-        try:
-            response = requests.get(url)
-        except:
-            log.cl_debug("got exception when connecting to [%s]: %s", url,
-                         traceback.format_exc())
+        url = self.bes_grafana_url()
+        response = self.bes_grafana_client.bgc_get(log, "", quiet=True)
+        if response is None:
+            log.cl_debug("failed to connect to [%s]", url)
             return -1
         if response.status_code != HTTPStatus.OK:
             log.cl_error("got status [%s] when acessing Grafana url [%s]",
@@ -445,22 +559,16 @@ class BarreleServer():
             return -1
         return 0
 
-    def _bes_grafana_has_influxdb_datasource(self, log):
+    def _bes_grafana_has_influxdb_datasource(self, log, server):
         """
-        Return 1 if has influxdb datasource, return 0 if not, return -1 if
-        error
+        Return 1 if has influxdb datasource of the server, return 0 if not,
+        return -1 if error
         """
-        # pylint: disable=bare-except
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/datasources/name/%s" %
-                                         GRAFANA_DATASOURCE_NAME)
-        try:
-            response = requests.get(url, headers=headers)
-        except:
-            log.cl_error("failed to get data source through URL [%s]: %s",
-                         url, traceback.format_exc())
+        api_path = "/api/datasources/name/%s" % server.bes_grafana_datasource_name
+        response = self.bes_grafana_client.bgc_get(log, api_path)
+        if response is None:
+            log.cl_error("failed to get data source through API [%s]",
+                         api_path)
             return -1
         if response.status_code == HTTPStatus.OK:
             return 1
@@ -470,21 +578,15 @@ class BarreleServer():
                      response.status_code)
         return -1
 
-    def _bes_grafana_influxdb_datasource_delete(self, log):
+    def _bes_grafana_influxdb_datasource_delete(self, log, server):
         """
-        Delete influxdb datasource from Grafana
+        Delete influxdb datasource of the server from Grafana
         """
-        # pylint: disable=bare-except
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/datasources/name/%s" %
-                                         GRAFANA_DATASOURCE_NAME)
-        try:
-            response = requests.delete(url, headers=headers)
-        except:
-            log.cl_error("not able to delete data source through [%s]: %s",
-                         url, traceback.format_exc())
+        api_path = "/api/datasources/name/%s" % server.bes_grafana_datasource_name
+        response = self.bes_grafana_client.bgc_delete(log, api_path)
+        if response is None:
+            log.cl_error("not able to delete data source through API [%s]",
+                         api_path)
             return -1
         if response.status_code != HTTPStatus.OK:
             log.cl_error("got grafana status [%d] when deleting datasource",
@@ -492,15 +594,14 @@ class BarreleServer():
             return -1
         return 0
 
-    def _bes_grafana_influxdb_datasource_add(self, log):
+    def _bes_grafana_influxdb_datasource_add(self, log, server, is_default):
         """
-        Add Influxdb datasource to Grafana
+        Add Influxdb datasource of the server to Grafana
         """
-        # pylint: disable=bare-except
-        influxdb_url = "http://%s:8086" % self.bes_server_host.sh_hostname
+        influxdb_url = "http://%s:8086" % server.bes_server_host.sh_hostname
         data = {
-            "name": GRAFANA_DATASOURCE_NAME,
-            "isDefault": True,
+            "name": server.bes_grafana_datasource_name,
+            "isDefault": is_default,
             "type": "influxdb",
             "url": influxdb_url,
             "access": "proxy",
@@ -508,15 +609,11 @@ class BarreleServer():
             "basicAuth": False,
         }
 
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/datasources")
-        try:
-            response = requests.post(url, json=data, headers=headers)
-        except:
-            log.cl_error("not able to create data source through [%s]: %s",
-                         url, traceback.format_exc())
+        api_path = "/api/datasources"
+        response = self.bes_grafana_client.bgc_post(log, api_path, data)
+        if response is None:
+            log.cl_error("not able to create data source through API [%s]",
+                         api_path)
             return -1
         if response.status_code != HTTPStatus.OK:
             log.cl_error("got Grafana status [%d] when creating datasource",
@@ -524,26 +621,44 @@ class BarreleServer():
             return -1
         return 0
 
-    def _bes_grafana_influxdb_datasource_remove_and_add(self, log):
+    def _bes_grafana_influxdb_datasource_remove_and_add(self, log, server,
+                                                        is_default):
         """
-        Add Influxdb datasource to Grafana.
+        Add Influxdb datasource of the server to Grafana.
         If the Influxdb datasource already exists, remove it first.
         """
-        log.cl_info("adding Influxdb data source to Grafana on host [%s]",
+        log.cl_info("adding Influxdb data source of host [%s] to Grafana on "
+                    "host [%s]", server.bes_server_host.sh_hostname,
                     self.bes_server_host.sh_hostname)
-        ret = self._bes_grafana_has_influxdb_datasource(log)
+        ret = self._bes_grafana_has_influxdb_datasource(log, server)
         if ret < 0:
             return -1
         if ret:
-            ret = self._bes_grafana_influxdb_datasource_delete(log)
+            ret = self._bes_grafana_influxdb_datasource_delete(log, server)
             if ret:
                 return -1
 
-        ret = self._bes_grafana_influxdb_datasource_add(log)
+        ret = self._bes_grafana_influxdb_datasource_add(log, server,
+                                                        is_default)
         if ret:
             return ret
         return 0
 
+    def _bes_grafana_influxdb_datasources_remove_and_add(self, log,
+                                                         barreleye_instance):
+        """
+        Add the Influxdb datasources of all servers to Grafana. The first
+        server is the default datasource.
+        """
+        servers = barreleye_instance.bei_barreleye_servers
+        for index, server in enumerate(servers):
+            ret = self._bes_grafana_influxdb_datasource_remove_and_add(log,
+                                                                       server,
+                                                                       index == 0)
+            if ret:
+                return -1
+        return 0
+
     def _bes_grafana_install_plugin(self, log, barreleye_instance,
                                     panel_name):
         """
@@ -596,16 +711,11 @@ class BarreleServer():
         """
         Get all folders
         """
-        # pylint: disable=bare-except
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/folders")
-        try:
-            response = requests.get(url, headers=headers)
-        except:
-            log.cl_error("failed to get all Grafana folders through [%s]: %s",
-                         url, traceback.format_exc())
+        api_path = "/api/folders"
+        response = self.bes_grafana_client.bgc_get(log, api_path)
+        if response is None:
+            log.cl_error("failed to get all Grafana folders through API [%s]",
+                         api_path)
             return None
         if response.status_code == HTTPStatus.OK:
             return response.json()
@@ -617,23 +727,16 @@ class BarreleServer():
         """
         Delete folder with a uid from Grafana
         """
-        # pylint: disable=bare-except
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/folders/%s" %
-                                         uid)
-        try:
-            response = requests.delete(url, headers=headers)
-        except:
+        api_path = "/api/folders/%s" % uid
+        response = self.bes_grafana_client.bgc_delete(log, api_path)
+        if response is None:
             log.cl_error("failed to delete Grafana folder with uid [%s] "
-                         "through [%s]: %s",
-                         url, traceback.format_exc())
+                         "through API [%s]", uid, api_path)
             return -1
         if response.status_code != HTTPStatus.OK:
             log.cl_error("got Grafana status [%d] when deleting folder "
                          "with uid [%s]",
-                         response.status_code)
+                         response.status_code, uid)
             return -1
         return 0
 
@@ -659,23 +762,15 @@ class BarreleServer():
         """
         Create a Grafana folder with a title
         """
-        # pylint: disable=bare-except
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
         data = {
             "title": title_name,
         }
 
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/folders")
-        try:
-            response = requests.post(url, json=data, headers=headers)
-        except:
-            log.cl_error("failed to create Grafana folder through [%s]: %s",
-                         url, traceback.format_exc())
+        api_path = "/api/folders"
+        response = self.bes_grafana_client.bgc_post(log, api_path, data)
+        if response is None:
+            log.cl_error("failed to create Grafana folder through API [%s]",
+                         api_path)
             return -1
         if response.status_code != HTTPStatus.OK:
             log.cl_error("got status [%d] when adding folder [%s] to "
@@ -687,15 +782,33 @@ class BarreleServer():
             self.bes_disabled_folder_id = response.json()["id"]
         return 0
 
-    def _bes_grafana_recreate_folder(self, log, title_name):
+    def _bes_grafana_prepare_folder(self, log, title_name):
         """
-        Recreate a Grafana folder with a title
+        Create a Grafana folder with a title if it does not exist. The
+        existing folder is kept so that the dashboards in it will not be
+        removed.
         """
-        ret = self._bes_grafana_delete_folder(log, title_name)
-        if ret:
-            log.cl_error("failed to delete folders with title [%s]",
-                         title_name)
+        json_obj = self._bes_grafana_get_folders(log)
+        if json_obj is None:
+            log.cl_error("failed to get all Grafana folders")
             return -1
+        found = False
+        for item in json_obj:
+            if item['title'] != title_name:
+                continue
+            if not found:
+                found = True
+                if title_name == GRAFANA_FOLDER_DISABLED:
+                    self.bes_disabled_folder_id = item["id"]
+                continue
+            uid = item['uid']
+            ret = self._bes_grafana_folder_delete_uid(log, uid)
+            if ret:
+                log.cl_error("failed to delete duplicated folder with uid "
+                             "[%s] and title [%s]", uid, title_name)
+                return -1
+        if found:
+            return 0
 
         ret = self._bes_grafana_create_folder(log, title_name)
         if ret:
@@ -704,19 +817,18 @@ class BarreleServer():
             return -1
         return 0
 
-    def _bes_grafana_recreate_folders(self, log):
+    def _bes_grafana_prepare_folders(self, log):
         """
-        Recreate Grafana dashboards
+        Prepare Grafana folders
         """
-        # pylint: disable=too-many-locals
         host = self.bes_server_host
 
-        log.cl_info("recreating Grafana folders on host [%s]",
+        log.cl_info("preparing Grafana folders on host [%s]",
                     host.sh_hostname)
         for folder_title in GRAFANA_FOLDERS:
-            ret = self._bes_grafana_recreate_folder(log, folder_title)
+            ret = self._bes_grafana_prepare_folder(log, folder_title)
             if ret:
-                log.cl_error("failed to replace Grafana folder with title "
+                log.cl_error("failed to prepare Grafana folder with title "
                              "[%s] on host [%s]",
                              folder_title, host.sh_hostname)
                 return -1
@@ -727,23 +839,17 @@ class BarreleServer():
         Retrieving all folders and dashboards.
         Return the json object of the response.
         """
-        # pylint: disable=bare-except
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/search?query=%")
-        try:
-            response = requests.get(url, headers=headers)
-        except:
+        api_path = "/api/search?query=%"
+        response = self.bes_grafana_client.bgc_get(log, api_path)
+        if response is None:
             log.cl_error("failed to get all Grafana folders and dashboards "
-                         "through [%s]: %s",
-                         url, traceback.format_exc())
+                         "through API [%s]", api_path)
             return None
         if response.status_code == HTTPStatus.OK:
             return response.json()
-        log.clerror("got status [%d] when getting all Grafana "
-                    "folders and dashboards",
-                    response.status_code)
+        log.cl_error("got status [%d] when getting all Grafana "
+                     "folders and dashboards",
+                     response.status_code)
         return None
 
     def _bes_grafana_has_dashboard(self, log, title_name):
@@ -764,23 +870,16 @@ class BarreleServer():
         """
         Delete bashboard with a uid from Grafana
         """
-        # pylint: disable=bare-except
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/dashboards/uid/%s" %
-                                         uid)
-        try:
-            response = requests.delete(url, headers=headers)
-        except:
+        api_path = "/api/dashboards/uid/%s" % uid
+        response = self.bes_grafana_client.bgc_delete(log, api_path)
+        if response is None:
             log.cl_error("failed to delete Grafana dashboard with uid [%s] "
-                         "through [%s]: %s",
-                         url, traceback.format_exc())
+                         "through API [%s]", uid, api_path)
             return -1
         if response.status_code != HTTPStatus.OK:
             log.cl_error("got Grafana status [%d] when deleting dashboard "
                          "with uid [%s]",
-                         response.status_code)
+                         response.status_code, uid)
             return -1
         return 0
 
@@ -821,15 +920,11 @@ class BarreleServer():
             "folderId": folder_id,
         }
 
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/dashboards/db")
-        try:
-            response = requests.post(url, json=data, headers=headers)
-        except:
-            log.cl_error("failed to add Grafana bashboard through [%s]: %s",
-                         url, traceback.format_exc())
+        api_path = "/api/dashboards/db"
+        response = self.bes_grafana_client.bgc_post(log, api_path, data)
+        if response is None:
+            log.cl_error("failed to add Grafana bashboard through API [%s]",
+                         api_path)
             return -1
         if response.status_code != HTTPStatus.OK:
             log.cl_error("got status [%d] when adding dashbard [%s] to "
@@ -839,25 +934,80 @@ class BarreleServer():
             return -1
         return 0
 
-    def _bes_grafana_recreate_dashboard(self, log, title_name, dashboard,
-                                        folder_id=0):
+    def _bes_grafana_prepare_upsert(self, log, dashboard_dict, title_name,
+                                    dashboard, hash_tag):
+        """
+        Prepare to upsert a dashboard. If the dashboard exists, it will be
+        overwritten in place by uid and the duplicated ones are removed.
+        Return 1 if the existing dashboard has the same hash tag and does
+        not need to be uploaded, return 0 if it needs to be uploaded,
+        return -1 on error.
+        """
+        if title_name not in dashboard_dict:
+            return 0
+        items = dashboard_dict[title_name]
+        if (len(items) == 1 and "tags" in items[0] and
+                hash_tag in items[0]["tags"]):
+            log.cl_debug("Grafana dashboard [%s] on host [%s] is not "
+                         "changed, skipping", title_name,
+                         self.bes_server_host.sh_hostname)
+            return 1
+        # Overwrite the first one and remove the duplicated ones
+        dashboard["uid"] = items[0]["uid"]
+        for item in items[1:]:
+            ret = self._bes_grafana_dashboard_delete_uid(log, item["uid"])
+            if ret:
+                log.cl_error("failed to delete duplicated dashboard "
+                             "with uid [%s] and title [%s]",
+                             item["uid"], title_name)
+                return -1
+        return 0
+
+    def _bes_grafana_upsert_dashboards(self, log, workspace, dashboards):
         """
-        Replace a bashboard in Grafana
+        Create or overwrite dashboards in Grafana. The existing dashboards
+        are found by a single search and overwritten in place by uid, then
+        the dashboards are uploaded in parallel. The dashboards that has
+        the same hash tag with the existing one are skipped.
+        :param dashboards: a list of (title_name, dashboard, folder_id,
+        hash_tag)
         """
         host = self.bes_server_host
-        ret = self._bes_grafana_dashboard_delete(log, title_name)
-        if ret:
-            log.cl_error("failed to delete Grafana dashboard with title"
-                         "[%s] on host [%s]",
-                         title_name, host.sh_hostname)
+        dashboard_dict = self.bes_grafana_client.bgc_search_dashboards(log)
+        if dashboard_dict is None:
+            log.cl_error("failed to search Grafana dashboards on host [%s]",
+                         host.sh_hostname)
             return -1
 
-        ret = self._bes_grafana_create_dashboard(log, title_name, dashboard,
-                                                 overwrite=False,
-                                                 folder_id=folder_id)
+        args_array = []
+        thread_ids = []
+        for title_name, dashboard, folder_id, hash_tag in dashboards:
+            ret = self._bes_grafana_prepare_upsert(log, dashboard_dict,
+                                                   title_name, dashboard,
+                                                   hash_tag)
+            if ret < 0:
+                return -1
+            if ret > 0:
+                continue
+            args_array.append((self, title_name, dashboard, folder_id))
+            thread_ids.append("dashboard_%s" % slugify(title_name))
+
+        if len(args_array) == 0:
+            log.cl_info("all Grafana dashboards on host [%s] are up to date",
+                        host.sh_hostname)
+            return 0
+
+        log.cl_info("uploading [%d] changed Grafana dashboards to host [%s]",
+                    len(args_array), host.sh_hostname)
+        parallel_execute = \
+            parallel.ParallelExecute(log, workspace, "grafana_dashboard",
+                                     grafana_dashboard_upsert, args_array,
+                                     thread_ids=thread_ids,
+                                     parallelism=GRAFANA_DASHBOARD_PARALLELISM)
+        ret = parallel_execute.pe_run(sleep_interval=0.1)
         if ret:
-            log.cl_error("failed to overwrite Grafana dashboard [%s]",
-                         title_name)
+            log.cl_error("failed to upload Grafana dashboards to host [%s]",
+                         host.sh_hostname)
             return -1
         return 0
 
@@ -871,45 +1021,50 @@ class BarreleServer():
         local_host = barreleye_instance.bei_local_host
         workspace = barreleye_instance.bei_workspace
         jobstat_pattern = barreleye_instance.bei_jobstat_pattern
+        cq_interval = (int(barreleye_instance.bei_collect_interval) *
+                       int(barreleye_instance.bei_continuous_query_periods))
+        slow_interval_multiplier = barreleye_instance.bei_slow_interval_multiplier
+        continuous_queries = \
+            barrele_influxdb.barrele_continuous_queries(log, jobstat_pattern,
+                                                        slow_interval_multiplier)
+        if continuous_queries is None:
+            log.cl_error("failed to get the continuous queries of Influxdb")
+            return -1
 
         log.cl_info("recreating Grafana dashboards on host [%s]",
                     host.sh_hostname)
+        dashboards = []
         for name, fname in GRAFANA_DASHBOARDS.items():
-            dashboard_json_fpath = GRAFANA_DASHBOARD_DIR + "/" + fname
-            dashboard_template_fpath = dashboard_json_fpath + ".template"
-            ret = local_host.sh_path_exists(log, dashboard_template_fpath)
-            if ret < 0:
-                log.cl_error("failed to check whether file [%s] exists on "
-                             "host [%s]", dashboard_template_fpath,
-                             host.sh_hostname)
+            dashboard = grafana_dashboard_load(log, local_host, workspace,
+                                               fname, collect_interval)
+            if dashboard is None:
+                log.cl_error("failed to load Grafana dashboard [%s]", name)
                 return -1
-            if ret:
-                dashboard_json_fpath = (workspace + "/" + fname)
-                with open(dashboard_template_fpath, 'r', encoding='utf-8') as template_file:
-                    lines = template_file.readlines()
-
-                with open(dashboard_json_fpath, 'w', encoding='utf-8') as json_file:
-                    for line in lines:
-                        line = line.replace(TEMPLATE_COLLECT_INTERVAL,
-                                            collect_interval)
-                        line = line.replace(TEMPLATE_DATASOURCE_NAME,
-                                            GRAFANA_DATASOURCE_NAME)
-                        json_file.write(line)
-            else:
-                ret = local_host.sh_path_exists(log, dashboard_json_fpath)
-                if ret < 0:
-                    log.cl_error("failed to check whether file [%s] exists on "
-                                 "host [%s]", dashboard_json_fpath,
-                                 host.sh_hostname)
-                    return -1
-                if ret == 0:
-                    log.cl_error("file [%s] does not on host [%s]",
-                                 dashboard_json_fpath,
-                                 host.sh_hostname)
-                    return -1
-
-            with open(dashboard_json_fpath, "r", encoding='utf-8') as json_file:
-                dashboard = json.load(json_file)
+            rewritten = \
+                barrele_dashboard.dashboard_rewrite_cq_queries(log, name,
+                                                               dashboard,
+                                                               continuous_queries,
+                                                               cq_interval)
+            if rewritten:
+                log.cl_debug("rewrote [%d] queries of Grafana dashboard [%s] "
+                             "to read continuous query measurements",
+                             rewritten, name)
+            shards = barreleye_instance.bei_lustre_exp_sample_shards
+            if shards > 1:
+                barrele_dashboard.dashboard_note_exp_sampling(dashboard,
+                                                              shards,
+                                                              barreleye_instance.bei_lustre_exp_sample_shard)
+            servers = barreleye_instance.bei_barreleye_servers
+            if len(servers) > 1:
+                datasource_names = [server.bes_grafana_datasource_name
+                                    for server in servers]
+                selected = \
+                    barrele_dashboard.dashboard_shard(dashboard,
+                                                      GRAFANA_DATASOURCE_NAME,
+                                                      datasource_names)
+                if selected:
+                    log.cl_debug("[%d] panels of Grafana dashboard [%s] only "
+                                 "show the selected shard", selected, name)
 
             folder_id = 0
             user_patterns = [barrele_constant.BARRELE_JOBSTAT_PATTERN_PROCNAME_UID,
@@ -929,29 +1084,92 @@ class BarreleServer():
                 # SFA dashboards is not supported yet.
                 folder_id = self.bes_disabled_folder_id
 
-            ret = self._bes_grafana_recreate_dashboard(log, name, dashboard,
-                                                       folder_id)
-            if ret:
-                log.cl_error("failed to replace Grafana dashboard "
-                             "[%s] on host [%s]",
-                             name, host.sh_hostname)
-                return -1
+            if folder_id == 0:
+                folder_title = GRAFANA_FOLDER_GENERAL
+            else:
+                folder_title = GRAFANA_FOLDER_DISABLED
+            content = json.dumps(dashboard, sort_keys=True)
+            hash_tag = grafana_dashboard_hash(content, collect_interval,
+                                              GRAFANA_DATASOURCE_NAME,
+                                              folder_title)
+            grafana_dashboard_set_hash(dashboard, hash_tag)
+            dashboards.append((name, dashboard, folder_id, hash_tag))
+
+        ret = self._bes_grafana_upsert_dashboards(log, workspace, dashboards)
+        if ret:
+            log.cl_error("failed to replace Grafana dashboards on host [%s]",
+                         host.sh_hostname)
+            return -1
         return 0
 
+    def bes_grafana_lint_dashboards(self, log, barreleye_instance,
+                                    explain=False, time_range="1h"):
+        """
+        Lint the queries of Grafana dashboards. If explain, run the queries
+        with EXPLAIN ANALYZE on the server to get the costs. Return a list
+        of DashboardQueryLint, or None on error.
+        """
+        # pylint: disable=too-many-locals
+        collect_interval = str(barreleye_instance.bei_collect_interval)
+        local_host = barreleye_instance.bei_local_host
+        workspace = barreleye_instance.bei_workspace
+        jobstat_pattern = barreleye_instance.bei_jobstat_pattern
+        cq_interval = (int(barreleye_instance.bei_collect_interval) *
+                       int(barreleye_instance.bei_continuous_query_periods))
+        slow_interval_multiplier = barreleye_instance.bei_slow_interval_multiplier
+        continuous_queries = \
+            barrele_influxdb.barrele_continuous_queries(log, jobstat_pattern,
+                                                        slow_interval_multiplier)
+        if continuous_queries is None:
+            log.cl_error("failed to get the continuous queries of Influxdb")
+            return None
+        catalog = barrele_measurement.measurement_catalog(log,
+                                                          jobstat_pattern)
+        if catalog is None:
+            log.cl_warning("failed to get the measurement catalog, the "
+                           "measurements and tags will not be checked")
+
+        lints = []
+        for name, fname in GRAFANA_DASHBOARDS.items():
+            dashboard = grafana_dashboard_load(log, local_host, workspace,
+                                               fname, collect_interval)
+            if dashboard is None:
+                log.cl_error("failed to load Grafana dashboard [%s]", name)
+                return None
+            lints += barrele_dashboard.dashboard_lint(name, dashboard,
+                                                      continuous_queries,
+                                                      cq_interval,
+                                                      catalog=catalog)
+        if not explain:
+            return lints
+
+        # Run the queries one by one to avoid overloading the server
+        for lint in lints:
+            explain_query = \
+                barrele_dashboard.influxql_explain_query(lint.dql_query,
+                                                         collect_interval,
+                                                         time_range)
+            cost = barrele_dashboard.influxdb_explain_cost(log,
+                                                           self.bes_influxdb_client,
+                                                           explain_query)
+            if cost is None:
+                log.cl_warning("failed to get the cost of query [%s] in "
+                               "panel [%s] of Grafana dashboard [%s]",
+                               lint.dql_query, lint.dql_panel_title,
+                               lint.dql_dashboard_name)
+                continue
+            lint.dql_cost = cost
+        return lints
+
     def _bes_grafana_user_delete(self, log, user_id):
         """
         Delete a user from Grafana
         """
-        # pylint: disable=bare-except
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/admin/users/%s" % user_id)
-        try:
-            response = requests.delete(url, headers=headers)
-        except:
-            log.cl_error("not able to delete users through [%s]: %s",
-                         url, traceback.format_exc())
+        api_path = "/api/admin/users/%s" % user_id
+        response = self.bes_grafana_client.bgc_delete(log, api_path)
+        if response is None:
+            log.cl_error("not able to delete users through API [%s]",
+                         api_path)
             return -1
         if response.status_code == HTTPStatus.OK:
             return 0
@@ -975,15 +1193,11 @@ class BarreleServer():
             "password": password,
         }
 
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/admin/users")
-        try:
-            response = requests.post(url, json=data, headers=headers)
-        except:
-            log.cl_error("not able to add user through [%s]: %s",
-                         url, traceback.format_exc())
+        api_path = "/api/admin/users"
+        response = self.bes_grafana_client.bgc_post(log, api_path, data)
+        if response is None:
+            log.cl_error("not able to add user through API [%s]",
+                         api_path)
             return -1
         if response.status_code != HTTPStatus.OK:
             log.cl_error("got status [%d] when adding user [%s] to Grafana",
@@ -995,17 +1209,11 @@ class BarreleServer():
         """
         Add viewer user
         """
-        # pylint: disable=bare-except
-        headers = {"Content-type": "application/json",
-                   "Accept": "application/json"}
-
-        url = self.bes_grafana_admin_url("/api/users/lookup?loginOrEmail=%s" %
-                                         (slugify(name)))
-        try:
-            response = requests.get(url, headers=headers)
-        except:
-            log.cl_error("not able to get users through [%s]: %s",
-                         url, traceback.format_exc())
+        api_path = "/api/users/lookup?loginOrEmail=%s" % (slugify(name))
+        response = self.bes_grafana_client.bgc_get(log, api_path)
+        if response is None:
+            log.cl_error("not able to get users through API [%s]",
+                         api_path)
             return -1, None
         if response.status_code == HTTPStatus.OK:
             return 1, response.json()
@@ -1060,9 +1268,9 @@ class BarreleServer():
                          host.sh_hostname)
             return ret
 
-        ret = self._bes_grafana_recreate_folders(log)
+        ret = self._bes_grafana_prepare_folders(log)
         if ret:
-            log.cl_error("failed to recreate Grafana folders on host [%s]",
+            log.cl_error("failed to prepare Grafana folders on host [%s]",
                          host.sh_hostname)
             return ret
 
@@ -1072,7 +1280,8 @@ class BarreleServer():
                          host.sh_hostname)
             return ret
 
-        ret = self._bes_grafana_influxdb_datasource_remove_and_add(log)
+        ret = self._bes_grafana_influxdb_datasources_remove_and_add(log,
+                                                                    barreleye_instance)
         if ret:
             log.cl_error("failed to add Influxdb data source to Grafana on "
                          "host [%s]", host.sh_hostname)
@@ -1091,14 +1300,18 @@ class BarreleServer():
 
     def bes_server_reinstall(self, log, barreleye_instance,
                              erase_influxdb=False,
-                             drop_database=False):
+                             drop_database=False,
+                             reinstall_grafana=True):
         """
-        Reinstall Barreleye server
+        Reinstall Barreleye server. If there are multiple servers, only
+        one of them reinstalls Grafana.
         """
         host = self.bes_server_host
         service_name = "influxdb"
+        timeline = barreleye_instance.bei_timeline
 
-        ret = host.sh_service_stop(log, service_name)
+        ret = timeline.stl_run(log, "stop_influxdb", host.sh_service_stop,
+                               service_name)
         if ret:
             log.cl_error("failed to stop service [%s] on host [%s]",
                          service_name, host.sh_hostname)
@@ -1106,7 +1319,8 @@ class BarreleServer():
 
         if erase_influxdb:
             log.cl_info("erasing data and metadata of Influxdb")
-            ret = self._bes_erase_influxdb(log)
+            ret = timeline.stl_run(log, "erase_influxdb",
+                                   self._bes_erase_influxdb)
             if ret:
                 log.cl_error("failed to erase data and metadata of Influxdb")
                 return -1
@@ -1125,14 +1339,16 @@ class BarreleServer():
                          retval.cr_stderr)
             return -1
 
-        ret = self._bes_config_influxdb(log, barreleye_instance)
+        ret = timeline.stl_run(log, "config_influxdb",
+                               self._bes_config_influxdb, barreleye_instance)
         if ret:
             log.cl_error("failed to configure Influxdb")
             return -1
 
         log.cl_info("starting and enabling service [%s] on host [%s]",
                     service_name, host.sh_hostname)
-        ret = self._bes_influxdb_service_start_enable(log)
+        ret = timeline.stl_run(log, "start_influxdb",
+                               self._bes_influxdb_service_start_enable)
         if ret:
             log.cl_error("failed to starting or enabling service [%s] on "
                          "host [%s]", service_name, host.sh_hostname)
@@ -1140,20 +1356,29 @@ class BarreleServer():
 
         log.cl_info("waiting until Influxdb runs well on host [%s]",
                     host.sh_hostname)
-        ret = utils.wait_condition(log, self._bes_influxdb_create_database,
-                                   (drop_database,),
-                                   timeout=600,
-                                   quit_func=self._bes_influxdb_check_service)
+        ret = timeline.stl_run(log, "create_influxdb_database",
+                               utils.wait_condition,
+                               self._bes_influxdb_create_database,
+                               (drop_database,),
+                               timeout=600,
+                               quit_func=self._bes_influxdb_check_service)
         if ret:
             log.cl_error("failed to create Influxdb database")
             return -1
 
-        ret = self._bes_influxdb_recreate_cqs(log, barreleye_instance)
+        ret = timeline.stl_run(log, "recreate_continuous_queries",
+                               self._bes_influxdb_recreate_cqs,
+                               barreleye_instance)
         if ret:
             log.cl_error("failed to recreate continuous queries of Influxdb")
             return -1
 
-        ret = self._bes_grafana_reinstall(log, barreleye_instance)
+        if not reinstall_grafana:
+            return 0
+
+        ret = timeline.stl_run(log, "reinstall_grafana",
+                               self._bes_grafana_reinstall,
+                               barreleye_instance)
         if ret:
             log.cl_error("failed to reinstall Grafana on host [%s]",
                          host.sh_hostname)
@@ -1161,29 +1386,35 @@ class BarreleServer():
         return 0
 
     def _bes_influxdb_cq_create(self, log, barreleye_instance,
-                                measurement, groups, where=""):
+                                continuous_query):
         """
         Create continuous query in influxdb
         """
-        # pylint: disable=bare-except
         collect_interval = barreleye_instance.bei_collect_interval
         continuous_query_periods = barreleye_instance.bei_continuous_query_periods
-        cq_query = INFLUXDB_CQ_PREFIX + measurement
         group_string = ""
-        cq_measurement = INFLUXDB_CQ_MEASUREMENT_PREFIX + measurement
-        for group in groups:
+        for group in continuous_query.icq_groups:
             group_string += ', "%s"' % group
-            cq_query += "_%s" % group
-            cq_measurement += "-%s" % group
 
-        cq_time = int(collect_interval) * int(continuous_query_periods)
+        cq_time = (int(collect_interval) * int(continuous_query_periods) *
+                   continuous_query.icq_interval_multiplier)
+        if (continuous_query.icq_function ==
+                barrele_influxdb.INFLUXDB_CQ_FUNCTION_MEAN):
+            # Keep the field name the same with the other continuous
+            # queries, so that the dashboards can read them in the same way
+            select = 'mean("value") AS "sum"'
+        else:
+            select = 'sum("value") / %s' % continuous_query_periods
         query = ('CREATE CONTINUOUS QUERY %s ON "%s" \n'
-                 'BEGIN SELECT sum("value") / %s INTO "%s" \n'
+                 'BEGIN SELECT %s INTO "%s" \n'
                  '    FROM "%s" %s GROUP BY time(%ds)%s \n'
                  'END;' %
-                 (cq_query, barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME,
-                  continuous_query_periods, cq_measurement,
-                  measurement, where, cq_time, group_string))
+                 (continuous_query.icq_name(),
+                  barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME,
+                  select,
+                  continuous_query.icq_cq_measurement(),
+                  continuous_query.icq_measurement,
+                  continuous_query.icq_where, cq_time, group_string))
         response = self.bes_influxdb_client.bic_query(log, query)
         if response is None:
             log.cl_error("failed to create continuous query with query [%s]",
@@ -1197,16 +1428,13 @@ class BarreleServer():
             return -1
         return 0
 
-    def bes_influxdb_cq_delete(self, log, measurement, groups):
+    def bes_influxdb_cq_delete(self, log, continuous_query):
         """
         Delete continuous query in influxdb
         """
-        # pylint: disable=bare-except
-        cq_query = INFLUXDB_CQ_PREFIX + measurement
-        for group in groups:
-            cq_query += "_%s" % group
         query = ('DROP CONTINUOUS QUERY %s ON "%s";' %
-                 (cq_query, barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME))
+                 (continuous_query.icq_name(),
+                  barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME))
         response = self.bes_influxdb_client.bic_query(log, query)
         if response is None:
             log.cl_error("failed to drop continuous query with query [%s]",
@@ -1220,221 +1448,55 @@ class BarreleServer():
             return -1
         return 0
 
-    def _bes_influxdb_cq_recreate(self, log, barreleye_instance, measurement,
-                                  groups, where=""):
+    def _bes_influxdb_cq_recreate(self, log, barreleye_instance,
+                                  continuous_query):
         """
         Create continuous query in influxdb, delete one first if necesary
         """
-        # Sort the groups so that we will get a unique cq name for the same groups
-        groups.sort()
         ret = self._bes_influxdb_cq_create(log, barreleye_instance,
-                                           measurement, groups, where=where)
+                                           continuous_query)
         if ret == 0:
             return 0
 
-        ret = self.bes_influxdb_cq_delete(log, measurement, groups)
+        ret = self.bes_influxdb_cq_delete(log, continuous_query)
         if ret:
             return ret
 
         ret = self._bes_influxdb_cq_create(log, barreleye_instance,
-                                           measurement, groups, where=where)
+                                           continuous_query)
         if ret:
             log.cl_error("failed to create continuous query for measurement [%s]",
-                         measurement)
+                         continuous_query.icq_measurement)
         return ret
 
     def _bes_influxdb_recreate_cqs(self, log, barreleye_instance):
         """
         Create all the continuous queries of Influxdb
         """
-        # pylint: disable=too-many-statements
         log.cl_info("recreating continuous queries of Influxdb on host [%s]",
                     self.bes_server_host.sh_hostname)
-        continuous_queries = []
-        InfluxdbContinuousQuery = barrele_influxdb.InfluxdbContinuousQuery
-        continuous_query = InfluxdbContinuousQuery("mdt_acctuser_samples",
-                                                   ["fs_name", "optype",
-                                                    "user_id"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("mdt_acctgroup_samples",
-                                                   ["fs_name", "group_id",
-                                                    "optype"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("mdt_acctproject_samples",
-                                                   ["fs_name", "optype",
-                                                    "project_id"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("ost_acctuser_samples",
-                                                   ["fs_name", "optype",
-                                                    "user_id"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("ost_acctgroup_samples",
-                                                   ["fs_name", "optype",
-                                                    "group_id"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("ost_acctproject_samples",
-                                                   ["fs_name", "optype",
-                                                    "project_id"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("exp_md_stats",
-                                                   ["exp_client", "fs_name"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("mdt_jobstats_samples",
-                                                   ["fs_name", "job_id"])
-        continuous_queries.append(continuous_query)
-
-        if (barreleye_instance.bei_jobstat_pattern ==
-                barrele_constant.BARRELE_JOBSTAT_PATTERN_PROCNAME_UID):
-            continuous_query = InfluxdbContinuousQuery("mdt_jobstats_samples",
-                                                       ["fs_name", "uid"])
-            continuous_queries.append(continuous_query)
-        elif (barreleye_instance.bei_jobstat_pattern ==
-              barrele_constant.BARRELE_JOBSTAT_PATTERN_UID_GID):
-            continuous_query = InfluxdbContinuousQuery("mdt_jobstats_samples",
-                                                       ["fs_name", "uid"])
-            continuous_queries.append(continuous_query)
-            continuous_query = InfluxdbContinuousQuery("mdt_jobstats_samples",
-                                                       ["fs_name", "gid"])
-            continuous_queries.append(continuous_query)
-        elif (barreleye_instance.bei_jobstat_pattern !=
-              barrele_constant.BARRELE_JOBSTAT_PATTERN_UNKNOWN):
-            log.cl_error("unknown jobstat pattern [%s] when creating "
-                         "continuous queries for MDT",
-                         barreleye_instance.bei_jobstat_pattern)
-            return -1
-        continuous_query = InfluxdbContinuousQuery("ost_stats_bytes",
-                                                   ["fs_name", "optype",
-                                                    "fqdn"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("ost_stats_bytes",
-                                                   ["fs_name", "ost_index"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("ost_stats_bytes",
-                                                   ["fs_name", "fqdn"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("ost_stats_bytes",
-                                                   ["fs_name", "optype"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("ost_kbytesinfo_used",
-                                                   ["fs_name", "optype"])
-        continuous_queries.append(continuous_query)
-        measure_meants = ["ost_brw_stats_page_discontiguous_rpc_samples",
-                          "ost_brw_stats_block_discontiguous_rpc_samples",
-                          "ost_brw_stats_fragmented_io_samples",
-                          "ost_brw_stats_io_in_flight_samples",
-                          "ost_brw_stats_io_time_samples",
-                          "ost_brw_stats_io_size_samples"]
-        for measure_meant in measure_meants:
-            continuous_query = \
-                InfluxdbContinuousQuery(measure_meant,
-                                        ["field", "fs_name", "size"])
-            continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                   ["fs_name", "job_id", "optype"])
-        continuous_queries.append(continuous_query)
-        where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
-        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                   ["fs_name", "job_id"],
-                                                   where=where)
-        continuous_queries.append(continuous_query)
-        where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
-        continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                   ["fs_name", "job_id",
-                                                    "ost_index"],
-                                                   where=where)
-        if (barreleye_instance.bei_jobstat_pattern ==
-                barrele_constant.BARRELE_JOBSTAT_PATTERN_PROCNAME_UID):
-            continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                       ["fs_name", "uid",
-                                                        "optype"])
-            continuous_queries.append(continuous_query)
-            where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
-            continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                       ["fs_name", "uid"],
-                                                       where=where)
-            continuous_queries.append(continuous_query)
-            where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
-            continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                       ["fs_name", "uid",
-                                                        "ost_index"],
-                                                       where=where)
-            continuous_queries.append(continuous_query)
-        elif (barreleye_instance.bei_jobstat_pattern ==
-              barrele_constant.BARRELE_JOBSTAT_PATTERN_UID_GID):
-            # UID
-            continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                       ["fs_name", "uid",
-                                                        "optype"])
-            continuous_queries.append(continuous_query)
-            where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
-            continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                       ["fs_name", "uid"],
-                                                       where=where)
-            continuous_queries.append(continuous_query)
-            where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
-            continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                       ["fs_name", "uid",
-                                                        "ost_index"],
-                                                       where=where)
-            continuous_queries.append(continuous_query)
-
-            # GID
-            continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                       ["fs_name", "gid",
-                                                        "optype"])
-            continuous_queries.append(continuous_query)
-            where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
-            continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                       ["fs_name", "gid"],
-                                                       where=where)
-            continuous_queries.append(continuous_query)
-            where = "WHERE optype = 'sum_read_bytes' OR optype = 'sum_write_bytes'"
-            continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
-                                                       ["fs_name", "gid",
-                                                        "ost_index"],
-                                                       where=where)
-            continuous_queries.append(continuous_query)
-        elif (barreleye_instance.bei_jobstat_pattern !=
-              barrele_constant.BARRELE_JOBSTAT_PATTERN_UNKNOWN):
-            log.cl_error("unknown jobstat pattern [%s] when creating "
-                         "continuous queries for OST",
-                         barreleye_instance.bei_jobstat_pattern)
-            return -1
-        continuous_query = InfluxdbContinuousQuery("ost_brw_stats_rpc_bulk_samples",
-                                                   ["field", "fs_name",
-                                                    "size"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("exp_ost_stats_bytes",
-                                                   ["fs_name", "exp_client",
-                                                    "optype"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("md_stats",
-                                                   ["fs_name"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("md_stats",
-                                                   ["fs_name", "mdt_index"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("md_stats",
-                                                   ["fs_name", "optype"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("mdt_filesinfo_free",
-                                                   ["fs_name"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("mdt_filesinfo_used",
-                                                   ["fs_name"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("ost_kbytesinfo_free",
-                                                   ["fs_name"])
-        continuous_queries.append(continuous_query)
-        continuous_query = InfluxdbContinuousQuery("ost_kbytesinfo_used",
-                                                   ["fs_name"])
-        continuous_queries.append(continuous_query)
+        continuous_queries = \
+            barrele_influxdb.barrele_continuous_queries(log,
+                                                        barreleye_instance.bei_jobstat_pattern,
+                                                        barreleye_instance.bei_slow_interval_multiplier)
+        if continuous_queries is None:
+            log.cl_error("failed to get the continuous queries of Influxdb")
+            return -1
+        catalog = \
+            barrele_measurement.measurement_catalog(log,
+                                                    barreleye_instance.bei_jobstat_pattern)
+        if catalog is None:
+            log.cl_warning("failed to get the measurement catalog, creating "
+                           "all continuous queries without checking")
+        else:
+            continuous_queries = \
+                barrele_measurement.catalog_filter_continuous_queries(log,
+                                                                      catalog,
+                                                                      continuous_queries)
 
         for continuous_query in continuous_queries:
             ret = self._bes_influxdb_cq_recreate(log, barreleye_instance,
-                                                 continuous_query.icq_measurement,
-                                                 continuous_query.icq_groups,
-                                                 where=continuous_query.icq_where)
+                                                 continuous_query)
             if ret:
                 log.cl_error("failed to create continuous query of "
                              "measurement [%s]",
@@ -0,0 +1,302 @@
+"""
+Library for ranking the jobs, users and groups by their I/O on Lustre.
+The rankings are calculated from the measurements written by the
+continuous queries of jobstats, so only one point per interval is read for
+each job, user or group.
+"""
+import json
+import time
+import traceback
+import concurrent.futures
+from http import HTTPStatus
+from pybarrele import barrele_constant
+from pybarrele import barrele_influxdb
+
+# Rank by the bytes read
+TOP_METRIC_READ = "read"
+# Rank by the bytes written
+TOP_METRIC_WRITE = "write"
+# Rank by the bytes read and written
+TOP_METRIC_IO = "io"
+# Rank by the metadata operations
+TOP_METRIC_MD = "md"
+# The metrics to rank by
+TOP_METRICS = [TOP_METRIC_IO, TOP_METRIC_READ, TOP_METRIC_WRITE,
+               TOP_METRIC_MD]
+# The tags of jobstats to rank
+TOP_KEYS = ["job_id", "uid", "gid"]
+# The title of the tag to rank in the table
+TOP_KEY_FIELDS = {"job_id": barrele_constant.BARRELE_FIELD_JOB_ID,
+                  "uid": barrele_constant.BARRELE_FIELD_UID,
+                  "gid": barrele_constant.BARRELE_FIELD_GID}
+# The optype of the bytes read or written in jobstats
+TOP_METRIC_OPTYPES = {TOP_METRIC_READ: "sum_read_bytes",
+                      TOP_METRIC_WRITE: "sum_write_bytes"}
+# The number of points in each chunk of the streamed query results
+TOP_CHUNK_SIZE = 10000
+
+
+def top_continuous_query(log, metric, key, jobstat_pattern):
+    """
+    Return (InfluxdbContinuousQuery, where) to read for ranking the key by
+    the metric. Return (None, None) if Barreleye does not create such
+    continuous query.
+    """
+    where = ""
+    if metric == TOP_METRIC_MD:
+        continuous_query = \
+            barrele_influxdb.InfluxdbContinuousQuery("mdt_jobstats_samples",
+                                                     ["fs_name", key])
+    elif metric == TOP_METRIC_IO:
+        continuous_query = \
+            barrele_influxdb.InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                                     ["fs_name", key])
+    else:
+        continuous_query = \
+            barrele_influxdb.InfluxdbContinuousQuery("ost_jobstats_bytes",
+                                                     ["fs_name", key,
+                                                      "optype"])
+        where = "\"optype\" = '%s'" % TOP_METRIC_OPTYPES[metric]
+
+    continuous_queries = \
+        barrele_influxdb.barrele_continuous_queries(log, jobstat_pattern)
+    if continuous_queries is None:
+        return None, None
+    cq_names = [cq.icq_name() for cq in continuous_queries]
+    if continuous_query.icq_name() not in cq_names:
+        log.cl_error("no continuous query of [%s] by [%s] with jobstat "
+                     "pattern [%s]", continuous_query.icq_measurement,
+                     key, jobstat_pattern)
+        return None, None
+    return continuous_query, where
+
+
+def top_query_string(continuous_query, key, where, since, fs_name=None):
+    """
+    Return the query to read the points of the continuous query since the
+    time. The since is a number of seconds since epoch, or a duration
+    relative to now() like "1h".
+    """
+    conditions = []
+    if where != "":
+        conditions.append(where)
+    if fs_name is not None:
+        conditions.append("\"fs_name\" = '%s'" % fs_name)
+    if isinstance(since, int):
+        conditions.append("time > %ds" % since)
+    else:
+        conditions.append("time > now() - %s" % since)
+    return ('SELECT "sum" FROM "%s" WHERE %s GROUP BY "fs_name", "%s"' %
+            (continuous_query.icq_cq_measurement(), " AND ".join(conditions),
+             key))
+
+
+def series_points(series, key):
+    """
+    Return a list of (time, fs_name, key value, value) of a series in the
+    query results.
+    """
+    tags = series.get("tags", {})
+    fs_name = tags.get("fs_name", "")
+    key_value = tags.get(key, "")
+    points = []
+    for timestamp, value in series.get("values", []):
+        if value is None:
+            continue
+        points.append((timestamp, fs_name, key_value, value))
+    return points
+
+
+def top_query_points(log, influxdb_client, query, key):
+    """
+    Run the query and return a list of (time, fs_name, key value, value).
+    The results are streamed in chunks so that the points of a long time
+    window do not need to be held in a single JSON document. Return None
+    on error.
+    """
+    # pylint: disable=too-many-return-statements
+    response = influxdb_client.bic_query(log, query, epoch="s",
+                                         chunk_size=TOP_CHUNK_SIZE)
+    if response is None:
+        log.cl_error("failed to query Influxdb on host [%s] with query [%s]",
+                     influxdb_client.bic_hostname, query)
+        return None
+
+    if response.status_code != HTTPStatus.OK:
+        log.cl_error("got InfluxDB status [%d] on host [%s] with query [%s]",
+                     response.status_code, influxdb_client.bic_hostname,
+                     query)
+        return None
+
+    points = []
+    try:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            for result in data.get("results", []):
+                if "error" in result:
+                    log.cl_error("got error [%s] from Influxdb on host [%s] "
+                                 "with query [%s]", result["error"],
+                                 influxdb_client.bic_hostname, query)
+                    return None
+                for series in result.get("series", []):
+                    points += series_points(series, key)
+    except:
+        # pylint: disable=bare-except
+        log.cl_error("failed to read the results of query [%s] from "
+                     "Influxdb on host [%s]: %s", query,
+                     influxdb_client.bic_hostname, traceback.format_exc())
+        return None
+    finally:
+        response.close()
+    return points
+
+
+class TopEntry():
+    """
+    A job, user or group in the ranking
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, fs_name, key_value):
+        # Name of the file system
+        self.te_fs_name = fs_name
+        # The job ID, UID or GID
+        self.te_key_value = key_value
+        # The sum of the rates of the intervals in the window
+        self.te_rate_sum = 0.0
+        # The number of the points of the intervals in the window
+        self.te_points = 0
+        # The rank, starts from 1
+        self.te_rank = None
+
+
+class TopRanking():
+    """
+    The ranking of a metric in a sliding time window. The points of each
+    continuous query interval are kept, so that refreshing only needs to
+    read the points of the new intervals, and the expired intervals are
+    subtracted from the totals.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, servers, metric, key, continuous_query, where,
+                 window, cq_interval, fs_name=None):
+        # pylint: disable=too-many-arguments
+        # The list of BarreleServer, the agents send data to different
+        # servers, so the points of all servers are merged.
+        self.tr_servers = servers
+        # The metric to rank by, one of TOP_METRICS
+        self.tr_metric = metric
+        # The tag to rank, one of TOP_KEYS
+        self.tr_key = key
+        # The continuous query that writes the points, type:
+        # InfluxdbContinuousQuery
+        self.tr_continuous_query = continuous_query
+        # The extra condition of the query
+        self.tr_where = where
+        # The seconds of the time window
+        self.tr_window = window
+        # The seconds of the continuous query interval
+        self.tr_cq_interval = cq_interval
+        # Only rank the jobs, users or groups of this file system
+        self.tr_fs_name = fs_name
+        # Key is the time of the interval, value is a list of
+        # (fs_name, key value, value)
+        self.tr_intervals = {}
+        # Key is (fs_name, key value), value is TopEntry
+        self.tr_entries = {}
+        # Key is the hostname of server, value is the time of the newest
+        # interval read from the server, None before the first query.
+        self.tr_newest_times = {}
+        for server in servers:
+            self.tr_newest_times[server.bes_server_host.sh_hostname] = None
+
+    def _tr_server_points(self, log, server):
+        """
+        Return the new points of a server since the last query.
+        """
+        hostname = server.bes_server_host.sh_hostname
+        since = self.tr_newest_times[hostname]
+        if since is None:
+            since = "%ds" % self.tr_window
+        query = top_query_string(self.tr_continuous_query, self.tr_key,
+                                 self.tr_where, since,
+                                 fs_name=self.tr_fs_name)
+        return top_query_points(log, server.bes_influxdb_client, query,
+                                self.tr_key)
+
+    def _tr_add(self, timestamp, fs_name, key_value, value):
+        """
+        Add a point into the ranking.
+        """
+        if timestamp not in self.tr_intervals:
+            self.tr_intervals[timestamp] = []
+        self.tr_intervals[timestamp].append((fs_name, key_value, value))
+        entry_key = (fs_name, key_value)
+        if entry_key not in self.tr_entries:
+            self.tr_entries[entry_key] = TopEntry(fs_name, key_value)
+        entry = self.tr_entries[entry_key]
+        entry.te_rate_sum += value
+        entry.te_points += 1
+
+    def _tr_expire(self, now):
+        """
+        Remove the intervals that are out of the window.
+        """
+        for timestamp in list(self.tr_intervals):
+            if timestamp > now - self.tr_window:
+                continue
+            for fs_name, key_value, value in self.tr_intervals[timestamp]:
+                entry_key = (fs_name, key_value)
+                entry = self.tr_entries[entry_key]
+                entry.te_rate_sum -= value
+                entry.te_points -= 1
+                if entry.te_points == 0:
+                    del self.tr_entries[entry_key]
+            del self.tr_intervals[timestamp]
+
+    def tr_refresh(self, log):
+        """
+        Read the new points from the servers in parallel and merge them
+        into the ranking.
+        """
+        servers = self.tr_servers
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(servers)) as executor:
+            futures = [executor.submit(self._tr_server_points, log, server)
+                       for server in servers]
+            server_points = [future.result() for future in futures]
+
+        for server, points in zip(servers, server_points):
+            hostname = server.bes_server_host.sh_hostname
+            if points is None:
+                log.cl_error("failed to read the points of [%s] from "
+                             "Barreleye server [%s]",
+                             self.tr_continuous_query.icq_cq_measurement(),
+                             hostname)
+                return -1
+            newest_time = self.tr_newest_times[hostname]
+            for timestamp, fs_name, key_value, value in points:
+                self._tr_add(timestamp, fs_name, key_value, value)
+                if newest_time is None or timestamp > newest_time:
+                    newest_time = timestamp
+            self.tr_newest_times[hostname] = newest_time
+        self._tr_expire(time.time())
+        return 0
+
+    def tr_entry_total(self, entry):
+        """
+        Return the bytes or operations of the entry in the window.
+        """
+        # Each point is the average rate in a continuous query interval
+        return entry.te_rate_sum * self.tr_cq_interval
+
+    def tr_top(self, limit):
+        """
+        Return the list of the top TopEntry.
+        """
+        entries = sorted(self.tr_entries.values(),
+                         key=lambda entry: entry.te_rate_sum, reverse=True)
+        entries = entries[:limit]
+        for index, entry in enumerate(entries):
+            entry.te_rank = index + 1
+        return entries
@@ -0,0 +1,247 @@
+"""
+Library for the content-addressed cache of build artifacts.
+
+Each entry of the cache is a directory named by the key of the artifacts,
+which is the hash of everything that affects the content of the
+artifacts, e.g. the hash of the source, the distro, the target CPU and
+the build options. An entry is published by renaming a fully populated
+temporary directory, so a directory with the key name always has
+complete artifacts. Each key has its own lock file, so builds of
+different artifacts never wait for each other.
+"""
+import hashlib
+import json
+import os
+import filelock
+from pybuild import build_constant
+
+# The file under an entry that lists the file names of the artifacts
+ARTIFACT_CACHE_MANIFEST = "manifest.json"
+# Seconds to wait for the lock of a key. The holder of the lock might be
+# building the artifacts, which could take a long time.
+ARTIFACT_CACHE_LOCK_TIMEOUT = 3600
+
+
+def artifact_cache_key(key_dict):
+    """
+    Return the key of the artifacts built from the inputs in the dict.
+    """
+    encoded = json.dumps(key_dict, sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def artifact_cache_file_key(log, host, fpath, key_dict):
+    """
+    Return the key of the artifacts built from the file on the host and the
+    other inputs in the dict. Return None on error.
+    """
+    checksum = host.sh_get_checksum(log, fpath, checksum_command="sha256sum")
+    if checksum is None:
+        log.cl_error("failed to calculate the checksum of file [%s] on "
+                     "host [%s]", fpath, host.sh_hostname)
+        return None
+    key_dict = dict(key_dict)
+    key_dict["source_sha256sum"] = checksum
+    return artifact_cache_key(key_dict)
+
+
+def artifact_cache_dir_key(log, host, dpath, key_dict, excludes=None):
+    """
+    Return the key of the artifacts built from the source tree of the dir on
+    the host and the other inputs in the dict. The files matching the name
+    patterns in excludes and the files of Git are not hashed. Return None on
+    error.
+    """
+    exclude_string = " ! -path './.git/*'"
+    if excludes is not None:
+        for exclude in excludes:
+            exclude_string += " ! -name '%s'" % exclude
+    # Hash the relative paths together with the content of the files, so
+    # renaming a file changes the key too
+    command = ("cd %s && find . -type f%s -print0 | LC_ALL=C sort -z | "
+               "xargs -0 -r sha256sum | sha256sum" %
+               (dpath, exclude_string))
+    retval = host.sh_run(log, command)
+    if retval.cr_exit_status:
+        log.cl_error("failed to run command [%s] on host [%s], "
+                     "ret = [%d], stdout = [%s], stderr = [%s]",
+                     command,
+                     host.sh_hostname,
+                     retval.cr_exit_status,
+                     retval.cr_stdout,
+                     retval.cr_stderr)
+        return None
+    fields = retval.cr_stdout.split()
+    if len(fields) != 2:
+        log.cl_error("unexpected output of command [%s] on host [%s], "
+                     "stdout = [%s]",
+                     command, host.sh_hostname, retval.cr_stdout)
+        return None
+    key_dict = dict(key_dict)
+    key_dict["source_tree_sha256sum"] = fields[0]
+    return artifact_cache_key(key_dict)
+
+
+def artifact_cache_entry(key,
+                         cache_dir=build_constant.CORAL_BUILD_ARTIFACT_CACHE):
+    """
+    Return the dir of the cache entry.
+    """
+    return cache_dir + "/" + key
+
+
+def artifact_cache_lock(key,
+                        cache_dir=build_constant.CORAL_BUILD_ARTIFACT_CACHE):
+    """
+    Return the lock of a key. The holder of the lock is the only one who
+    could build and publish the artifacts of the key.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    return filelock.FileLock(cache_dir + "/" + key + ".lock")
+
+
+def link_files(log, host, source_dir, fnames, target_dir):
+    """
+    Hard link the files into the target dir. Fallback to reflink or copy if
+    the dirs are on different file systems.
+    """
+    if len(fnames) == 0:
+        return 0
+    sources = " ".join([source_dir + "/" + fname for fname in fnames])
+    command = ("mkdir -p %s && (ln -f %s %s 2>/dev/null || "
+               "cp -f --reflink=auto %s %s)" %
+               (target_dir, sources, target_dir, sources, target_dir))
+    retval = host.sh_run(log, command)
+    if retval.cr_exit_status:
+        log.cl_error("failed to run command [%s] on host [%s], "
+                     "ret = [%d], stdout = [%s], stderr = [%s]",
+                     command,
+                     host.sh_hostname,
+                     retval.cr_exit_status,
+                     retval.cr_stdout,
+                     retval.cr_stderr)
+        return -1
+    return 0
+
+
+def artifact_cache_fetch(log, host, key, target_dir,
+                         cache_dir=build_constant.CORAL_BUILD_ARTIFACT_CACHE):
+    """
+    Link the artifacts of the key into the target dir. Return the list of
+    file names. Return [] if the key is not in the cache, None on error.
+    """
+    entry = artifact_cache_entry(key, cache_dir=cache_dir)
+    manifest_fpath = entry + "/" + ARTIFACT_CACHE_MANIFEST
+    try:
+        with open(manifest_fpath, "r", encoding="utf-8") as manifest_file:
+            fnames = json.load(manifest_file)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as error:
+        log.cl_error("failed to read manifest [%s] of build cache: %s",
+                     manifest_fpath, error)
+        return None
+    if not isinstance(fnames, list) or len(fnames) == 0:
+        log.cl_error("invalid manifest [%s] of build cache",
+                     manifest_fpath)
+        return None
+
+    ret = link_files(log, host, entry, fnames, target_dir)
+    if ret:
+        log.cl_error("failed to fetch artifacts [%s] from build cache",
+                     key)
+        return None
+    log.cl_info("fetched artifacts %s from build cache [%s]", fnames,
+                entry)
+    return fnames
+
+
+def artifact_cache_store(log, host, key, source_dir, fnames,
+                         cache_dir=build_constant.CORAL_BUILD_ARTIFACT_CACHE):
+    """
+    Link the files in the source dir into the cache as the artifacts of
+    the key. The caller should hold the lock of the key.
+    """
+    entry = artifact_cache_entry(key, cache_dir=cache_dir)
+    tmp_entry = "%s.tmp.%d" % (entry, os.getpid())
+    command = "rm -fr %s" % tmp_entry
+    retval = host.sh_run(log, command)
+    if retval.cr_exit_status:
+        log.cl_error("failed to run command [%s] on host [%s], "
+                     "ret = [%d], stdout = [%s], stderr = [%s]",
+                     command,
+                     host.sh_hostname,
+                     retval.cr_exit_status,
+                     retval.cr_stdout,
+                     retval.cr_stderr)
+        return -1
+
+    ret = link_files(log, host, source_dir, fnames, tmp_entry)
+    if ret:
+        log.cl_error("failed to save artifacts [%s] into build cache",
+                     key)
+        return -1
+
+    manifest_fpath = tmp_entry + "/" + ARTIFACT_CACHE_MANIFEST
+    try:
+        with open(manifest_fpath, "w", encoding="utf-8") as manifest_file:
+            json.dump(sorted(fnames), manifest_file)
+    except OSError as error:
+        log.cl_error("failed to write manifest [%s] of build cache: %s",
+                     manifest_fpath, error)
+        return -1
+
+    command = "rm -fr %s && mv %s %s" % (entry, tmp_entry, entry)
+    retval = host.sh_run(log, command)
+    if retval.cr_exit_status:
+        log.cl_error("failed to run command [%s] on host [%s], "
+                     "ret = [%d], stdout = [%s], stderr = [%s]",
+                     command,
+                     host.sh_hostname,
+                     retval.cr_exit_status,
+                     retval.cr_stdout,
+                     retval.cr_stderr)
+        return -1
+    log.cl_info("saved artifacts %s into build cache [%s]", fnames, entry)
+    return 0
+
+
+def artifact_cache_fetch_or_build(log, host, key, target_dir, build_funct,
+                                  *args,
+                                  cache_dir=build_constant.CORAL_BUILD_ARTIFACT_CACHE):
+    """
+    Fetch the artifacts of the key into the target dir, or build and save
+    them into the cache if the key is not in the cache. The builds of the
+    same key wait for each other, so the later one fetches the artifacts
+    built by the former one. The build_funct(log, *args) should build the
+    artifacts into the target dir and return the list of file names, or
+    None on error. Return the list of file names, None on error.
+    """
+    # pylint: disable=abstract-class-instantiated
+    lock = artifact_cache_lock(key, cache_dir=cache_dir)
+    try:
+        with lock.acquire(timeout=ARTIFACT_CACHE_LOCK_TIMEOUT):
+            fnames = artifact_cache_fetch(log, host, key, target_dir,
+                                          cache_dir=cache_dir)
+            if fnames is None:
+                log.cl_error("failed to fetch artifacts [%s] from build "
+                             "cache", key)
+                return None
+            if len(fnames) > 0:
+                return fnames
+
+            fnames = build_funct(log, *args)
+            if fnames is None:
+                return None
+            ret = artifact_cache_store(log, host, key, target_dir, fnames,
+                                       cache_dir=cache_dir)
+            if ret:
+                # The artifacts are fine, only the next build will be slower
+                log.cl_warning("failed to save artifacts [%s] into build "
+                               "cache", key)
+            return fnames
+    except filelock.Timeout:
+        log.cl_error("someone else is holding lock of file [%s] for more "
+                     "than [%d] seconds, aborting",
+                     lock.lock_file, ARTIFACT_CACHE_LOCK_TIMEOUT)
+        return None
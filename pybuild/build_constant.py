@@ -5,3 +5,7 @@ from pycoral import constant
 
 
 CORAL_BUILD_CACHE_LOCK = constant.CORAL_LOG_DIR + "/build_cache.lock"
+# Dir of the content-addressed cache of build artifacts. It is not under
+# any build type dir so that it is not copied together with the build
+# cache of a type.
+CORAL_BUILD_ARTIFACT_CACHE = constant.CORAL_BUILD_CACHE + "/artifacts"
@@ -0,0 +1,203 @@
+"""
+Library for rendering the definition XML files of Barreleye from m4 files.
+The rendered XML files are checked and saved in the build cache, keyed by
+the hash of the m4 inputs.
+"""
+import hashlib
+import json
+import os
+import re
+import filelock
+from pycoral import clog
+from pycoral import cmd_general
+from pycoral import ssh_host
+from pybuild import build_common
+from pybuild import build_cache
+from pybarrele import barrele_definition
+
+# The pattern of the include macro in m4 files
+M4_INCLUDE_PATTERN = re.compile(r"include\(`([^']+)'\)")
+
+
+def definition_m4_inputs(log, m4_dir, m4_fname):
+    """
+    Return the list of the m4 file and the files it includes recursively.
+    Return None on error.
+    """
+    inputs = []
+    pending = [m4_fname]
+    while len(pending) > 0:
+        fname = pending.pop(0)
+        if fname in inputs:
+            continue
+        inputs.append(fname)
+        fpath = m4_dir + "/" + fname
+        try:
+            with open(fpath, "r", encoding="utf-8") as m4_file:
+                data = m4_file.read()
+        except OSError as error:
+            log.cl_error("failed to read m4 file [%s]: %s", fpath, error)
+            return None
+        pending += M4_INCLUDE_PATTERN.findall(data)
+    return inputs
+
+
+def definition_cache_key(log, m4_dir, m4_fname):
+    """
+    Return the key of the rendered XML in build cache.
+    """
+    inputs = definition_m4_inputs(log, m4_dir, m4_fname)
+    if inputs is None:
+        return None
+    checksums = {}
+    for fname in inputs:
+        with open(m4_dir + "/" + fname, "rb") as m4_file:
+            checksums[fname] = hashlib.sha256(m4_file.read()).hexdigest()
+    key_dict = {"name": "definition",
+                "m4_fname": m4_fname,
+                "m4_sha256sums": checksums}
+    return build_cache.artifact_cache_key(key_dict)
+
+
+def _render_definition(log, local_host, m4_dir, m4_fname, xml_fname,
+                       cache_key):
+    """
+    Fetch the rendered XML from build cache, or render and check it.
+    """
+    if cache_key is not None:
+        fnames = build_cache.artifact_cache_fetch(log, local_host, cache_key,
+                                                  m4_dir)
+        if fnames == [xml_fname]:
+            return 0
+
+    log.cl_info("rendering definition file [%s]", xml_fname)
+    xml_fpath = m4_dir + "/" + xml_fname
+    # The existing XML might be a hard link of a file in the cache, so
+    # remove it instead of overwriting it.
+    command = ("cd %s && rm -f %s && m4 %s > %s" %
+               (m4_dir, xml_fname, m4_fname, xml_fname))
+    retval = local_host.sh_run(log, command)
+    if retval.cr_exit_status:
+        log.cl_error("failed to run command [%s] on host [%s], "
+                     "ret = [%d], stdout = [%s], stderr = [%s]",
+                     command,
+                     local_host.sh_hostname,
+                     retval.cr_exit_status,
+                     retval.cr_stdout,
+                     retval.cr_stderr)
+        return -1
+
+    checker = barrele_definition.check_definition(log, xml_fpath)
+    if checker is None:
+        log.cl_error("definition file [%s] rendered from [%s] is invalid",
+                     xml_fpath, m4_fname)
+        os.remove(xml_fpath)
+        return -1
+
+    if cache_key is not None:
+        ret = build_cache.artifact_cache_store(log, local_host, cache_key,
+                                               m4_dir, [xml_fname])
+        if ret:
+            log.cl_warning("failed to save definition file [%s] into "
+                           "build cache", xml_fpath)
+    return 0
+
+
+def render_definition(log, m4_dir, m4_fname, xml_fname):
+    """
+    Render the definition XML from the m4 file. The XML is rendered only
+    once for the same m4 inputs, and is checked before being cached.
+    """
+    # pylint: disable=abstract-class-instantiated
+    local_host = ssh_host.get_local_host(ssh=False)
+    cache_key = definition_cache_key(log, m4_dir, m4_fname)
+    if cache_key is None:
+        log.cl_error("failed to get the cache key of [%s]", m4_fname)
+        return -1
+
+    try:
+        lock = build_cache.artifact_cache_lock(cache_key)
+    except OSError as error:
+        log.cl_warning("build cache is not usable: %s", error)
+        return _render_definition(log, local_host, m4_dir, m4_fname,
+                                  xml_fname, None)
+
+    ret = 0
+    try:
+        with lock.acquire(timeout=build_cache.ARTIFACT_CACHE_LOCK_TIMEOUT):
+            ret = _render_definition(log, local_host, m4_dir, m4_fname,
+                                     xml_fname, cache_key)
+            lock.release()
+    except filelock.Timeout:
+        ret = -1
+        log.cl_error("someone else is holding lock of file [%s] for more "
+                     "than [%d] seconds, aborting",
+                     lock.lock_file, build_cache.ARTIFACT_CACHE_LOCK_TIMEOUT)
+    return ret
+
+
+def index_definitions(log, index_fpath, xml_fpaths):
+    """
+    Check the definition XML files and save the measurements and tags
+    defined in each of them into the index file.
+    """
+    index = {}
+    for xml_fpath in xml_fpaths:
+        checker = barrele_definition.check_definition(log, xml_fpath)
+        if checker is None:
+            log.cl_error("definition file [%s] is invalid", xml_fpath)
+            return -1
+        index[os.path.basename(xml_fpath)] = checker.dc_index()
+
+    try:
+        with open(index_fpath, "w", encoding="utf-8") as index_file:
+            json.dump(index, index_file, indent=4, sort_keys=True)
+    except OSError as error:
+        log.cl_error("failed to write definition index [%s]: %s",
+                     index_fpath, error)
+        return -1
+    return 0
+
+
+class CoralDefinitionCommand():
+    """
+    Commands for the definition XML files of Barreleye. These are commands
+    for internal build process.
+    """
+    # pylint: disable=too-few-public-methods
+    def _init(self, log_to_file):
+        # pylint: disable=attribute-defined-outside-init
+        self._cdfc_log_to_file = log_to_file
+
+    def render(self, m4_fname, xml_fname):
+        """
+        Render the definition XML file from the m4 file in current dir.
+
+        :param m4_fname: the m4 file name.
+        :param xml_fname: the XML file name to generate.
+        """
+        # pylint: disable=no-self-use
+        log = clog.get_log(console_format=clog.FMT_NORMAL, overwrite=True)
+        cmd_general.check_argument_fpath(m4_fname)
+        cmd_general.check_argument_fpath(xml_fname)
+        rc = render_definition(log, os.getcwd(), m4_fname, xml_fname)
+        cmd_general.cmd_exit(log, rc)
+
+    def index(self, index_fname, *xml_fnames):
+        """
+        Check the definition XML files and save the measurements defined by
+        them into the index file.
+
+        :param index_fname: the JSON file to save the index.
+        :param xml_fnames: the definition XML files.
+        """
+        # pylint: disable=no-self-use
+        log = clog.get_log(console_format=clog.FMT_NORMAL, overwrite=True)
+        cmd_general.check_argument_fpath(index_fname)
+        for xml_fname in xml_fnames:
+            cmd_general.check_argument_fpath(xml_fname)
+        rc = index_definitions(log, index_fname, xml_fnames)
+        cmd_general.cmd_exit(log, rc)
+
+
+build_common.coral_command_register("definition", CoralDefinitionCommand())
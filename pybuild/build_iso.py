@@ -0,0 +1,34 @@
+"""
+Library for assembling the Coral ISO
+"""
+import os
+from pycoral import clog
+from pycoral import cmd_general
+from pycoral import iso_manifest
+from pybuild import build_common
+
+
+class CoralIsoCommand():
+    """
+    Commands for assembling the ISO. These are commands for internal build
+    process.
+    """
+    # pylint: disable=too-few-public-methods
+    def _init(self, log_to_file):
+        # pylint: disable=attribute-defined-outside-init
+        self._cic_log_to_file = log_to_file
+
+    def manifest(self, iso_dir):
+        """
+        Update the manifest of the file checksums under the ISO dir.
+
+        :param iso_dir: the dir to generate the ISO from.
+        """
+        # pylint: disable=no-self-use
+        log = clog.get_log(console_format=clog.FMT_NORMAL, overwrite=True)
+        cmd_general.check_argument_fpath(iso_dir)
+        rc = iso_manifest.update_iso_manifest(log, os.path.abspath(iso_dir))
+        cmd_general.cmd_exit(log, rc)
+
+
+build_common.coral_command_register("iso", CoralIsoCommand())
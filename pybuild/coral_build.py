@@ -1,20 +1,28 @@
 """
 Library for building Coral
 """
+import os
 import re
+import traceback
+import concurrent.futures
 import filelock
 # pylint: disable=unused-import,too-many-lines
 # Local libs
 from pycoral import ssh_host
+from pycoral import parallel
 from pycoral import constant
 from pycoral import lustre_version
 from pycoral import install_common
 from pycoral import cmd_general
+from pycoral import stage_timeline
 from pybuild import build_constant
 from pybuild import build_barrele
+from pybuild import build_collectd
 from pybuild import build_common
 from pybuild import build_version
 from pybuild import build_doc
+from pybuild import build_definition
+from pybuild import build_iso
 
 # The url of pyinstaller tarball. Need to update together with
 # PYINSTALLER_TARBALL_SHA1SUM
@@ -24,6 +32,9 @@ PYINSTALLER_TARBALL_URL = "https://github.com/pyinstaller/pyinstaller/archive/re
 PYINSTALLER_TARBALL_SHA1SUM = "60c595f5cbe66223d33c6edf1bb731ab9f02c3de"
 # "v4.10.tar.gz" is not a good name, specify the fname to save.
 PYINSTALLER_TABALL_FNAME = "pyinstaller-4.10.tar.gz"
+# The max number of packages to build at the same time. Each package build
+# could run "make -j" or rpmbuild itself, so keep it small.
+BUILD_PACKAGE_PARALLELISM = 4
 
 
 def merge_list(list_x, list_y):
@@ -338,6 +349,7 @@ def install_build_dependency(log, workspace, host, distro, target_cpu,
                       "libyaml-devel",  # yaml C functions.
                       "json-c-devel",  # Needed by json C functions
                       "redhat-lsb-core",  # Needed by detect-distro.sh for lsb_release
+                      "rsync",  # Sync the ISO dir incrementally
                       "wget"]  # Needed by downloading from web
 
     if distro == ssh_host.DISTRO_RHEL7:
@@ -394,10 +406,16 @@ def install_build_dependency(log, workspace, host, distro, target_cpu,
 def get_shared_build_cache_locked(log, host, workspace,
                                   shared_cache):
     """
-    Get the shared build cache
+    Get the shared build cache. The Collectd RPMs are fetched from the build
+    cache of artifacts instead.
     """
-    command = ("mkdir -p %s && cp -a %s %s" %
-               (shared_cache, shared_cache, workspace))
+    # rsync might not be installed yet, use tar to copy with excludes
+    exclude_string = ""
+    for pattern in build_collectd.COLLECTD_RPM_PATTERNS:
+        exclude_string += " --exclude='%s'" % pattern
+    command = ("mkdir -p %s && tar -C %s -cf -%s %s | tar -C %s -xpf -" %
+               (shared_cache, os.path.dirname(shared_cache), exclude_string,
+                os.path.basename(shared_cache), workspace))
     retval = host.sh_run(log, command)
     if retval.cr_exit_status:
         log.cl_error("failed to run command [%s] on host [%s], "
@@ -436,7 +454,8 @@ def get_shared_build_cache(log, host, workspace, shared_cache):
 
 def sync_shared_build_cache(log, host, private_cache, shared_parent):
     """
-    Sync from the local cache to shared cache
+    Sync from the local cache to shared cache. The Collectd RPMs are saved
+    into the build cache of artifacts instead.
     """
     # pylint: disable=abstract-class-instantiated
     log.cl_info("syncing [%s] to shared cache [%s]", private_cache,
@@ -446,7 +465,8 @@ def sync_shared_build_cache(log, host, private_cache, shared_parent):
     ret = 0
     try:
         with lock.acquire(timeout=600):
-            ret = host.sh_sync_two_dirs(log, private_cache, shared_parent)
+            ret = host.sh_sync_two_dirs(log, private_cache, shared_parent,
+                                        excludes=build_collectd.COLLECTD_RPM_PATTERNS)
             lock.release()
     except filelock.Timeout:
         ret = -1
@@ -647,14 +667,38 @@ def get_needed_packages(log, plugins):
     return package_dict
 
 
+def build_package(log, package, timeline, build_args):
+    """
+    Build a package as a stage of the timeline. The build_args is the tuple
+    of the arguments after log passed to cpb_build of the package.
+    """
+    # pylint: disable=bare-except
+    package_name = package.cpb_package_name
+    try:
+        ret = timeline.stl_run(log, "build_package_" + package_name,
+                               package.cpb_build, *build_args)
+    except:
+        log.cl_error("exception when building package [%s]: %s",
+                     package_name, traceback.format_exc())
+        return -1
+    if ret:
+        log.cl_error("failed to build package [%s]",
+                     package_name)
+        return -1
+    return 0
+
+
 def build_packages(log, workspace, local_host, source_dir, target_cpu,
                    type_cache, iso_cache, packages_dir, extra_iso_fnames,
                    extra_package_fnames, extra_rpm_names, option_dict,
-                   package_dict):
+                   package_dict, timeline,
+                   parallelism=BUILD_PACKAGE_PARALLELISM):
     """
-    Build the packages in cpt_packages.
+    Build the packages in cpt_packages. A package starts to build as soon
+    as all of the packages it depends on have been built, so independent
+    packages are built in parallel.
     """
-    # pylint: disable=too-many-locals
+    # pylint: disable=too-many-locals,too-many-branches
     ordered_packages = resolve_package_build_order(log, package_dict)
     if ordered_packages is None:
         return -1
@@ -666,17 +710,52 @@ def build_packages(log, workspace, local_host, source_dir, target_cpu,
         package_str += package.cpb_package_name
     log.cl_info("building packages [%s]", package_str)
 
-    for package in ordered_packages:
-        package_name = package.cpb_package_name
-        ret = package.cpb_build(log, workspace, local_host, source_dir,
-                                target_cpu, type_cache, iso_cache,
-                                packages_dir, extra_iso_fnames,
-                                extra_package_fnames, extra_rpm_names,
-                                option_dict)
-        if ret:
-            log.cl_error("failed to build package [%s]",
-                         package_name)
-            return -1
+    if len(ordered_packages) == 0:
+        return 0
+
+    build_args = (workspace, local_host, source_dir, target_cpu, type_cache,
+                  iso_cache, packages_dir, extra_iso_fnames,
+                  extra_package_fnames, extra_rpm_names, option_dict)
+    built_names = []
+    waiting_packages = ordered_packages[:]
+    failed = False
+    max_workers = max(1, min(parallelism, len(ordered_packages)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_dict = {}
+        while True:
+            if not failed:
+                for package in waiting_packages[:]:
+                    depend_names = package.cpb_depend_package_names
+                    if depend_names is None:
+                        depend_names = []
+                    ready = True
+                    for depend_name in depend_names:
+                        if depend_name not in built_names:
+                            ready = False
+                            break
+                    if not ready:
+                        continue
+                    waiting_packages.remove(package)
+                    thread_id = "build_package_" + package.cpb_package_name
+                    thread_funct = parallel.thread_funct_wrap(log, workspace,
+                                                              thread_id,
+                                                              build_package)
+                    future = executor.submit(thread_funct, package, timeline,
+                                             build_args)
+                    future_dict[future] = package
+            if len(future_dict) == 0:
+                break
+            done, _ = concurrent.futures.wait(future_dict,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                package = future_dict.pop(future)
+                if future.result():
+                    # Wait for the running builds, but do not start more
+                    failed = True
+                    continue
+                built_names.append(package.cpb_package_name)
+    if failed:
+        return -1
     return 0
 
 
@@ -693,15 +772,15 @@ def get_plugin_str(plugins):
     return plugin_str
 
 
-def build(log, source_dir, workspace,
-          cache=constant.CORAL_BUILD_CACHE,
-          lustre_rpms_dir=None,
-          e2fsprogs_rpms_dir=None,
-          collectd=None,
-          enable_zfs=False,
-          enable_devel=False,
-          disable_plugin=None,
-          tsinghua_mirror=False):
+def _build(log, source_dir, workspace, timeline,
+           cache=constant.CORAL_BUILD_CACHE,
+           lustre_rpms_dir=None,
+           e2fsprogs_rpms_dir=None,
+           collectd=None,
+           enable_zfs=False,
+           enable_devel=False,
+           disable_plugin=None,
+           tsinghua_mirror=False):
     """
     Build the Coral ISO.
     """
@@ -793,8 +872,6 @@ def build(log, source_dir, workspace,
             log.cl_warning("option [--collectd %s] has been ignored since "
                            "no need to have Collectd RPMs",
                            collectd)
-    elif collectd is not None:
-        sync_cache_back = False
 
     command = ("mkdir -p %s" % workspace)
     retval = local_host.sh_run(log, command)
@@ -859,17 +936,20 @@ def build(log, source_dir, workspace,
     option_dict = {}
     option_dict["collectd"] = collectd
 
-    ret = build_packages(log, workspace, local_host, source_dir, target_cpu,
-                         type_cache, iso_cache, packages_dir, extra_iso_fnames,
-                         extra_package_fnames, extra_rpm_names, option_dict,
-                         package_dict)
+    ret = timeline.stl_run(log, "build_packages", build_packages,
+                           workspace, local_host, source_dir, target_cpu,
+                           type_cache, iso_cache, packages_dir,
+                           extra_iso_fnames, extra_package_fnames,
+                           extra_rpm_names, option_dict, package_dict,
+                           timeline)
     if ret:
         log.cl_error("failed to build packages")
         return -1
 
     for plugin in plugins:
-        ret = plugin.cpt_build(log, workspace, local_host, source_dir,
-                               target_cpu, type_cache, iso_cache,
+        ret = timeline.stl_run(log, "build_plugin_" + plugin.cpt_plugin_name,
+                               plugin.cpt_build, workspace, local_host,
+                               source_dir, target_cpu, type_cache, iso_cache,
                                packages_dir, extra_iso_fnames,
                                extra_package_fnames, extra_rpm_names,
                                option_dict)
@@ -878,9 +958,10 @@ def build(log, source_dir, workspace,
                          plugin.cpt_plugin_name)
             return -1
 
-    ret = download_dependent_rpms(log, local_host, distro,
-                                  target_cpu, packages_dir,
-                                  extra_package_fnames, extra_rpm_names)
+    ret = timeline.stl_run(log, "download_dependent_rpms",
+                           download_dependent_rpms, local_host, distro,
+                           target_cpu, packages_dir,
+                           extra_package_fnames, extra_rpm_names)
     if ret:
         log.cl_error("failed to download dependent rpms")
         return -1
@@ -898,9 +979,11 @@ def build(log, source_dir, workspace,
                      retval.cr_stderr)
         return -1
 
-    ret = install_common.download_pip3_packages(log, local_host, pip_dir,
-                                                constant.CORAL_DEPENDENT_PIPS,
-                                                tsinghua_mirror=tsinghua_mirror)
+    ret = timeline.stl_run(log, "download_pip3_packages",
+                           install_common.download_pip3_packages,
+                           local_host, pip_dir,
+                           constant.CORAL_DEPENDENT_PIPS,
+                           tsinghua_mirror=tsinghua_mirror)
     if ret:
         log.cl_error("failed to download pip3 packages")
         return -1
@@ -932,16 +1015,18 @@ def build(log, source_dir, workspace,
                 disable_plugins_str, extra_str))
     log.cl_info("running command [%s] on host [%s]", command,
                 local_host.sh_hostname)
+    record = timeline.stl_start("generate_iso")
     retval = local_host.sh_watched_run(log, command, None, None,
                                        return_stdout=False,
                                        return_stderr=False)
+    timeline.stl_finish(record, retval.cr_exit_status)
     if retval.cr_exit_status:
         log.cl_error("failed to run command [%s] on host [%s]",
                      command, local_host.sh_hostname)
         return -1
 
-    # If there is any plugin disabled or Collectd is special, the local cache
-    # might have some things missing thus should not be used by other build.
+    # If there is any plugin disabled, the local cache might have some things
+    # missing thus should not be used by other build.
     if sync_cache_back:
         ret = sync_shared_build_cache(log, local_host, type_cache,
                                       shared_cache)
@@ -951,3 +1036,26 @@ def build(log, source_dir, workspace,
 
     log.cl_info("Built Coral ISO successfully")
     return 0
+
+
+def build(log, source_dir, workspace,
+          cache=constant.CORAL_BUILD_CACHE,
+          lustre_rpms_dir=None,
+          e2fsprogs_rpms_dir=None,
+          collectd=None,
+          enable_zfs=False,
+          enable_devel=False,
+          disable_plugin=None,
+          tsinghua_mirror=False):
+    """
+    Build the Coral ISO and report the time of the build stages.
+    """
+    timeline = stage_timeline.StageTimeline()
+    ret = _build(log, source_dir, workspace, timeline, cache=cache,
+                 lustre_rpms_dir=lustre_rpms_dir,
+                 e2fsprogs_rpms_dir=e2fsprogs_rpms_dir,
+                 collectd=collectd, enable_zfs=enable_zfs,
+                 enable_devel=enable_devel, disable_plugin=disable_plugin,
+                 tsinghua_mirror=tsinghua_mirror)
+    timeline.stl_report(log)
+    return ret
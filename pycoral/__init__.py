@@ -3,11 +3,15 @@ Python library for Coral
 """
 __all__ = ["clog",
            "constant",
+           "event_log",
+           "host_range",
            "install_common",
+           "iso_manifest",
            "lustre_version",
            "lyaml",
            "parallel",
            "ssh_host",
+           "stage_timeline",
            "time_util",
            "utils",
            "version",
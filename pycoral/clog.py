@@ -6,8 +6,11 @@ DO NOT import any library that needs extra python package,
 since this might cause failure of commands that uses this
 library to install python packages.
 """
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 import threading
 import inspect
 import sys
@@ -20,6 +23,8 @@ LOG_DEBUG_FNAME = "debug.log"
 LOG_INFO_FNAME = "info.log"
 LOG_WARNING_FNAME = "warning.log"
 LOG_ERROR_FNAME = "error.log"
+# Command output longer than this will be truncated in debug logs
+LOG_OUTPUT_MAX_SIZE = 65536
 
 #
 # _CLOG_SRC_FILE is used when walking the stack to check when we've got the
@@ -104,6 +109,32 @@ class CoralLogs():
         self.cls_condition.release()
         return log
 
+    def cls_logs_get(self):
+        """
+        Return a list of all the logs
+        """
+        self.cls_condition.acquire()
+        logs = list(self.cls_logs.values())
+        if self.cls_root_log is not None:
+            logs.append(self.cls_root_log)
+        self.cls_condition.release()
+        return logs
+
+    def cls_update_min_levels(self):
+        """
+        Update the minimum levels of the logs since the handlers of
+        a parent logger might have been changed
+        """
+        for log in self.cls_logs_get():
+            log.cl_update_min_level()
+
+    def cls_stop_writers(self):
+        """
+        Stop all background writers so that the queued logs are flushed
+        """
+        for log in self.cls_logs_get():
+            log.cl_stop_writer()
+
     def cls_log_fini(self, log):
         """
         Cleanup a log
@@ -121,6 +152,7 @@ class CoralLogs():
 
 
 GLOBAL_LOGS = CoralLogs()
+atexit.register(GLOBAL_LOGS.cls_stop_writers)
 
 
 def get_message(msg, args):
@@ -143,6 +175,16 @@ def get_message(msg, args):
     return msg
 
 
+def truncate_output(output, max_size=LOG_OUTPUT_MAX_SIZE):
+    """
+    Return the command output truncated to max_size for logging
+    """
+    if output is None or len(output) <= max_size:
+        return output
+    return (output[:max_size] + "... [%d bytes truncated]" %
+            (len(output) - max_size))
+
+
 STDOUT_KEY = "stdout:\n"
 
 
@@ -296,7 +338,7 @@ class CoralLog():
     # pylint: disable=too-many-instance-attributes
     def __init__(self, name=None, resultsdir=None, console_format=FMT_FULL,
                  condition=None, stdout_color=None, stderr_color=None,
-                 remember_records=False):
+                 remember_records=False, background_writer=False):
         self.cl_name = name
         self.cl_result = utils.CommandResult()
         self.cl_resultsdir = resultsdir
@@ -322,18 +364,62 @@ class CoralLog():
             self.cl_records = []
         else:
             self.cl_records = None
+        # Whether write the log files in a background thread
+        self.cl_background_writer = background_writer
+        # The logging.handlers.QueueListener that writes the log files
+        self.cl_queue_listener = None
+        # Logs with level lower than this will be dropped by all handlers
+        self.cl_min_level = logging.NOTSET
 
     def cl_set_propaget(self):
         """
         Whether log events to this logger to higher level loggers
         """
         self.cl_logger.propagate = True
+        self.cl_update_min_level()
 
     def cl_clear_propaget(self):
         """
         Whether log events to this logger to higher level loggers
         """
         self.cl_logger.propagate = False
+        self.cl_update_min_level()
+
+    def cl_update_min_level(self):
+        """
+        Update the minimum level that any handler of this logger or its
+        ancestors would accept
+        """
+        logger = self.cl_logger
+        if logger is None:
+            return
+        min_level = None
+        while logger is not None:
+            for handler in logger.handlers:
+                if min_level is None or handler.level < min_level:
+                    min_level = handler.level
+            if not logger.propagate:
+                break
+            logger = logger.parent
+        if min_level is None:
+            # No handler at all, logging falls back to lastResort
+            min_level = logging.WARNING
+        self.cl_min_level = min_level
+
+    def cl_is_enabled_for(self, level):
+        """
+        Return True if a log with the level would be saved or printed
+        """
+        return self.cl_records is not None or level >= self.cl_min_level
+
+    def cl_stop_writer(self):
+        """
+        Stop the background writer and flush the queued logs
+        """
+        if self.cl_queue_listener is None:
+            return
+        self.cl_queue_listener.stop()
+        self.cl_queue_listener = None
 
     def cl_get_child(self, name, resultsdir=None, console_format=FMT_FULL,
                      overwrite=False, condition=None):
@@ -346,7 +432,8 @@ class CoralLog():
         return get_log(name, resultsdir=resultsdir,
                        console_format=console_format,
                        overwrite=overwrite,
-                       condition=condition)
+                       condition=condition,
+                       background_writer=self.cl_background_writer)
 
     def cl_config(self, console_level=logging.INFO):
         """
@@ -410,6 +497,7 @@ class CoralLog():
         else:
             logger = logging.getLogger(name=name)
 
+        self.cl_stop_writer()
         logger.handlers = []
         logger.setLevel(logging.DEBUG)
 
@@ -424,15 +512,32 @@ class CoralLog():
             self.cl_console_handler.addFilter(console_filter)
 
         if resultsdir is not None:
-            logger.addHandler(debug_handler)
-            logger.addHandler(info_handler)
-            logger.addHandler(warning_handler)
-            logger.addHandler(error_handler)
+            if self.cl_background_writer:
+                # Formatting and writing of the files is done by the
+                # listener thread, the caller only enqueues the record.
+                log_queue = queue.Queue(-1)
+                queue_handler = logging.handlers.QueueHandler(log_queue)
+                queue_handler.setLevel(logging.DEBUG)
+                logger.addHandler(queue_handler)
+                listener = logging.handlers.QueueListener(log_queue,
+                                                          debug_handler,
+                                                          info_handler,
+                                                          warning_handler,
+                                                          error_handler,
+                                                          respect_handler_level=True)
+                listener.start()
+                self.cl_queue_listener = listener
+            else:
+                logger.addHandler(debug_handler)
+                logger.addHandler(info_handler)
+                logger.addHandler(warning_handler)
+                logger.addHandler(error_handler)
             self.cl_debug_handler = debug_handler
             self.cl_info_handler = info_handler
             self.cl_warning_handler = warning_handler
             self.cl_error_handler = error_handler
         self.cl_logger = logger
+        GLOBAL_LOGS.cls_update_min_levels()
 
     def cl_change_config(self, console_format=FMT_FULL, resultsdir=None):
         """
@@ -481,9 +586,15 @@ class CoralLog():
         """
         Emit the log and hande the records
         """
+        enabled = level >= self.cl_min_level
+        # Neither format the message nor walk the stack if no handler
+        # would accept it.
+        if not enabled and self.cl_records is None:
+            return
         message = get_message(msg, args)
         self._cl_append_record(level, message)
-        self._cl_log_raw(level, message)
+        if enabled:
+            self._cl_log_raw(level, message)
 
     def cl_debug(self, msg, *args):
         """
@@ -531,17 +642,20 @@ class CoralLog():
 
 def get_log(name=None, resultsdir=None, console_format=FMT_FULL,
             overwrite=False, condition=None, console_level=logging.INFO,
-            stdout_color=None, stderr_color=None, remember_records=False):
+            stdout_color=None, stderr_color=None, remember_records=False,
+            background_writer=False):
     """
     Get the log.
     If overwrite, the existing log will be overwritten.
+    If background_writer, the log files will be written by a thread.
     """
     log = CoralLog(name=name, resultsdir=resultsdir,
                    console_format=console_format,
                    condition=condition,
                    stdout_color=stdout_color,
                    stderr_color=stderr_color,
-                   remember_records=remember_records)
+                   remember_records=remember_records,
+                   background_writer=background_writer)
     old_log = GLOBAL_LOGS.cls_log_add_or_get(log)
     if old_log is log:
         # Newly added, config it
@@ -562,6 +676,7 @@ def fini_log(log):
     """
     Cleanup the log so the name can be re-used again
     """
+    log.cl_stop_writer()
     return GLOBAL_LOGS.cls_log_fini(log)
 
 ERROR_MSG = colorful_message(COLOR_RED, constant.CMD_MSG_ERROR)
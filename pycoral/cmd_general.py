@@ -9,12 +9,12 @@ import os
 import time
 import socket
 
-import prettytable
-import toml
-import yaml
-from pycoral import lyaml
+# prettytable, toml, yaml and lyaml are imported by the functions that use
+# them, so that commands which do not need them start faster.
 from pycoral import constant
 from pycoral import clog
+from pycoral import event_log
+from pycoral import host_range
 from pycoral import time_util
 from pycoral import utils
 
@@ -31,6 +31,9 @@ def load_config(log, config_fpath):
     """
     Load a config file with YAML/TOML format
     """
+    # pylint: disable=import-outside-toplevel
+    import toml
+    import yaml
     hostname = socket.gethostname()
     if not os.path.exists(config_fpath):
         log.cl_error("file [%s] does not exist on host [%s]",
@@ -73,6 +76,17 @@ def check_argument_fpath(fpath):
         sys.exit(1)
 
 
+def init_event_log(log, workspace):
+    """
+    Start the event log in the workspace, exit on failure
+    """
+    fpath = workspace + "/" + event_log.EVENT_LOG_FNAME
+    ret = event_log.start_event_log(log, fpath)
+    if ret:
+        log.cl_error("failed to start event log")
+        sys.exit(1)
+
+
 def init_env_noconfig(logdir, log_to_file, logdir_is_default,
                       identity=None, force_stdout_color=False,
                       force_stderr_color=False,
@@ -142,7 +156,10 @@ def init_env_noconfig(logdir, log_to_file, logdir_is_default,
                        console_level=logging.INFO,
                        console_format=console_format,
                        stdout_color=stdout_color,
-                       stderr_color=stderr_color)
+                       stderr_color=stderr_color,
+                       background_writer=True)
+    if log_to_file:
+        init_event_log(log, workspace)
 
     return log, workspace
 
@@ -185,7 +202,6 @@ def parse_list_substring(log, list_string):
     # Invalid: host[10-], nothing after minus
     # Invalid: host[10-A], not a number after minus
     # Invalid: host[0x02], not a number (hexadecimal is not supported)
-    # Invalid: host[1-3][1-2], multiple bracket pairs
     # Invalid: host[1-2-3], not a number after minus
     # Invalid: host[0-010], disordered name pattern
     # Invalid: host[10-0], disordered range
@@ -198,126 +214,23 @@ def parse_list_substring(log, list_string):
     # Valid: host[001-010], 10 hosts from host001 to host010
     # Valid: [0-10]a, 11 hosts from 0a to 10a
     # Valid: host[0-10]a, 11 hosts from host0a to host10a
+    # Valid: host[1-3,5], 4 hosts of host1, host2, host3 and host5
+    # Valid: r[1-2]n[01-02], 4 hosts from r1n01 to r2n02
     """
-    # pylint: disable=too-many-locals,too-many-branches
-    # pylint: disable=too-many-statements
-    if len(list_string) == 0:
-        log.cl_error("invalid [%s]: empty string",
-                     list_string)
-        return None
-    start = list_string.find("[")
-    end = list_string.find("]")
-    if start == -1 and end == -1:
-        return [list_string]
-    if start != -1 and end == -1:
-        log.cl_error("invalid [%s]: no closing bracket",
-                     list_string)
-        return None
-    if start == -1 and end != -1:
-        log.cl_error("invalid [%s]: illegal closing bracket",
-                     list_string)
-        return None
-    if start >= end:
-        log.cl_error("invalid [%s]: disordered brackets",
-                     list_string)
-        return None
-
-    if start + 1 == end:
-        log.cl_error("invalid [%s]: empty range",
-                     list_string)
-        return None
-
-    if start == 0:
-        prefix = ""
-    else:
-        prefix = list_string[:start]
-
-    if len(list_string) == end + 1:
-        suffix = ""
-    else:
-        suffix = list_string[end + 1:]
-
-    suffix_start = suffix.find("[")
-    suffix_end = suffix.find("]")
-    if suffix_start != -1 or suffix_end != -1:
-        log.cl_error("invalid [%s]: multiple bracket pairs",
-                     list_string)
-        return None
-
-    range_string = list_string[start + 1: end]
-    minus = range_string.find("-")
-    if minus == -1:
-        try:
-            number = int(range_string, 10)
-        except:
-            log.cl_error("invalid [%s]: not a number",
-                         list_string)
-            return None
-        return [prefix + range_string + suffix]
-
-    if minus == 0:
-        log.cl_error("invalid [%s]: nothing before minus",
-                     list_string)
-        return None
-
-    if minus == len(range_string) - 1:
-        log.cl_error("invalid [%s]: nothing after minus",
-                     list_string)
-        return None
-
-    range_start = range_string[:minus]
-    range_end = range_string[minus + 1:]
-    try:
-        start_number = int(range_start, 10)
-    except:
-        log.cl_error("invalid [%s]: not a number before minus",
-                     list_string)
-        return None
-
-    try:
-        end_number = int(range_end, 10)
-    except:
-        log.cl_error("invalid [%s]: not a number after minus",
-                     list_string)
-        return None
-
-    if start_number > end_number:
-        log.cl_error("invalid [%s]: disordered range",
-                     list_string)
-        return None
-
-    if ((range_start[0] == "0" and len(range_start) != 1) or
-            (range_end[0] == "0" and len(range_end) != 1)):
-        # Need to add 0s in the hostnames
-        if len(range_start) != len(range_end):
-            log.cl_error("invalid [%s]: disordered name pattern",
-                         list_string)
-            return None
-        width = len(range_start)
-    else:
-        width = None
-
-    names = []
-    number = start_number
-    while True:
-        if number > end_number:
-            break
-        index_string = str(number)
-        if width is not None:
-            index_string = index_string.rjust(width, "0")
-        name = prefix + index_string + suffix
-        names.append(name)
-        number += 1
-    return names
+    return host_range.expand_host_pattern(log, list_string)
 
 
 def parse_list_string(log, list_string):
     """
     Return a list of names.
-    The list string contains substring seperated by comma.
+    The list string contains substring seperated by comma out of brackets.
     Each substring need to be able parsed by parse_list_substring().
     """
-    substrings = list_string.split(",")
+    substrings = host_range.split_host_expression(log, list_string)
+    if substrings is None:
+        log.cl_error("invalid list string [%s]",
+                     list_string)
+        return None
     names = []
     for substring in substrings:
         sub_names = parse_list_substring(log, substring)
@@ -533,6 +446,7 @@ def run_test(log, workspace, only_test_names, first_test_names,
     """
     # pylint: disable=too-many-branches,too-many-locals
     # pylint: disable=too-many-statements,global-statement
+    # pylint: disable=import-outside-toplevel
     test_dict = {}
     for test_funct in test_functs:
         test_dict[test_funct.__name__] = test_funct
@@ -634,6 +548,7 @@ def run_test(log, workspace, only_test_names, first_test_names,
                 continue
             selected_tests.append(selected_test)
 
+    import prettytable
     table = prettytable.PrettyTable()
     table.field_names = ["Test name", "Result", "Duration"]
 
@@ -855,7 +770,7 @@ def print_list(log, item_list, quick_fields, slow_fields, none_table_fields,
     Print table of virtual machines
     """
     # pylint: disable=too-many-locals,too-many-branches
-    # pylint: disable=too-many-statements
+    # pylint: disable=too-many-statements,import-outside-toplevel
     if len(quick_fields) == 0:
         log.cl_error("empty table")
         return -1
@@ -881,6 +796,7 @@ def print_list(log, item_list, quick_fields, slow_fields, none_table_fields,
         return -1
 
     if print_table:
+        import prettytable
         table = prettytable.PrettyTable()
         table.set_style(prettytable.PLAIN_COLUMNS)
         table_add_field_names(table, field_names)
@@ -1157,6 +1073,7 @@ class CoralVersionInfo():
         """
         Dump the release info to a file.
         """
+        # pylint: disable=import-outside-toplevel
         prefix = """#
 # Version information of the Coral release.
 #
@@ -1164,12 +1081,14 @@ class CoralVersionInfo():
         config = {}
         config[constant.CORAL_STR_RELEASE_NAME] = self.cvi_release_name
         config[constant.CORAL_STR_RELEASE_DATE] = self.cvi_release_date
+        from pycoral import lyaml
         return lyaml.write_yaml_config(log, prefix, config, fpath)
 
     def cvi_dump(self, log, fpath):
         """
         Dump the info to a file.
         """
+        # pylint: disable=import-outside-toplevel
         prefix = """#
 # Version information of the Coral ISO.
 #
@@ -1179,6 +1098,7 @@ class CoralVersionInfo():
         config[constant.CORAL_STR_TARGET_CPU] = self.cvi_target_cpu
         config[constant.CORAL_STR_DISTRO_SHORT] = self.cvi_distro_short
         config[constant.CORAL_STR_RELEASE_DATE] = self.cvi_release_date
+        from pycoral import lyaml
         return lyaml.write_yaml_config(log, prefix, config, fpath)
 
 
@@ -1187,6 +1107,8 @@ def read_release_info_file(log, release_info_fpath):
     Get Coral version from release info file. Return the release name and
     release date.
     """
+    # pylint: disable=import-outside-toplevel
+    from pycoral import lyaml
     yaml_content = lyaml.read_yaml_file(log, release_info_fpath)
     if yaml_content is None:
         return None, None
@@ -1221,6 +1143,8 @@ def get_version_from_version_file(log, version_file):
     """
     Get Coral version from version file in ISO dir. Return CoralVersionInfo.
     """
+    # pylint: disable=import-outside-toplevel
+    from pycoral import lyaml
     yaml_content = lyaml.read_yaml_file(log, version_file)
     if yaml_content is None:
         return None
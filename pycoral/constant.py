@@ -25,6 +25,8 @@ SOURCE_ISO_FNAME = "ISO"
 BUILD_PACKAGES = "Packages"
 SOURCE_ISO_PACKAGES_PATH = SOURCE_ISO_FNAME + "/" + BUILD_PACKAGES
 BUILD_PIP = "pip"
+# The manifest of file checksums under the ISO dir
+ISO_MANIFEST_FNAME = "MANIFEST.json"
 CORAL_DIR = "/var/lib/coral"
 
 CORAL_LOG_DIR = "/var/log/coral"
@@ -0,0 +1,285 @@
+"""
+Library for writing a structured event log of a run. Each event is a JSON
+object in a single line, e.g. a command that ran on a host or a stage
+that finished. The events are written by a background thread so that
+the callers never wait for the file system.
+
+DO NOT import any library that needs extra python package,
+since this might cause failure of commands that uses this
+library to install python packages.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+
+# The file name of the event log in the workspace of a run
+EVENT_LOG_FNAME = "events.jsonl"
+# The event of a command that ran on a host
+EVENT_TYPE_COMMAND = "command"
+# The event of a stage that finished
+EVENT_TYPE_STAGE = "stage"
+# Events are flushed to the file at least once in this number of seconds
+EVENT_LOG_FLUSH_INTERVAL = 1
+# The max number of events to write in one batch
+EVENT_LOG_BATCH_SIZE = 1024
+# The max length of the command saved in an event
+EVENT_COMMAND_MAX_SIZE = 1024
+
+
+class EventLogWriter():
+    """
+    Write the events into a JSON-lines file in a background thread.
+    """
+    def __init__(self, fpath):
+        # The path of the event log file
+        self.elw_fpath = fpath
+        # The queue of the events to write. None means stop.
+        self.elw_queue = queue.Queue()
+        # The thread that writes the events
+        self.elw_thread = None
+        # The opened file
+        self.elw_file = None
+
+    def elw_start(self, log):
+        """
+        Open the file and start the writer thread.
+        """
+        # pylint: disable=bare-except,consider-using-with
+        try:
+            self.elw_file = open(self.elw_fpath, "a", encoding="utf-8")
+        except:
+            log.cl_error("failed to open event log [%s]: %s",
+                         self.elw_fpath, traceback.format_exc())
+            return -1
+        self.elw_thread = threading.Thread(target=self._elw_main,
+                                           name="event_log_writer",
+                                           daemon=True)
+        self.elw_thread.start()
+        return 0
+
+    def elw_write(self, event):
+        """
+        Queue an event to write.
+        """
+        self.elw_queue.put(event)
+
+    def _elw_write_batch(self, events):
+        """
+        Write a batch of events into the file.
+        """
+        lines = []
+        for event in events:
+            lines.append(json.dumps(event, default=str) + "\n")
+        self.elw_file.write("".join(lines))
+        self.elw_file.flush()
+
+    def _elw_main(self):
+        """
+        Main loop of the writer thread.
+        """
+        stopping = False
+        while not stopping:
+            try:
+                event = self.elw_queue.get(timeout=EVENT_LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            events = []
+            while True:
+                if event is None:
+                    stopping = True
+                    break
+                events.append(event)
+                if len(events) >= EVENT_LOG_BATCH_SIZE:
+                    break
+                try:
+                    event = self.elw_queue.get_nowait()
+                except queue.Empty:
+                    break
+            if len(events) > 0:
+                self._elw_write_batch(events)
+        self.elw_file.close()
+
+    def elw_stop(self):
+        """
+        Write all the queued events and stop the writer thread.
+        """
+        if self.elw_thread is None:
+            return
+        self.elw_queue.put(None)
+        self.elw_thread.join()
+        self.elw_thread = None
+
+
+# The writer of this process, None if the event log is disabled
+EVENT_LOG_WRITER = None
+# The stages that the current thread is running in
+_THREAD_STAGES = threading.local()
+
+
+def start_event_log(log, fpath):
+    """
+    Start writing events into the file.
+    """
+    # pylint: disable=global-statement
+    global EVENT_LOG_WRITER
+    stop_event_log()
+    writer = EventLogWriter(fpath)
+    ret = writer.elw_start(log)
+    if ret:
+        return -1
+    EVENT_LOG_WRITER = writer
+    return 0
+
+
+def stop_event_log():
+    """
+    Flush and stop writing events.
+    """
+    # pylint: disable=global-statement
+    global EVENT_LOG_WRITER
+    writer = EVENT_LOG_WRITER
+    if writer is None:
+        return
+    EVENT_LOG_WRITER = None
+    writer.elw_stop()
+
+
+atexit.register(stop_event_log)
+
+
+def _thread_stages():
+    """
+    Return the stage stack of the current thread.
+    """
+    if not hasattr(_THREAD_STAGES, "stages"):
+        _THREAD_STAGES.stages = []
+    return _THREAD_STAGES.stages
+
+
+def current_stage():
+    """
+    Return the innermost stage that the current thread is running in.
+    """
+    stages = _thread_stages()
+    if len(stages) == 0:
+        return None
+    return stages[-1]
+
+
+def stage_enter(stage):
+    """
+    The current thread starts to run in a stage.
+    """
+    _thread_stages().append(stage)
+
+
+def stage_exit(stage):
+    """
+    The current thread finishes running in a stage.
+    """
+    stages = _thread_stages()
+    for index in range(len(stages) - 1, -1, -1):
+        if stages[index] == stage:
+            del stages[index]
+            break
+
+
+def record_event(event_type, **fields):
+    """
+    Record an event with the fields. Does nothing if the event log is
+    disabled.
+    """
+    writer = EVENT_LOG_WRITER
+    if writer is None:
+        return
+    event = {"time": time.time(),
+             "type": event_type,
+             "thread": threading.current_thread().name}
+    if "stage" not in fields:
+        event["stage"] = current_stage()
+    event.update(fields)
+    writer.elw_write(event)
+
+
+def record_command(hostname, command, duration, exit_status, stdout,
+                   stderr):
+    """
+    Record a command that ran on a host.
+    """
+    if EVENT_LOG_WRITER is None:
+        return
+    if len(command) > EVENT_COMMAND_MAX_SIZE:
+        command = command[:EVENT_COMMAND_MAX_SIZE] + "..."
+    if stdout is None:
+        stdout = ""
+    if stderr is None:
+        stderr = ""
+    record_event(EVENT_TYPE_COMMAND, host=hostname, command=command,
+                 duration=duration, exit_status=exit_status,
+                 stdout_bytes=len(stdout), stderr_bytes=len(stderr))
+
+
+def find_event_log(log, logdir, logdir_is_default, run=None):
+    """
+    Return the path of the event log. If the log dir is the default one,
+    each run has a sub-directory and the newest run is used if run is
+    None.
+    """
+    if not logdir_is_default:
+        if run is not None:
+            log.cl_error("run [%s] can only be specified with the "
+                         "default log dir", run)
+            return None
+        fpath = logdir + "/" + EVENT_LOG_FNAME
+    elif run is not None:
+        fpath = logdir + "/" + run + "/" + EVENT_LOG_FNAME
+    else:
+        try:
+            runs = sorted(os.listdir(logdir), reverse=True)
+        except OSError as error:
+            log.cl_error("failed to list dir [%s]: %s", logdir, error)
+            return None
+        fpath = None
+        for name in runs:
+            candidate = logdir + "/" + name + "/" + EVENT_LOG_FNAME
+            if os.path.isfile(candidate):
+                fpath = candidate
+                break
+        if fpath is None:
+            log.cl_error("no event log found in dir [%s], please rerun "
+                         "the command with --debug", logdir)
+            return None
+    if not os.path.isfile(fpath):
+        log.cl_error("event log [%s] does not exist", fpath)
+        return None
+    return fpath
+
+
+def load_events(log, fpath):
+    """
+    Return a list of events in the file. Lines that are not valid JSON,
+    e.g. a partial line of a killed run, are skipped.
+    """
+    events = []
+    try:
+        with open(fpath, "r", encoding="utf-8") as event_file:
+            for line_number, line in enumerate(event_file):
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    log.cl_debug("skipping invalid line [%d] of event log "
+                                 "[%s]", line_number + 1, fpath)
+                    continue
+                if isinstance(event, dict):
+                    events.append(event)
+    except OSError as error:
+        log.cl_error("failed to read event log [%s]: %s", fpath, error)
+        return None
+    return events
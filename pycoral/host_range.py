@@ -0,0 +1,481 @@
+"""
+Library for compact sets of hostnames, e.g. "oss[000-999]" or
+"r[1-4]n[01-32,40]".
+
+A hostname is saved as a number range under the key of (prefix, width,
+suffix), where the number is the last group of digits in the hostname.
+So 1000 hosts of "oss[000-999]" only take one range, and a membership
+test is a binary search in the ranges of the key.
+
+DO NOT import any library that needs extra python package,
+since this might cause failure of commands that uses this
+library to install python packages.
+"""
+import bisect
+import itertools
+import re
+
+# Split a hostname into prefix, the last group of digits and suffix
+HOST_NUMBER_PATTERN = re.compile(r"^(.*?)(\d+)(\D*)$")
+
+
+def _ranges_insert(ranges, start, end):
+    """
+    Insert [start, end] into the sorted list of disjoint ranges, merging
+    the overlapping and adjacent ones.
+    """
+    index = bisect.bisect_left(ranges, (start,))
+    if index > 0 and ranges[index - 1][1] >= start - 1:
+        index -= 1
+        start = ranges[index][0]
+    last = index
+    while last < len(ranges) and ranges[last][0] <= end + 1:
+        end = max(end, ranges[last][1])
+        last += 1
+    ranges[index:last] = [(start, end)]
+
+
+def _ranges_contain(ranges, number):
+    """
+    Return True if the number is in the sorted list of disjoint ranges.
+    """
+    index = bisect.bisect_right(ranges, (number, float("inf"))) - 1
+    return index >= 0 and ranges[index][1] >= number
+
+
+def _ranges_intersection(ranges, other_ranges):
+    """
+    Return the intersection of two sorted lists of disjoint ranges.
+    """
+    result = []
+    index = 0
+    other_index = 0
+    while index < len(ranges) and other_index < len(other_ranges):
+        start = max(ranges[index][0], other_ranges[other_index][0])
+        end = min(ranges[index][1], other_ranges[other_index][1])
+        if start <= end:
+            result.append((start, end))
+        if ranges[index][1] < other_ranges[other_index][1]:
+            index += 1
+        else:
+            other_index += 1
+    return result
+
+
+def _ranges_difference(ranges, other_ranges):
+    """
+    Return the ranges that are not in the other ranges.
+    """
+    result = []
+    other_index = 0
+    for start, end in ranges:
+        while (other_index < len(other_ranges) and
+               other_ranges[other_index][1] < start):
+            other_index += 1
+        index = other_index
+        while index < len(other_ranges) and other_ranges[index][0] <= end:
+            other_start, other_end = other_ranges[index]
+            if other_start > start:
+                result.append((start, other_start - 1))
+            start = other_end + 1
+            index += 1
+        if start <= end:
+            result.append((start, end))
+    return result
+
+
+def _number_string(number, width):
+    """
+    Return the string of the number padded with zeros to the width.
+    """
+    return str(number).rjust(width, "0")
+
+
+class HostRangeSet():
+    """
+    A set of hostnames saved as number ranges.
+    """
+    def __init__(self):
+        # Key is (prefix, width, suffix), value is a sorted list of
+        # disjoint (start, end) of the numbers in the hostnames
+        self.hrs_range_dict = {}
+        # The hostnames that have no digit
+        self.hrs_names = set()
+
+    def hrs_add_range(self, prefix, width, suffix, start, end):
+        """
+        Add the hostnames from prefix + start + suffix to
+        prefix + end + suffix. The numbers are padded to the width.
+        """
+        key = (prefix, width, suffix)
+        if key not in self.hrs_range_dict:
+            self.hrs_range_dict[key] = []
+        _ranges_insert(self.hrs_range_dict[key], start, end)
+
+    def hrs_add_number_range(self, prefix, suffix, start, end, width=None):
+        """
+        Add the hostnames of the number range. If width is None, the
+        numbers are not padded, so the range could have multiple widths.
+        """
+        if width is not None:
+            self.hrs_add_range(prefix, width, suffix, start, end)
+            return
+        for number_width in range(len(str(start)), len(str(end)) + 1):
+            if number_width == 1:
+                lowest = 0
+            else:
+                lowest = 10 ** (number_width - 1)
+            self.hrs_add_range(prefix, number_width, suffix,
+                               max(start, lowest),
+                               min(end, 10 ** number_width - 1))
+
+    def hrs_add_name(self, name):
+        """
+        Add a hostname.
+        """
+        match = HOST_NUMBER_PATTERN.match(name)
+        if match is None:
+            self.hrs_names.add(name)
+            return
+        prefix, digits, suffix = match.groups()
+        number = int(digits)
+        self.hrs_add_range(prefix, len(digits), suffix, number, number)
+
+    def hrs_copy(self):
+        """
+        Return a copy of this set.
+        """
+        host_range_set = HostRangeSet()
+        for key, ranges in self.hrs_range_dict.items():
+            host_range_set.hrs_range_dict[key] = list(ranges)
+        host_range_set.hrs_names = set(self.hrs_names)
+        return host_range_set
+
+    def hrs_union(self, other):
+        """
+        Return the hostnames in either of the sets.
+        """
+        host_range_set = self.hrs_copy()
+        for key, ranges in other.hrs_range_dict.items():
+            for start, end in ranges:
+                host_range_set.hrs_add_range(key[0], key[1], key[2], start,
+                                             end)
+        host_range_set.hrs_names |= other.hrs_names
+        return host_range_set
+
+    def hrs_intersection(self, other):
+        """
+        Return the hostnames in both of the sets.
+        """
+        host_range_set = HostRangeSet()
+        for key, ranges in self.hrs_range_dict.items():
+            if key not in other.hrs_range_dict:
+                continue
+            result = _ranges_intersection(ranges, other.hrs_range_dict[key])
+            if len(result) > 0:
+                host_range_set.hrs_range_dict[key] = result
+        host_range_set.hrs_names = self.hrs_names & other.hrs_names
+        return host_range_set
+
+    def hrs_difference(self, other):
+        """
+        Return the hostnames in this set but not in the other set.
+        """
+        host_range_set = HostRangeSet()
+        for key, ranges in self.hrs_range_dict.items():
+            if key in other.hrs_range_dict:
+                ranges = _ranges_difference(ranges, other.hrs_range_dict[key])
+            if len(ranges) > 0:
+                host_range_set.hrs_range_dict[key] = list(ranges)
+        host_range_set.hrs_names = self.hrs_names - other.hrs_names
+        return host_range_set
+
+    def __or__(self, other):
+        return self.hrs_union(other)
+
+    def __and__(self, other):
+        return self.hrs_intersection(other)
+
+    def __sub__(self, other):
+        return self.hrs_difference(other)
+
+    def __contains__(self, name):
+        match = HOST_NUMBER_PATTERN.match(name)
+        if match is None:
+            return name in self.hrs_names
+        prefix, digits, suffix = match.groups()
+        key = (prefix, len(digits), suffix)
+        if key not in self.hrs_range_dict:
+            return False
+        return _ranges_contain(self.hrs_range_dict[key], int(digits))
+
+    def __len__(self):
+        number = len(self.hrs_names)
+        for ranges in self.hrs_range_dict.values():
+            for start, end in ranges:
+                number += end - start + 1
+        return number
+
+    def __iter__(self):
+        for key in sorted(self.hrs_range_dict):
+            prefix, width, suffix = key
+            for start, end in self.hrs_range_dict[key]:
+                for number in range(start, end + 1):
+                    yield prefix + _number_string(number, width) + suffix
+        yield from sorted(self.hrs_names)
+
+    def __eq__(self, other):
+        if not isinstance(other, HostRangeSet):
+            return False
+        return (self.hrs_range_dict == other.hrs_range_dict and
+               self.hrs_names == other.hrs_names)
+
+    def __str__(self):
+        patterns = []
+        for key in sorted(self.hrs_range_dict):
+            prefix, width, suffix = key
+            ranges = self.hrs_range_dict[key]
+            if len(ranges) == 1 and ranges[0][0] == ranges[0][1]:
+                patterns.append(prefix + _number_string(ranges[0][0], width) +
+                                suffix)
+                continue
+            range_strings = []
+            for start, end in ranges:
+                if start == end:
+                    range_strings.append(_number_string(start, width))
+                else:
+                    range_strings.append(_number_string(start, width) + "-" +
+                                         _number_string(end, width))
+            patterns.append(prefix + "[" + ",".join(range_strings) + "]" +
+                            suffix)
+        patterns += sorted(self.hrs_names)
+        return ",".join(patterns)
+
+
+def split_host_expression(log, expression):
+    """
+    Split the expression by the commas out of the brackets. Return a list
+    of patterns, or None on error.
+    """
+    patterns = []
+    depth = 0
+    start = 0
+    for index, char in enumerate(expression):
+        if char == "[":
+            if depth > 0:
+                log.cl_error("invalid [%s]: nested brackets", expression)
+                return None
+            depth += 1
+        elif char == "]":
+            if depth == 0:
+                log.cl_error("invalid [%s]: illegal closing bracket",
+                             expression)
+                return None
+            depth -= 1
+        elif char == "," and depth == 0:
+            patterns.append(expression[start:index])
+            start = index + 1
+    if depth > 0:
+        log.cl_error("invalid [%s]: no closing bracket", expression)
+        return None
+    patterns.append(expression[start:])
+    return patterns
+
+
+def parse_range_item(log, pattern, item):
+    """
+    Parse an item in brackets, e.g. "1-10", "01-32" or "40". Return
+    (start, end, width), width is None if the numbers are not padded.
+    Return None on error.
+    """
+    # pylint: disable=too-many-return-statements
+    if len(item) == 0:
+        log.cl_error("invalid [%s]: empty range", pattern)
+        return None
+    minus = item.find("-")
+    if minus == -1:
+        if not item.isdigit():
+            log.cl_error("invalid [%s]: not a number", pattern)
+            return None
+        # Keep the number as it is, e.g. "[040]" means "040"
+        return int(item, 10), int(item, 10), len(item)
+
+    if minus == 0:
+        log.cl_error("invalid [%s]: nothing before minus", pattern)
+        return None
+
+    if minus == len(item) - 1:
+        log.cl_error("invalid [%s]: nothing after minus", pattern)
+        return None
+
+    range_start = item[:minus]
+    range_end = item[minus + 1:]
+    if not range_start.isdigit():
+        log.cl_error("invalid [%s]: not a number before minus", pattern)
+        return None
+
+    if not range_end.isdigit():
+        log.cl_error("invalid [%s]: not a number after minus", pattern)
+        return None
+
+    start_number = int(range_start, 10)
+    end_number = int(range_end, 10)
+    if start_number > end_number:
+        log.cl_error("invalid [%s]: disordered range", pattern)
+        return None
+
+    if ((range_start[0] == "0" and len(range_start) != 1) or
+            (range_end[0] == "0" and len(range_end) != 1)):
+        # Need to add 0s in the hostnames
+        if len(range_start) != len(range_end):
+            log.cl_error("invalid [%s]: disordered name pattern", pattern)
+            return None
+        width = len(range_start)
+    else:
+        width = None
+    return start_number, end_number, width
+
+
+def parse_host_pattern(log, pattern):
+    """
+    Parse a pattern without commas out of brackets. Return a list of
+    segments. A segment is either a string, or a list of
+    (start, end, width) of a bracket pair. Return None on error.
+    """
+    if len(pattern) == 0:
+        log.cl_error("invalid [%s]: empty string", pattern)
+        return None
+    segments = []
+    position = 0
+    while position < len(pattern):
+        start = pattern.find("[", position)
+        if start == -1:
+            if "]" in pattern[position:]:
+                log.cl_error("invalid [%s]: illegal closing bracket", pattern)
+                return None
+            segments.append(pattern[position:])
+            break
+        end = pattern.find("]", start)
+        if end == -1:
+            log.cl_error("invalid [%s]: no closing bracket", pattern)
+            return None
+        if "]" in pattern[position:start]:
+            log.cl_error("invalid [%s]: disordered brackets", pattern)
+            return None
+        if start + 1 == end:
+            log.cl_error("invalid [%s]: empty range", pattern)
+            return None
+        if start > position:
+            segments.append(pattern[position:start])
+        items = []
+        for item_string in pattern[start + 1:end].split(","):
+            item = parse_range_item(log, pattern, item_string)
+            if item is None:
+                return None
+            items.append(item)
+        segments.append(items)
+        position = end + 1
+    return segments
+
+
+def _segment_strings(segment):
+    """
+    Return the strings of a segment in order.
+    """
+    if isinstance(segment, str):
+        return [segment]
+    strings = []
+    for start, end, width in segment:
+        for number in range(start, end + 1):
+            if width is None:
+                strings.append(str(number))
+            else:
+                strings.append(_number_string(number, width))
+    return strings
+
+
+def expand_host_pattern(log, pattern):
+    """
+    Return the list of the hostnames of a pattern in order, or None on
+    error.
+    """
+    segments = parse_host_pattern(log, pattern)
+    if segments is None:
+        return None
+    names = []
+    for strings in itertools.product(*[_segment_strings(segment)
+                                       for segment in segments]):
+        names.append("".join(strings))
+    return names
+
+
+def _add_prefix_ranges(host_range_set, prefix, ranges, suffix):
+    """
+    Add the hostnames of the prefix, a number in the ranges of the last
+    bracket pair and the suffix into the set.
+    """
+    for start, end, width in ranges:
+        if prefix[-1:].isdigit():
+            # The digits of the prefix join the number
+            for name in _segment_strings([(start, end, width)]):
+                host_range_set.hrs_add_name(prefix + name + suffix)
+        else:
+            host_range_set.hrs_add_number_range(prefix, suffix, start,
+                                                end, width=width)
+
+
+def _add_host_pattern(log, host_range_set, pattern):
+    """
+    Add the hostnames of a pattern into the set without expanding the
+    last bracket pair if possible.
+    """
+    segments = parse_host_pattern(log, pattern)
+    if segments is None:
+        return -1
+    last = None
+    for index, segment in enumerate(segments):
+        if not isinstance(segment, str):
+            last = index
+    if last is None:
+        host_range_set.hrs_add_name(pattern)
+        return 0
+
+    suffix = "".join(segments[last + 1:])
+    if re.search(r"\d", suffix):
+        # The last bracket pair is not the last group of digits
+        for name in expand_host_pattern(log, pattern):
+            host_range_set.hrs_add_name(name)
+        return 0
+
+    for strings in itertools.product(*[_segment_strings(segment)
+                                       for segment in segments[:last]]):
+        _add_prefix_ranges(host_range_set, "".join(strings), segments[last],
+                           suffix)
+    return 0
+
+
+def parse_host_range_set(log, expression):
+    """
+    Return the HostRangeSet of an expression, e.g.
+    "oss[000-999],mds1,r[1-4]n[01-32,40]". Return None on error.
+    """
+    patterns = split_host_expression(log, expression)
+    if patterns is None:
+        return None
+    host_range_set = HostRangeSet()
+    for pattern in patterns:
+        ret = _add_host_pattern(log, host_range_set, pattern)
+        if ret:
+            log.cl_error("invalid host list [%s]", expression)
+            return None
+    return host_range_set
+
+
+def host_range_set_from_names(names):
+    """
+    Return the HostRangeSet of the hostnames.
+    """
+    host_range_set = HostRangeSet()
+    for name in names:
+        host_range_set.hrs_add_name(name)
+    return host_range_set
@@ -12,7 +12,17 @@ import sys
 from pycoral import utils
 from pycoral import ssh_host
 from pycoral import constant
+from pycoral import iso_manifest
 from pycoral import parallel
+from pycoral import stage_timeline
+
+# The max number of paths in a command of syncing dir by manifest. The
+# command of a remote host is a single argument of ssh, which is limited
+# to 128KB by Linux.
+SYNC_MANIFEST_BATCH_SIZE = 256
+# If more than this ratio of the files have changed, sync the whole dir
+# rather than the changed files.
+SYNC_MANIFEST_MAX_CHANGED_RATIO = 0.5
 
 
 def find_iso_path_in_cwd(log, host, iso_path_pattern):
@@ -108,6 +118,124 @@ def yum_repo_install(log, host, repo_fpath, rpms):
     return 0
 
 
+def read_host_manifest(log, host, fpath):
+    """
+    Return the manifest saved in a file on the host. Return None if the
+    file does not exist or is invalid.
+    """
+    command = "cat %s" % fpath
+    retval = host.sh_run(log, command)
+    if retval.cr_exit_status:
+        log.cl_debug("failed to read manifest [%s] on host [%s]",
+                     fpath, host.sh_hostname)
+        return None
+    return iso_manifest.manifest_decode(log, retval.cr_stdout,
+                                        host.sh_hostname + ":" + fpath)
+
+
+def run_sync_command(log, host, command, from_local):
+    """
+    Run a command of syncing dir, locally if from_local, otherwise on the
+    host.
+    """
+    if from_local:
+        retval = utils.run(command)
+    else:
+        retval = host.sh_run(log, command)
+    if retval.cr_exit_status:
+        log.cl_error("failed to run command [%s] on host [%s], "
+                     "ret = [%d], stdout = [%s], stderr = [%s]",
+                     command,
+                     host.sh_hostname,
+                     retval.cr_exit_status,
+                     retval.cr_stdout,
+                     retval.cr_stderr)
+        return -1
+    return 0
+
+
+def sync_dir_by_manifest(log, host, source_dir, dest_dir, from_local):
+    """
+    Sync the source dir to the dest dir on the host by comparing the
+    manifest of the source dir with the manifest of the dest dir, which is
+    the manifest installed by the last sync. Only the changed files are
+    transferred. If from_local, the source dir is on the local host,
+    otherwise it is on the same host with the dest dir.
+
+    Return 1 if the source dir has no manifest, or if too many files have
+    changed, in which case the caller should sync the whole dir. Return
+    negative value on failure.
+    """
+    # pylint: disable=too-many-locals,too-many-branches
+    source_manifest_fpath = source_dir + "/" + constant.ISO_MANIFEST_FNAME
+    dest_manifest_fpath = dest_dir + "/" + constant.ISO_MANIFEST_FNAME
+    if from_local:
+        if not os.path.isfile(source_manifest_fpath):
+            return 1
+        new_manifest = iso_manifest.manifest_load(log,
+                                                  source_manifest_fpath)
+    else:
+        new_manifest = read_host_manifest(log, host, source_manifest_fpath)
+    if new_manifest is None:
+        log.cl_debug("no valid manifest in dir [%s]", source_dir)
+        return 1
+
+    old_manifest = read_host_manifest(log, host, dest_manifest_fpath)
+    changed, removed = iso_manifest.manifest_diff(old_manifest, new_manifest)
+    total = len(new_manifest[iso_manifest.ISO_MANIFEST_KEY_FILES])
+    if len(changed) > total * SYNC_MANIFEST_MAX_CHANGED_RATIO:
+        log.cl_info("[%d] of [%d] files changed in dir [%s], syncing the "
+                    "whole dir to host [%s]", len(changed), total,
+                    source_dir, host.sh_hostname)
+        return 1
+    log.cl_info("syncing [%d] changed files and removing [%d] files in "
+                "dir [%s] on host [%s]", len(changed), len(removed),
+                dest_dir, host.sh_hostname)
+
+    # Remove the installed manifest first. If the sync is interrupted, the
+    # next sync will transfer all files.
+    command = "mkdir -p %s && rm -f %s" % (dest_dir, dest_manifest_fpath)
+    ret = run_sync_command(log, host, command, False)
+    if ret:
+        return -1
+
+    # The paths are handled in batches so that the commands do not exceed
+    # the limit of argument length.
+    for index in range(0, len(removed), SYNC_MANIFEST_BATCH_SIZE):
+        removed_paths = ['"%s"' % ssh_host.sh_escape(dest_dir + "/" + fpath)
+                         for fpath in
+                         removed[index:index + SYNC_MANIFEST_BATCH_SIZE]]
+        command = "rm -f %s" % " ".join(removed_paths)
+        ret = run_sync_command(log, host, command, False)
+        if ret:
+            return -1
+    if len(removed) > 0:
+        command = "find %s -mindepth 1 -type d -empty -delete" % dest_dir
+        ret = run_sync_command(log, host, command, False)
+        if ret:
+            return -1
+
+    # The manifest is sent after all other files. The "/./" in the source
+    # paths makes rsync keep the relative paths under the dest dir.
+    batches = [changed[index:index + SYNC_MANIFEST_BATCH_SIZE]
+               for index in range(0, len(changed), SYNC_MANIFEST_BATCH_SIZE)]
+    batches.append([constant.ISO_MANIFEST_FNAME])
+    for fpaths in batches:
+        sources = ['"%s"' % ssh_host.sh_escape(source_dir + "/./" + fpath)
+                   for fpath in fpaths]
+        if from_local:
+            remote_dest = host.sh_encode_remote_paths([dest_dir + "/"],
+                                                      False)
+            command = host.sh_make_rsync_cmd(["-R"] + sources, remote_dest,
+                                             False, False)
+        else:
+            command = ("rsync -aR %s %s/" % (" ".join(sources), dest_dir))
+        ret = run_sync_command(log, host, command, from_local)
+        if ret:
+            return -1
+    return 0
+
+
 def sync_iso_dir(log, workspace, host, iso_pattern, dest_iso_dir,
                  use_cp=False):
     """
@@ -168,7 +296,19 @@ def sync_iso_dir(log, workspace, host, iso_pattern, dest_iso_dir,
         cmds.append("rm -fr %s/*" % (dest_iso_dir))
         cmds.append("cp -a %s/* %s" % (iso_dir, dest_iso_dir))
     else:
-        cmds.append("rsync --delete -a %s/ %s" % (iso_dir, dest_iso_dir))
+        ret = sync_dir_by_manifest(log, host, iso_dir, dest_iso_dir, False)
+        if ret < 0:
+            log.cl_error("failed to sync dir [%s] to dir [%s] on host [%s] "
+                         "by manifest", iso_dir, dest_iso_dir,
+                         host.sh_hostname)
+            cmds = []
+        elif ret == 0:
+            cmds = []
+        else:
+            # ISO built without manifest or too many files changed
+            ret = 0
+            cmds.append("rsync --delete -a %s/ %s" %
+                        (iso_dir, dest_iso_dir))
     for command in cmds:
         retval = host.sh_run(log, command)
         if retval.cr_exit_status:
@@ -297,7 +437,9 @@ class CoralInstallationHost():
                  dependent_rpms, send_fpath_dict, need_backup_fpaths,
                  coral_reinstall=True, tsinghua_mirror=False,
                  disable_selinux=True, disable_firewalld=True,
-                 change_sshd_max_startups=True, config_rsyslog=True):
+                 change_sshd_max_startups=True, config_rsyslog=True,
+                 timeline=None):
+        # pylint: disable=too-many-locals
         self.cih_workspace = workspace
         # ISO dir that configured in repo file
         self.cih_iso_dir = iso_dir
@@ -338,6 +480,10 @@ class CoralInstallationHost():
         self.cih_change_sshd_max_startups = change_sshd_max_startups
         # Whether to change rsyslog to avoid flood of login
         self.cih_config_rsyslog = config_rsyslog
+        # The timeline to record the time of installation stages
+        if timeline is None:
+            timeline = stage_timeline.StageTimeline()
+        self.cih_timeline = timeline
 
     def _cih_send_iso_dir(self, log):
         """
@@ -363,6 +509,16 @@ class CoralInstallationHost():
                          retval.cr_stderr)
             return -1
 
+        ret = sync_dir_by_manifest(log, host, self.cih_iso_dir,
+                                   self.cih_iso_dir, True)
+        if ret == 0:
+            return 0
+        if ret < 0:
+            log.cl_error("failed to sync dir [%s] on local host to host "
+                         "[%s] by manifest", self.cih_iso_dir,
+                         host.sh_hostname)
+            return -1
+
         ret = host.sh_send_file(log, self.cih_iso_dir, target_dirname,
                                 delete_dest=True)
         if ret:
@@ -531,25 +687,14 @@ class CoralInstallationHost():
         Check the service status before reinstallation
         """
         host = self.cih_host
-        command = "rpm -qa | grep coral-"
-        retval = host.sh_run(log, command)
-        if retval.cr_exit_status == 0:
-            rpm_names = retval.cr_stdout.splitlines()
-        elif (retval.cr_exit_status == 1 and
-              len(retval.cr_stdout) == 0):
-            log.cl_debug("no rpm can be find by command [%s] on host [%s], "
-                         "no need to uninstall",
-                         command, host.sh_hostname)
-            rpm_names = []
-        else:
-            log.cl_error("unexpected result of command [%s] on host [%s], "
-                         "ret = [%d], stdout = [%s], stderr = [%s]",
-                         command,
-                         host.sh_hostname,
-                         retval.cr_exit_status,
-                         retval.cr_stdout,
-                         retval.cr_stderr)
+        rpm_names = host.sh_rpm_grep(log, "coral-")
+        if rpm_names is None:
+            log.cl_error("failed to get the installed RPMs on host [%s]",
+                         host.sh_hostname)
             return -1
+        if len(rpm_names) == 0:
+            log.cl_debug("no Coral RPM is installed on host [%s], no need "
+                         "to uninstall", host.sh_hostname)
 
         service_prefix = "/usr/lib/systemd/system/"
         installed_services = []
@@ -693,6 +838,7 @@ class CoralInstallationHost():
         need_backup_fpaths = self.cih_need_backup_fpaths
         coral_reinstall = self.cih_coral_reinstall
         config_rsyslog = self.cih_config_rsyslog
+        timeline = self.cih_timeline
         host = self.cih_host
         hostname = host.sh_hostname
         # only support RHEL7 series
@@ -734,7 +880,8 @@ class CoralInstallationHost():
                              hostname)
                 return -1
 
-        ret = self._cih_send_iso_dir(log)
+        ret = timeline.stl_run(log, "send_iso_dir", self._cih_send_iso_dir,
+                               hostname=hostname)
         if ret:
             log.cl_error("failed to syncing ISO dir from local host [%s] "
                          "to host [%s]", socket.gethostname(), hostname)
@@ -778,15 +925,17 @@ class CoralInstallationHost():
                              hostname)
                 return -1
 
-        ret = yum_repo_install(log, host, repo_config_fpath,
-                               dependent_rpms)
+        ret = timeline.stl_run(log, "install_dependent_rpms",
+                               yum_repo_install, host, repo_config_fpath,
+                               dependent_rpms, hostname=hostname)
         if ret:
             log.cl_error("failed to install dependent RPMs on host "
                          "[%s]", hostname)
             return -1
 
-        ret = host.sh_install_pip3_packages(log, pip_libs,
-                                            self.cih_pip_dir)
+        ret = timeline.stl_run(log, "install_pip_packages",
+                               host.sh_install_pip3_packages, pip_libs,
+                               self.cih_pip_dir, hostname=hostname)
         if ret:
             log.cl_error("failed to install missing pip packages %s in "
                          "dir [%s] on host [%s]",
@@ -801,12 +950,16 @@ class CoralInstallationHost():
                              hostname)
                 return -1
 
-            ret = coral_rpm_reinstall(log, host, self.cih_iso_dir)
+            ret = timeline.stl_run(log, "reinstall_coral_rpms",
+                                   coral_rpm_reinstall, host,
+                                   self.cih_iso_dir, hostname=hostname)
             if ret:
                 log.cl_error("failed to install Coral RPMs on host [%s]",
                              hostname)
                 return -1
-            ret = self._cih_services_preserve(log)
+            ret = timeline.stl_run(log, "preserve_coral_services",
+                                   self._cih_services_preserve,
+                                   hostname=hostname)
             if ret:
                 log.cl_error("failed to preserve Coral services on host [%s]",
                              hostname)
@@ -852,7 +1005,10 @@ def cluster_host_install(log, workspace, installation_host, repo_config_fpath):
     Install on a host of CoralInstallationCluster
     """
     # pylint: disable=unused-argument
-    ret = installation_host.cih_install(log, repo_config_fpath)
+    timeline = installation_host.cih_timeline
+    ret = timeline.stl_run(log, "install", installation_host.cih_install,
+                           repo_config_fpath,
+                           hostname=installation_host.cih_host.sh_hostname)
     if ret:
         log.cl_error("failed to install on host [%s]",
                      installation_host.cih_host.sh_hostname)
@@ -867,8 +1023,9 @@ class CoralInstallationCluster():
     :param workspace: The workspace on local and remote host
     :param hosts: Hosts to install
     :param iso_path: ISO file path on localhost
+    :param timeline: StageTimeline to record the time of installation stages
     """
-    def __init__(self, workspace, local_host, iso_dir):
+    def __init__(self, workspace, local_host, iso_dir, timeline=None):
         # A list of CoralInstallationHost
         self.cic_installation_hosts = []
         # The workspace on local and remote host
@@ -880,6 +1037,10 @@ class CoralInstallationCluster():
         self.cic_repo_config_fpath = workspace + "/coral.repo"
         # Local host to run command
         self.cic_local_host = local_host
+        # The timeline to record the time of installation stages
+        if timeline is None:
+            timeline = stage_timeline.StageTimeline()
+        self.cic_timeline = timeline
 
     def cic_add_hosts(self, hosts, pip_libs, dependent_rpms,
                       send_fpath_dict, need_backup_fpaths,
@@ -903,7 +1064,8 @@ class CoralInstallationCluster():
                                                       disable_selinux=disable_selinux,
                                                       disable_firewalld=disable_firewalld,
                                                       change_sshd_max_startups=change_sshd_max_startups,
-                                                      config_rsyslog=config_rsyslog)
+                                                      config_rsyslog=config_rsyslog,
+                                                      timeline=self.cic_timeline)
             self.cic_installation_hosts.append(installation_host)
 
     def cic_install(self, log, parallelism=10):
@@ -941,7 +1103,9 @@ class CoralInstallationCluster():
             thread_ids.append(thread_id)
             hosts.append(installation_host.cih_host)
 
-        ret = ssh_host.check_clocks_diff(log, hosts, max_diff=60)
+        ret = self.cic_timeline.stl_run(log, "check_clocks",
+                                        ssh_host.check_clocks_diff, hosts,
+                                        max_diff=60)
         if ret:
             log.cl_error("too much clock difference between hosts")
             return -1
@@ -953,7 +1117,9 @@ class CoralInstallationCluster():
                                                     args_array,
                                                     thread_ids=thread_ids,
                                                     parallelism=parallelism)
+        record = self.cic_timeline.stl_start("install_hosts")
         ret = parallel_execute.pe_run()
+        self.cic_timeline.stl_finish(record, ret)
         if ret:
             log.cl_error("failed to install hosts in parallel")
             return -1
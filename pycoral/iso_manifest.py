@@ -0,0 +1,182 @@
+"""
+Library for the manifest of an ISO dir. The manifest records the size,
+modification time and SHA256 checksum of every file in the dir, so that
+the files changed between two builds can be found without reading them.
+
+DO NOT import any library that needs extra python package,
+since this might cause failure of commands that uses this
+library to install python packages.
+"""
+import hashlib
+import json
+import os
+from pycoral import constant
+
+# The version of the manifest format
+ISO_MANIFEST_VERSION = 1
+# The key of the version in the manifest
+ISO_MANIFEST_KEY_VERSION = "version"
+# The key of the files in the manifest
+ISO_MANIFEST_KEY_FILES = "files"
+# The key of the checksum of a file
+ISO_MANIFEST_KEY_SHA256 = "sha256"
+# The key of the size of a file
+ISO_MANIFEST_KEY_SIZE = "size"
+# The key of the modification time of a file in nanoseconds
+ISO_MANIFEST_KEY_MTIME = "mtime_ns"
+# The size of the block when calculating the checksum
+ISO_MANIFEST_READ_SIZE = 1024 * 1024
+
+
+def file_sha256sum(fpath):
+    """
+    Return the SHA256 checksum of a file.
+    """
+    sha256 = hashlib.sha256()
+    with open(fpath, "rb") as checksum_file:
+        while True:
+            data = checksum_file.read(ISO_MANIFEST_READ_SIZE)
+            if not data:
+                break
+            sha256.update(data)
+    return sha256.hexdigest()
+
+
+def manifest_generate(log, iso_dir, old_manifest=None):
+    """
+    Return the manifest of the files under the ISO dir. If the size and
+    modification time of a file are the same with the ones in the old
+    manifest, the checksum in the old manifest is reused. Return None on
+    error.
+    """
+    # pylint: disable=too-many-locals
+    old_files = {}
+    if old_manifest is not None:
+        old_files = old_manifest[ISO_MANIFEST_KEY_FILES]
+
+    files = {}
+    hashed = 0
+    for dirpath, dirnames, fnames in os.walk(iso_dir):
+        dirnames.sort()
+        for fname in sorted(fnames):
+            fpath = dirpath + "/" + fname
+            relative_fpath = os.path.relpath(fpath, iso_dir)
+            if relative_fpath == constant.ISO_MANIFEST_FNAME:
+                continue
+            try:
+                stat_result = os.stat(fpath)
+            except OSError as error:
+                log.cl_error("failed to stat file [%s]: %s", fpath, error)
+                return None
+            size = stat_result.st_size
+            mtime_ns = stat_result.st_mtime_ns
+            old_file = old_files.get(relative_fpath)
+            if (old_file is not None and
+                    old_file[ISO_MANIFEST_KEY_SIZE] == size and
+                    old_file[ISO_MANIFEST_KEY_MTIME] == mtime_ns):
+                checksum = old_file[ISO_MANIFEST_KEY_SHA256]
+            else:
+                try:
+                    checksum = file_sha256sum(fpath)
+                except OSError as error:
+                    log.cl_error("failed to read file [%s]: %s", fpath,
+                                 error)
+                    return None
+                hashed += 1
+            files[relative_fpath] = {ISO_MANIFEST_KEY_SHA256: checksum,
+                                     ISO_MANIFEST_KEY_SIZE: size,
+                                     ISO_MANIFEST_KEY_MTIME: mtime_ns}
+    log.cl_debug("calculated checksums of [%d] out of [%d] files under "
+                 "dir [%s]", hashed, len(files), iso_dir)
+    return {ISO_MANIFEST_KEY_VERSION: ISO_MANIFEST_VERSION,
+            ISO_MANIFEST_KEY_FILES: files}
+
+
+def manifest_decode(log, data, source):
+    """
+    Return the manifest decoded from the JSON string. Return None on
+    error.
+    """
+    try:
+        manifest = json.loads(data)
+    except ValueError as error:
+        log.cl_error("invalid manifest [%s]: %s", source, error)
+        return None
+    if (not isinstance(manifest, dict) or
+            manifest.get(ISO_MANIFEST_KEY_VERSION) != ISO_MANIFEST_VERSION or
+            not isinstance(manifest.get(ISO_MANIFEST_KEY_FILES), dict)):
+        log.cl_error("unsupported manifest [%s]", source)
+        return None
+    return manifest
+
+
+def manifest_load(log, fpath):
+    """
+    Return the manifest saved in the file. Return None on error.
+    """
+    try:
+        with open(fpath, "r", encoding="utf-8") as manifest_file:
+            data = manifest_file.read()
+    except OSError as error:
+        log.cl_error("failed to read manifest [%s]: %s", fpath, error)
+        return None
+    return manifest_decode(log, data, fpath)
+
+
+def manifest_save(log, manifest, fpath):
+    """
+    Save the manifest to the file.
+    """
+    tmp_fpath = fpath + ".tmp"
+    try:
+        with open(tmp_fpath, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        os.rename(tmp_fpath, fpath)
+    except OSError as error:
+        log.cl_error("failed to save manifest [%s]: %s", fpath, error)
+        return -1
+    return 0
+
+
+def manifest_diff(old_manifest, new_manifest):
+    """
+    Return the relative paths of the files that need to be updated and the
+    relative paths of the files that need to be removed to change from the
+    old manifest to the new manifest. The old manifest could be None.
+    """
+    if old_manifest is None:
+        old_files = {}
+    else:
+        old_files = old_manifest[ISO_MANIFEST_KEY_FILES]
+    new_files = new_manifest[ISO_MANIFEST_KEY_FILES]
+    changed = []
+    for relative_fpath, new_file in new_files.items():
+        old_file = old_files.get(relative_fpath)
+        if (old_file is None or
+                old_file[ISO_MANIFEST_KEY_SHA256] !=
+                new_file[ISO_MANIFEST_KEY_SHA256]):
+            changed.append(relative_fpath)
+    removed = [relative_fpath for relative_fpath in old_files
+               if relative_fpath not in new_files]
+    return sorted(changed), sorted(removed)
+
+
+def update_iso_manifest(log, iso_dir):
+    """
+    Generate the manifest of the ISO dir and save it into the dir. The
+    checksums in the existing manifest are reused for unchanged files.
+    """
+    fpath = iso_dir + "/" + constant.ISO_MANIFEST_FNAME
+    old_manifest = None
+    if os.path.isfile(fpath):
+        old_manifest = manifest_load(log, fpath)
+        if old_manifest is None:
+            log.cl_info("ignoring invalid manifest [%s]", fpath)
+    manifest = manifest_generate(log, iso_dir, old_manifest=old_manifest)
+    if manifest is None:
+        log.cl_error("failed to generate manifest of dir [%s]", iso_dir)
+        return -1
+    changed, removed = manifest_diff(old_manifest, manifest)
+    log.cl_info("[%d] files changed and [%d] files removed since the last "
+                "manifest of dir [%s]", len(changed), len(removed), iso_dir)
+    return manifest_save(log, manifest, fpath)
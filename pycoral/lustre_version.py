@@ -44,6 +44,10 @@ class LustreVersion():
         self.lv_name = name
         # Key: RPM_*, value: regular expression to match the RPM fname.
         self.lv_rpm_pattern_dict = rpm_patterns
+        # Key: RPM_*, value: compiled regular expression of the pattern
+        self.lv_rpm_regex_dict = {}
+        for rpm_type, pattern in rpm_patterns.items():
+            self.lv_rpm_regex_dict[rpm_type] = re.compile(pattern)
         # If two versions are matched, the one with higher priority will
         # be used.
         self.lv_priority = priority
@@ -133,71 +137,168 @@ LUSTRE_VERSION_ES6_0 = LustreVersion(LUSTRE_VERSION_NAME_ES6_0,
 LUSTRE_VERSION_DICT[LUSTRE_VERSION_NAME_ES6_0] = LUSTRE_VERSION_ES6_0
 
 
+def rpm_pattern_prefix(pattern):
+    """
+    Return the first word of the fixed prefix that all the RPM fnames
+    matched by the pattern start with, e.g. "kmod" for
+    "^(kmod-lustre-2\\.12.+\\.rpm)$". Return "" if unknown.
+    """
+    if not pattern.startswith("^"):
+        return ""
+    prefix = ""
+    index = 1
+    if pattern.startswith("^("):
+        index = 2
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\" and index + 1 < len(pattern):
+            if pattern[index + 1] not in ".-_":
+                break
+            prefix += pattern[index + 1]
+            index += 2
+            continue
+        if not (char.isalnum() or char in "-_"):
+            break
+        prefix += char
+        index += 1
+    if "-" not in prefix:
+        # The word might be longer than the prefix
+        return ""
+    return prefix.split("-", 1)[0]
+
+
+class LustreVersionMatcher():
+    """
+    The matcher of Lustre versions from RPM fnames. The patterns of all
+    versions are indexed by the first word of RPM fname, so that each RPM
+    fname is only matched against the patterns that could match it.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, versions):
+        # Key is the first word of RPM fname, value is a list of
+        # (LustreVersion, RPM_*, compiled regular expression).
+        self.lvm_index = {}
+        # The patterns that have to be checked for all RPM fnames
+        self.lvm_wildcards = []
+        for version in versions:
+            for rpm_type, regex in version.lv_rpm_regex_dict.items():
+                word = rpm_pattern_prefix(regex.pattern)
+                if word == "":
+                    self.lvm_wildcards.append((version, rpm_type, regex))
+                    continue
+                if word not in self.lvm_index:
+                    self.lvm_index[word] = []
+                self.lvm_index[word].append((version, rpm_type, regex))
+        # Cached results. Key is (frozenset of RPM fnames, skip_kernel,
+        # skip_test), value is (LustreVersion, matched_rpm_type_dict).
+        self.lvm_cache = {}
+
+    def lvm_match(self, rpm_fname):
+        """
+        Yield (LustreVersion, RPM_*) that the RPM fname matches.
+        """
+        word = rpm_fname.split("-", 1)[0]
+        candidates = self.lvm_index.get(word, []) + self.lvm_wildcards
+        for version, rpm_type, regex in candidates:
+            if regex.search(rpm_fname):
+                yield version, rpm_type
+
+    def lvm_candidates(self, rpm_fnames):
+        """
+        Return a dict whose key is (version name, RPM_*), and value is the
+        list of the RPM fnames that match the pattern of the type.
+        """
+        candidate_dict = {}
+        for rpm_fname in rpm_fnames:
+            for version, rpm_type in self.lvm_match(rpm_fname):
+                key = (version.lv_name, rpm_type)
+                if key not in candidate_dict:
+                    candidate_dict[key] = []
+                candidate_dict[key].append(rpm_fname)
+        return candidate_dict
+
+
+def match_version_rpm_types(log, version, required_rpm_types,
+                            candidate_dict):
+    """
+    Match the RPM fnames to the required RPM types of the Lustre version.
+    Return (0, matched_rpm_type_dict) if matched, (0, None) if not
+    matched, or (-1, None) on error.
+    """
+    # Key is RPM type, value is RPM fname
+    matched_rpm_type_dict = {}
+    # Key is RPM fname, value is RPM type
+    used_rpm_fname_dict = {}
+    for rpm_type in required_rpm_types:
+        if rpm_type not in version.lv_rpm_pattern_dict:
+            log.cl_error("Lustre version [%s] does not have required RPM"
+                         "pattern for type [%s]",
+                         version.lv_name, rpm_type)
+            return -1, None
+        matched_fnames = candidate_dict.get((version.lv_name, rpm_type),
+                                            [])
+        if len(matched_fnames) == 0:
+            log.cl_debug("not able to match to Lustre version "
+                         "[%s] because of missing RPM type [%s]",
+                         version.lv_name, rpm_type)
+            return 0, None
+        if len(matched_fnames) > 1:
+            log.cl_error("both RPM [%s] and [%s] can be matched to "
+                         "type [%s] of Lustre version [%s]",
+                         matched_fnames[1], matched_fnames[0],
+                         rpm_type, version.lv_name)
+            return -1, None
+        rpm_fname = matched_fnames[0]
+        if rpm_fname in used_rpm_fname_dict:
+            log.cl_error("RPM [%s] can be matched to both type [%s] "
+                         "and [%s] of Lustre version [%s]",
+                         rpm_fname,
+                         used_rpm_fname_dict[rpm_fname],
+                         rpm_type,
+                         version.lv_name)
+            return -1, None
+        used_rpm_fname_dict[rpm_fname] = rpm_type
+        matched_rpm_type_dict[rpm_type] = rpm_fname
+    return 0, matched_rpm_type_dict
+
+
 def match_lustre_version_from_rpms(log, rpm_fnames, skip_kernel=False,
                                    skip_test=False):
     """
     Match the Lustre version from RPM names
     """
     # pylint: disable=too-many-locals,too-many-branches
+    cache_key = (frozenset(rpm_fnames), skip_kernel, skip_test)
+    if cache_key in LUSTRE_VERSION_MATCHER.lvm_cache:
+        version, rpm_type_dict = LUSTRE_VERSION_MATCHER.lvm_cache[cache_key]
+        if rpm_type_dict is not None:
+            rpm_type_dict = dict(rpm_type_dict)
+        return version, rpm_type_dict
+
+    required_rpm_types = []
+    for rpm_type in LUSTRE_REQUIRED_RPM_TYPES:
+        if rpm_type == RPM_KERNEL and skip_kernel:
+            continue
+        if rpm_type in LUSTRE_TEST_RPM_TYPES and skip_test:
+            continue
+        required_rpm_types.append(rpm_type)
+
+    candidate_dict = LUSTRE_VERSION_MATCHER.lvm_candidates(rpm_fnames)
     # Key is version name, type is matched_rpm_type_dict
     matched_version_dict = {}
     for version in LUSTRE_VERSION_DICT.values():
-        # Key is RPM type, value is RPM fname
-        matched_rpm_type_dict = {}
-        # Key is RPM fname, value is RPM type
-        used_rpm_fname_dict = {}
-        version_matched = True
-        for rpm_type in LUSTRE_REQUIRED_RPM_TYPES:
-            if rpm_type == RPM_KERNEL and skip_kernel:
-                continue
-            if rpm_type in LUSTRE_TEST_RPM_TYPES and skip_test:
-                continue
-            if rpm_type not in version.lv_rpm_pattern_dict:
-                log.cl_error("Lustre version [%s] does not have required RPM"
-                             "pattern for type [%s]",
-                             version.lv_name, rpm_type)
-                return None, None
-            pattern = version.lv_rpm_pattern_dict[rpm_type]
-
-            matched = False
-            for rpm_fname in rpm_fnames:
-                match = re.search(pattern, rpm_fname)
-                if match is None:
-                    continue
-
-                matched = True
-                if rpm_type in matched_rpm_type_dict:
-                    log.cl_error("both RPM [%s] and [%s] can be matched to "
-                                 "type [%s] of Lustre version [%s]",
-                                 rpm_fname,
-                                 matched_rpm_type_dict[rpm_type],
-                                 rpm_type,
-                                 version.lv_name)
-                    return None, None
-
-                if rpm_fname in used_rpm_fname_dict:
-                    log.cl_error("RPM [%s] can be matched to both type [%s] "
-                                 "and [%s] of Lustre version [%s]",
-                                 rpm_fname,
-                                 used_rpm_fname_dict[rpm_fname],
-                                 rpm_type,
-                                 version.lv_name)
-                    return None, None
-                used_rpm_fname_dict[rpm_fname] = rpm_type
-                matched_rpm_type_dict[rpm_type] = rpm_fname
-
-            if not matched:
-                log.cl_debug("not able to match to Lustre version "
-                             "[%s] because of missing RPM type [%s]",
-                             version.lv_name, rpm_type)
-                version_matched = False
-                break
-        if version_matched:
+        ret, matched_rpm_type_dict = \
+            match_version_rpm_types(log, version, required_rpm_types,
+                                    candidate_dict)
+        if ret:
+            return None, None
+        if matched_rpm_type_dict is not None:
             matched_version_dict[version.lv_name] = matched_rpm_type_dict
 
     if len(matched_version_dict) == 0:
         log.cl_debug("no Lustre version is matched by RPMs %s",
                      rpm_fnames)
+        LUSTRE_VERSION_MATCHER.lvm_cache[cache_key] = (None, None)
         return None, None
 
     highest_priority = 0
@@ -223,4 +324,10 @@ def match_lustre_version_from_rpms(log, rpm_fnames, skip_kernel=False,
         log.cl_error("multiple Lustre versions [%s] are matched by RPMs",
                      version_string)
         return None, None
-    return matched_versions[0], matched_rpm_type_dicts[0]
+    LUSTRE_VERSION_MATCHER.lvm_cache[cache_key] = (matched_versions[0],
+                                                   matched_rpm_type_dicts[0])
+    return matched_versions[0], dict(matched_rpm_type_dicts[0])
+
+
+# The matcher built from all the Lustre versions
+LUSTRE_VERSION_MATCHER = LustreVersionMatcher(LUSTRE_VERSION_DICT.values())
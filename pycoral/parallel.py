@@ -8,6 +8,7 @@ library to install python packages.
 import traceback
 import time
 from pycoral import utils
+from pycoral import event_log
 
 
 class ParallelThread():
@@ -48,6 +49,8 @@ class ParallelThread():
                                  "/" + self.pt_id)
         self.pt_log = None
         self.pt_status = ParallelThread.STATUS_NOT_STARTED
+        # The stage of the parent thread when starting this thread
+        self.pt_stage = None
 
     def pt_main(self):
         """
@@ -68,6 +71,8 @@ class ParallelThread():
             return ret
 
         log = self.pt_log
+        if self.pt_stage is not None:
+            event_log.stage_enter(self.pt_stage)
         ret = target_wrap(log, self.pt_workspace, *self.pt_args)
         log.cl_debug("thread [%s] returned [%s]", self.pt_id, ret)
         log.cl_result.cr_exit_status = ret
@@ -90,6 +95,7 @@ class ParallelThread():
         log = self.pt_parallel_execute.pe_log.cl_get_child(self.pt_id,
                                                            resultsdir=resultsdir)
         self.pt_log = log
+        self.pt_stage = event_log.current_stage()
         log.cl_result.cr_clear()
         self.pt_status = ParallelThread.STATUS_RUNNING
         self.pt_thread = utils.thread_start(self.pt_main, ())
@@ -233,3 +239,37 @@ class ParallelExecute():
                         "with retval [%d]",
                         self.pe_name, elapsed, ret)
         return ret
+
+
+def thread_funct_wrap(log, workspace, thread_id, funct):
+    """
+    Return a function to submit to a thread pool. The returned function runs
+    funct with a child log of the thread like ParallelExecute does: the
+    child log is saved under workspace/thread_id if the parent log is saved
+    to files, and the events are recorded in the stage of the thread calling
+    this function. The first argument of funct should be log, the other
+    arguments are the ones passed to the returned function.
+    """
+    stage = event_log.current_stage()
+
+    def thread_main(*args):
+        """
+        Main function of the thread
+        """
+        resultsdir = None
+        if log.cl_resultsdir is not None and workspace is not None:
+            resultsdir = workspace + "/" + thread_id
+            ret = utils.mkdir(resultsdir)
+            if ret:
+                log.cl_error("failed to create directory [%s]", resultsdir)
+                resultsdir = None
+        thread_log = log.cl_get_child(thread_id, resultsdir=resultsdir)
+        if stage is not None:
+            event_log.stage_enter(stage)
+        try:
+            return funct(thread_log, *args)
+        finally:
+            if stage is not None:
+                event_log.stage_exit(stage)
+            thread_log.cl_fini()
+    return thread_main
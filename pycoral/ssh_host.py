@@ -8,6 +8,7 @@ library to install python packages.
 """
 
 import time
+import logging
 import os
 import glob
 import shutil
@@ -17,11 +18,13 @@ import socket
 import traceback
 import getpass
 import datetime
+import concurrent.futures
 
 # local libs
 from pycoral import utils
 from pycoral import clog
 from pycoral import watched_io
+from pycoral import event_log
 
 
 # OS distribution RHEL6/CentOS6
@@ -37,12 +40,23 @@ SHORTEST_TIME_REBOOT = 10
 LONGEST_TIME_REBOOT = 240
 # The longest time that a simple command should finish
 LONGEST_SIMPLE_COMMAND_TIME = 600
+# The default number of hosts to run a command on at the same time
+RUN_ON_HOSTS_PARALLELISM = 64
 # Yum install is slow, so use a larger timeout value
 LONGEST_TIME_YUM_INSTALL = LONGEST_SIMPLE_COMMAND_TIME * 3
 # RPM install is slow, so use a larger timeout value
 LONGEST_TIME_RPM_INSTALL = LONGEST_SIMPLE_COMMAND_TIME * 2
 # The longest time that a issue reboot would stop the SSH server
 LONGEST_TIME_ISSUE_REBOOT = 10
+# The query format to list the installed RPMs. The second field is the same
+# with the output of "rpm -qa".
+RPM_INVENTORY_QUERY_FORMAT = ("%{NAME} %{NAME}-%{VERSION}-%{RELEASE}"
+                              "%|ARCH?{.%{ARCH}}:{}|\\n")
+# The commands that might change the installed RPMs. The cached RPM
+# inventory of the host is dropped after running them.
+RPM_CHANGE_COMMAND_PATTERN = re.compile(r"\b(rpm\s+(-[eiUF][a-zA-Z]*|--(erase|install|"
+                                        r"upgrade|freshen|rebuilddb))|"
+                                        r"yum|dnf)\b")
 
 
 def rpm_name2version(log, rpm_name):
@@ -64,6 +78,42 @@ def rpm_name2version(log, rpm_name):
     return rpm_version
 
 
+class RPMInventory():
+    """
+    The installed RPMs on a host, got from a single query of the RPM
+    database.
+    """
+    def __init__(self, lines):
+        # The full names of the installed RPMs, same as the output of
+        # "rpm -qa"
+        self.ri_rpm_names = []
+        # Key is the package name, value is a list of full names
+        self.ri_package_dict = {}
+        for line in lines:
+            fields = line.split()
+            if len(fields) != 2:
+                continue
+            package_name, rpm_name = fields
+            self.ri_rpm_names.append(rpm_name)
+            if package_name not in self.ri_package_dict:
+                self.ri_package_dict[package_name] = []
+            self.ri_package_dict[package_name].append(rpm_name)
+
+    def ri_has_package(self, package_name):
+        """
+        Whether the package is installed
+        """
+        return package_name in self.ri_package_dict
+
+    def ri_grep(self, keyword):
+        """
+        Return the full names of the RPMs that contain the keyword, same as
+        "rpm -qa | grep $keyword" with a fixed string.
+        """
+        return [rpm_name for rpm_name in self.ri_rpm_names
+                if keyword in rpm_name]
+
+
 def sh_escape(command):
     """
     Escape special characters from a command so that it can be passed
@@ -191,6 +241,9 @@ class SSHHost():
         self.sh_login_name = login_name
         # The hostname got from "hostname" commnad
         self.sh_real_hostname = None
+        # The cached RPMInventory, None if not got yet or the installed
+        # RPMs might have been changed
+        self.sh_cached_rpm_inventory = None
 
     def sh_is_up(self, log, timeout=60):
         """
@@ -929,6 +982,7 @@ class SSHHost():
         if not silent:
             log.cl_debug("starting command [%s] on host [%s]", command,
                          self.sh_hostname)
+        start_time = time.time()
         if self.sh_inited_as_local and not self.sh_ssh_for_local:
             ret = utils.run(command, timeout=timeout, stdout_tee=stdout_tee,
                             stderr_tee=stderr_tee, stdin=stdin,
@@ -943,12 +997,18 @@ class SSHHost():
                           return_stderr=return_stderr, quit_func=quit_func,
                           identity_file=self.sh_identity_file,
                           flush_tee=flush_tee)
-        if not silent:
+        event_log.record_command(self.sh_hostname, command,
+                                 time.time() - start_time,
+                                 ret.cr_exit_status, ret.cr_stdout,
+                                 ret.cr_stderr)
+        if not silent and log.cl_is_enabled_for(logging.DEBUG):
             log.cl_debug("ran [%s] on host [%s], ret = [%d], stdout = [%s], "
                          "stderr = [%s]",
                          command, self.sh_hostname, ret.cr_exit_status,
-                         ret.cr_stdout,
-                         ret.cr_stderr)
+                         clog.truncate_output(ret.cr_stdout),
+                         clog.truncate_output(ret.cr_stderr))
+        if RPM_CHANGE_COMMAND_PATTERN.search(command):
+            self.sh_cached_rpm_inventory = None
         if not checking_hostname and self.sh_real_hostname is None:
             retval = self.sh_run(log, "hostname", checking_hostname=True)
             if retval.cr_exit_status == 0:
@@ -3803,15 +3863,21 @@ class SSHHost():
             return -1
         return 0
 
-    def sh_sync_two_dirs(self, log, src, dest_parent):
+    def sh_sync_two_dirs(self, log, src, dest_parent, excludes=None):
         """
         Sync a dir to another dir. dest_parent is the target parent dir. And
-        the dir with the same name under that parent will be removed.
+        the dir with the same name under that parent will be removed. The
+        files matching the patterns in excludes are neither synced nor
+        removed.
         """
         # Stripe / otherwise it will has different meaning
         dest_parent = dest_parent.rstrip("/")
-        command = ("rsync --delete --sparse -azv %s %s" %
-                   (src, dest_parent))
+        exclude_string = ""
+        if excludes is not None:
+            for exclude in excludes:
+                exclude_string += " --exclude '%s'" % exclude
+        command = ("rsync --delete --sparse -azv%s %s %s" %
+                   (exclude_string, src, dest_parent))
         retval = self.sh_run(log, command)
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s], "
@@ -3824,6 +3890,39 @@ class SSHHost():
             return -1
         return 0
 
+    def sh_rpm_inventory(self, log):
+        """
+        Return the RPMInventory of the installed RPMs, None on error. The
+        inventory is cached until a command that might change the installed
+        RPMs is run on the host.
+        """
+        if self.sh_cached_rpm_inventory is not None:
+            return self.sh_cached_rpm_inventory
+        command = "rpm -qa --queryformat '%s'" % RPM_INVENTORY_QUERY_FORMAT
+        retval = self.sh_run(log, command, silent=True)
+        if retval.cr_exit_status:
+            log.cl_error("failed to run command [%s] on host [%s], "
+                         "ret = [%d], stdout = [%s], stderr = [%s]",
+                         command,
+                         self.sh_hostname,
+                         retval.cr_exit_status,
+                         retval.cr_stdout,
+                         retval.cr_stderr)
+            return None
+        self.sh_cached_rpm_inventory = \
+            RPMInventory(retval.cr_stdout.splitlines())
+        return self.sh_cached_rpm_inventory
+
+    def sh_rpm_grep(self, log, rpm_keyword):
+        """
+        Return the full names of the installed RPMs that contain the
+        keyword, None on error.
+        """
+        inventory = self.sh_rpm_inventory(log)
+        if inventory is None:
+            return None
+        return inventory.ri_grep(rpm_keyword)
+
     def sh_rpm_version(self, log, rpm_keyword):
         """
         Return the RPM version. The rpm_keyword will be used to filter the
@@ -3837,29 +3936,13 @@ class SSHHost():
         kmod-lustre-client-2.12.6_874_g59b0328-1.el7.x86_64
         lustre-client-2.12.6_874_g59b0328-1.el7.x86_64
         """
-        command = "rpm -qa | grep %s" % rpm_keyword
-        retval = self.sh_run(log, command)
-        if retval.cr_exit_status == 1 and retval.cr_stdout == "":
-            return 0, None
-        if retval.cr_exit_status:
-            log.cl_error("failed to run command [%s] on host [%s], "
-                         "ret = [%d], stdout = [%s], stderr = [%s]",
-                         command,
-                         self.sh_hostname,
-                         retval.cr_exit_status,
-                         retval.cr_stdout,
-                         retval.cr_stderr)
+        rpm_names = self.sh_rpm_grep(log, rpm_keyword)
+        if rpm_names is None:
+            log.cl_error("failed to get the installed RPMs on host [%s]",
+                         self.sh_hostname)
             return -1, None
-        rpm_names = retval.cr_stdout.splitlines()
         if len(rpm_names) == 0:
-            log.cl_error("unexpected stdout of command [%s] on host [%s], "
-                         "ret = [%d], stdout = [%s], stderr = [%s]",
-                         command,
-                         self.sh_hostname,
-                         retval.cr_exit_status,
-                         retval.cr_stdout,
-                         retval.cr_stderr)
-            return -1, None
+            return 0, None
         version = None
         for rpm_name in rpm_names:
             rpm_version = rpm_name2version(log, rpm_name)
@@ -4608,16 +4691,127 @@ def check_clock_diff(log, host0, host1, max_diff=60):
     return 0
 
 
+def run_on_hosts(log, hosts, command, parallelism=RUN_ON_HOSTS_PARALLELISM,
+                 timeout=LONGEST_SIMPLE_COMMAND_TIME):
+    """
+    Run the command on the hosts in parallel. Yield (host, CommandResult)
+    as soon as the command finishes on each host. The timeout is the
+    deadline of the whole run rather than of a single host. The hosts
+    that could not start the command before the deadline get a result
+    with cr_timeout set.
+    """
+    deadline = time.time() + timeout
+
+    def run_on_host(host):
+        """
+        Run the command on a host
+        """
+        # pylint: disable=bare-except
+        time_left = deadline - time.time()
+        if time_left <= 0:
+            retval = utils.CommandResult(stderr="deadline passed before "
+                                         "running the command",
+                                         exit_status=-1)
+            retval.cr_timeout = True
+            return retval
+        try:
+            return host.sh_run(log, command, timeout=time_left)
+        except:
+            return utils.CommandResult(stderr=traceback.format_exc(),
+                                       exit_status=-1)
+
+    if len(hosts) == 0:
+        return
+    max_workers = max(1, min(parallelism, len(hosts)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_dict = {}
+        for host in hosts:
+            future_dict[executor.submit(run_on_host, host)] = host
+        for future in concurrent.futures.as_completed(future_dict):
+            yield future_dict[future], future.result()
+
+
+def group_host_results(host_results):
+    """
+    Group the list of (host, CommandResult) by identical exit status,
+    stdout and stderr. Return a list of (hostnames, CommandResult), the
+    largest group first.
+    """
+    group_dict = {}
+    for host, retval in host_results:
+        key = (retval.cr_exit_status, retval.cr_timeout, retval.cr_stdout,
+               retval.cr_stderr)
+        if key not in group_dict:
+            group_dict[key] = ([], retval)
+        group_dict[key][0].append(host.sh_hostname)
+    groups = list(group_dict.values())
+    for hostnames, _ in groups:
+        hostnames.sort()
+    groups.sort(key=lambda group: len(group[0]), reverse=True)
+    return groups
+
+
+def log_host_results(log, command, host_results, quiet=False):
+    """
+    Print the grouped results of running a command on hosts. If quiet,
+    only print the failed groups.
+    """
+    for hostnames, retval in group_host_results(host_results):
+        if retval.cr_exit_status == 0:
+            if quiet:
+                continue
+            log_funct = log.cl_info
+        else:
+            log_funct = log.cl_error
+        log_funct("command [%s] on [%d] hosts [%s], ret = [%d], "
+                  "timeout = [%s], stdout = [%s], stderr = [%s]",
+                  command, len(hostnames), ",".join(hostnames),
+                  retval.cr_exit_status, retval.cr_timeout,
+                  retval.cr_stdout, retval.cr_stderr)
+
+
 def check_clocks_diff(log, hosts, max_diff=60):
     """
     Return -1 if the clocks of the hosts differ a lot.
     """
     if len(hosts) < 2:
         return 0
+    command = "date +%s"
+    # The offset of the remote clock to the local clock when the command
+    # finishes. Comparing the offsets is not affected by the order in
+    # which the hosts run the command.
+    offset_dict = {}
+    rc = 0
+    for host, retval in run_on_hosts(log, hosts, command):
+        finish_time = time.time()
+        if retval.cr_exit_status:
+            log.cl_error("failed to run command [%s] on host [%s], "
+                         "ret = [%d], stdout = [%s], stderr = [%s]",
+                         command,
+                         host.sh_hostname,
+                         retval.cr_exit_status,
+                         retval.cr_stdout,
+                         retval.cr_stderr)
+            rc = -1
+            continue
+        try:
+            seconds = int(retval.cr_stdout.strip())
+        except ValueError:
+            log.cl_error("unexpected output of command [%s] on host [%s], "
+                         "stdout = [%s]", command, host.sh_hostname,
+                         retval.cr_stdout)
+            rc = -1
+            continue
+        offset_dict[host.sh_hostname] = seconds - finish_time
+    if rc:
+        log.cl_error("failed to get epoch seconds of hosts")
+        return -1
+
     host = hosts[0]
+    offset = offset_dict[host.sh_hostname]
     for compare_host in hosts[1:]:
-        ret = check_clock_diff(log, compare_host, host, max_diff=max_diff)
-        if ret:
+        compare_offset = offset_dict[compare_host.sh_hostname]
+        if abs(compare_offset - offset) > max_diff:
             log.cl_error("clocks of host [%s] and [%s] differ a lot",
                          host.sh_hostname,
                          compare_host.sh_hostname)
@@ -0,0 +1,293 @@
+"""
+Library for recording the timeline of the stages of a long process,
+e.g. the installation of a cluster.
+
+DO NOT import any library that needs extra python package,
+since this might cause failure of commands that uses this
+library to install python packages.
+"""
+import json
+import threading
+import time
+import traceback
+from pycoral import event_log
+
+# Status of a stage that has not finished yet
+STAGE_STATUS_RUNNING = "running"
+# Status of a stage that succeeded
+STAGE_STATUS_SUCCEEDED = "succeeded"
+# Status of a stage that failed
+STAGE_STATUS_FAILED = "failed"
+# The number of the slowest hosts to print in the report
+STAGE_SLOWEST_HOST_NUMBER = 10
+
+
+class StageRecord():
+    """
+    The record of a stage. If the stage is for a specific host, the
+    hostname is not None.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, stage, hostname=None):
+        # Name of the stage
+        self.sr_stage = stage
+        # Hostname that the stage runs on, None if the stage is cluster wide
+        self.sr_hostname = hostname
+        # The time when the stage starts
+        self.sr_start_time = time.time()
+        # The time when the stage finishes, None if not finished yet
+        self.sr_end_time = None
+        # Status of the stage
+        self.sr_status = STAGE_STATUS_RUNNING
+
+    def sr_end(self, now):
+        """
+        Return the end time. If not finished, return now.
+        """
+        if self.sr_end_time is None:
+            return now
+        return self.sr_end_time
+
+    def sr_duration(self, now):
+        """
+        Return the duration of the stage in seconds.
+        """
+        return self.sr_end(now) - self.sr_start_time
+
+    def sr_contains(self, record, now):
+        """
+        Return True if the other record runs within this record.
+        """
+        if record is self:
+            return False
+        return (self.sr_start_time <= record.sr_start_time and
+                record.sr_end(now) <= self.sr_end(now))
+
+    def sr_encode(self, base_time, now):
+        """
+        Return the diction that can be dumped to JSON.
+        """
+        return {"stage": self.sr_stage,
+                "hostname": self.sr_hostname,
+                "start": self.sr_start_time - base_time,
+                "end": self.sr_end(now) - base_time,
+                "duration": self.sr_duration(now),
+                "status": self.sr_status}
+
+
+class StageTimeline():
+    """
+    The timeline of the stages. The stages could be recorded from multiple
+    threads.
+    """
+    def __init__(self):
+        # The lock to protect stl_records
+        self.stl_lock = threading.Lock()
+        # A list of StageRecord in the order of start time
+        self.stl_records = []
+
+    def stl_start(self, stage, hostname=None):
+        """
+        Start a stage, return the StageRecord.
+        """
+        record = StageRecord(stage, hostname=hostname)
+        with self.stl_lock:
+            self.stl_records.append(record)
+        event_log.stage_enter(stage)
+        return record
+
+    def stl_finish(self, record, ret):
+        """
+        Finish a stage. The ret is the return value of the stage, 0 means
+        success.
+        """
+        record.sr_end_time = time.time()
+        if ret:
+            record.sr_status = STAGE_STATUS_FAILED
+        else:
+            record.sr_status = STAGE_STATUS_SUCCEEDED
+        event_log.stage_exit(record.sr_stage)
+        event_log.record_event(event_log.EVENT_TYPE_STAGE,
+                               stage=record.sr_stage,
+                               host=record.sr_hostname,
+                               duration=record.sr_duration(record.sr_end_time),
+                               status=record.sr_status)
+
+    def stl_run(self, log, stage, funct, *args, hostname=None, **kwargs):
+        """
+        Run the function as a stage. The function should return 0 on
+        success, return negative value on failure.
+        """
+        record = self.stl_start(stage, hostname=hostname)
+        ret = -1
+        try:
+            ret = funct(log, *args, **kwargs)
+        finally:
+            # Finish the record as failed if the function raises
+            self.stl_finish(record, ret)
+        return ret
+
+    def _stl_records(self):
+        """
+        Return a copy of the records.
+        """
+        with self.stl_lock:
+            return self.stl_records[:]
+
+    def stl_dump(self, log, fpath):
+        """
+        Dump the timeline to a JSON file.
+        """
+        # pylint: disable=bare-except
+        records = self._stl_records()
+        now = time.time()
+        if len(records) == 0:
+            base_time = now
+        else:
+            base_time = records[0].sr_start_time
+        timeline = {"start_time": base_time,
+                    "stages": [record.sr_encode(base_time, now)
+                               for record in records]}
+        try:
+            with open(fpath, "w", encoding="utf-8") as json_file:
+                json.dump(timeline, json_file, indent=4)
+        except:
+            log.cl_error("failed to dump timeline to file [%s]: %s",
+                         fpath, traceback.format_exc())
+            return -1
+        return 0
+
+    def stl_report(self, log):
+        """
+        Print the critical path and the slowest hosts.
+        """
+        records = self._stl_records()
+        if len(records) == 0:
+            return
+        now = time.time()
+        base_time = records[0].sr_start_time
+        end_time = max(record.sr_end(now) for record in records)
+        total = end_time - base_time
+        cluster_records = [record for record in records
+                           if record.sr_hostname is None]
+        host_records = [record for record in records
+                        if record.sr_hostname is not None]
+
+        log.cl_info("the stages took [%.1f] seconds in total", total)
+        report_critical_path(log, cluster_records, host_records, total, now)
+        report_slow_hosts(log, host_records, now)
+
+
+def critical_host_record(record, children, host_records, now):
+    """
+    Return the host stage that the cluster-wide stage is waiting for, i.e.
+    the one that finishes last and is not nested in the children of the
+    cluster-wide stage. Return None if no such host stage.
+    """
+    critical_host = None
+    for host_record in host_records:
+        if not record.sr_contains(host_record, now):
+            continue
+        nested = False
+        for child in children:
+            if child.sr_contains(host_record, now):
+                nested = True
+                break
+        if nested:
+            continue
+        if (critical_host is None or
+                host_record.sr_end(now) > critical_host.sr_end(now)):
+            critical_host = host_record
+    return critical_host
+
+
+def report_critical_path(log, cluster_records, host_records, total, now):
+    """
+    Print the critical path. The cluster-wide stages run one by one, so
+    they are all on the critical path. The nested stages are indented.
+    """
+    for record in cluster_records:
+        parents = [other for other in cluster_records
+                   if other.sr_contains(record, now)]
+        children = [other for other in cluster_records
+                    if record.sr_contains(other, now)]
+        duration = record.sr_duration(now)
+        if total > 0:
+            percent = duration * 100 / total
+        else:
+            percent = 0
+        log.cl_info("critical path: %sstage [%s] took [%.1f] seconds "
+                    "(%.1f%%), status [%s]", "    " * len(parents),
+                    record.sr_stage, duration, percent,
+                    record.sr_status)
+        critical_host = critical_host_record(record, children, host_records,
+                                             now)
+        if critical_host is None:
+            continue
+        log.cl_info("critical path: %swaiting for stage [%s] on host "
+                    "[%s] which took [%.1f] seconds",
+                    "    " * (len(parents) + 1),
+                    critical_host.sr_stage, critical_host.sr_hostname,
+                    critical_host.sr_duration(now))
+
+
+def host_durations(host_records, now):
+    """
+    Return a dict with hostname as key and the seconds spent on the host
+    as value. Only the outermost stages of each host are counted to avoid
+    counting the nested stages twice.
+    """
+    durations = {}
+    for host_record in host_records:
+        outermost = True
+        for other in host_records:
+            if (other.sr_hostname == host_record.sr_hostname and
+                    other.sr_contains(host_record, now)):
+                outermost = False
+                break
+        if not outermost:
+            continue
+        hostname = host_record.sr_hostname
+        if hostname not in durations:
+            durations[hostname] = 0
+        durations[hostname] += host_record.sr_duration(now)
+    return durations
+
+
+def slowest_leaf_record(hostname, host_records, now):
+    """
+    Return the slowest stage of the host that does not contain any other
+    stage.
+    """
+    slowest_record = None
+    for host_record in host_records:
+        if host_record.sr_hostname != hostname:
+            continue
+        leaf = True
+        for other in host_records:
+            if (other.sr_hostname == hostname and
+                    host_record.sr_contains(other, now)):
+                leaf = False
+                break
+        if not leaf:
+            continue
+        if (slowest_record is None or
+                host_record.sr_duration(now) >
+                slowest_record.sr_duration(now)):
+            slowest_record = host_record
+    return slowest_record
+
+
+def report_slow_hosts(log, host_records, now):
+    """
+    Print the slowest hosts and their slowest stages.
+    """
+    durations = host_durations(host_records, now)
+    slowest_hosts = sorted(durations.items(),
+                           key=lambda item: item[1], reverse=True)
+    for hostname, duration in slowest_hosts[:STAGE_SLOWEST_HOST_NUMBER]:
+        slowest_record = slowest_leaf_record(hostname, host_records, now)
+        log.cl_info("slow host: host [%s] spent [%.1f] seconds, the "
+                    "slowest stage is [%s] which took [%.1f] seconds",
+                    hostname, duration, slowest_record.sr_stage,
+                    slowest_record.sr_duration(now))